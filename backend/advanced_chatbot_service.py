@@ -3,22 +3,28 @@ Sistema Avanzado de Chatbot Terapéutico con LLM
 Combina Rasa para clasificación + LLM para generación de respuestas naturales
 """
 
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
 import json
 import os
-from transformers import pipeline
+import threading
 import anthropic
 from openai import OpenAI
 from mongodb_config import mongodb_service
+from conversation_context_cache import context_cache
 from nlp_service import nlp_service
+from analysis_cache import AnalysisCache
+from llm_streaming import anthropic_text, openai_deltas, fake_stream, timed_stream
+from inference_backend import resolve_backend
+from model_registry import model_registry
+from lexicon import ADVANCED_LEXICON, LexiconResult
 
 # ============================================
 # CONFIGURACIÓN
 # ============================================
 
 # Elegir proveedor de LLM (claude, openai, o fallback)
-LLM_PROVIDER = os.getenv("LLM_PROVIDER", "fallback")  # claude, openai, fallback
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "fallback")  # claude, openai, fake, fallback
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
@@ -35,22 +41,70 @@ class AdvancedEmotionAnalyzer:
     """Análisis emocional más profundo con múltiples dimensiones"""
     
     def __init__(self):
-        # Modelo de emociones en español (BETO)
-        self.emotion_classifier = pipeline(
-            "text-classification",
-            model="finiteautomata/beto-emotion-analysis",
-            top_k=None
-        )
+        self.backend = resolve_backend()
+        
+        # Los modelos se cargan en el primer análisis, no al importar
+        self._emotion_classifier = None
+        self._sentiment_analyzer = None
+        self._load_lock = threading.Lock()
         
-        # Modelo de sentimientos
-        self.sentiment_analyzer = pipeline(
-            "sentiment-analysis",
-            model="pysentimiento/robertuito-sentiment-analysis"
+        # Caché de resultados por texto normalizado
+        self.cache = AnalysisCache(
+            namespace="advanced_analyzer",
+            model_version=f"{self.backend}:finiteautomata/beto-emotion-analysis|pysentimiento/robertuito-sentiment-analysis"
         )
     
+    @property
+    def emotion_classifier(self):
+        self._ensure_loaded()
+        return self._emotion_classifier
+    
+    @property
+    def sentiment_analyzer(self):
+        self._ensure_loaded()
+        return self._sentiment_analyzer
+    
+    def load(self):
+        """Carga los modelos sin ejecutar inferencia (usado antes del fork en gunicorn)"""
+        self._ensure_loaded()
+    
+    def _ensure_loaded(self):
+        if self._emotion_classifier is not None and self._sentiment_analyzer is not None:
+            return
+        
+        # El registro comparte robertuito-sentiment con nlp_service
+        with self._load_lock:
+            # Modelo de emociones en español (BETO)
+            if self._emotion_classifier is None:
+                self._emotion_classifier = model_registry.get_pipeline(
+                    "text-classification",
+                    "finiteautomata/beto-emotion-analysis",
+                    backend=self.backend,
+                    top_k=None
+                )
+            
+            # Modelo de sentimientos
+            if self._sentiment_analyzer is None:
+                self._sentiment_analyzer = model_registry.get_pipeline(
+                    "sentiment-analysis",
+                    "pysentimiento/robertuito-sentiment-analysis",
+                    backend=self.backend
+                )
+    
     def analyze(self, text: str) -> Dict:
         """Análisis emocional completo"""
         
+        cached = self.cache.get(text)
+        if cached is not None:
+            return cached
+        
+        analysis = self._analyze_uncached(text)
+        self.cache.set(text, analysis)
+        return analysis
+    
+    def _analyze_uncached(self, text: str) -> Dict:
+        """Ejecuta ambos modelos y las reglas de riesgo/necesidades"""
+        
         # Análisis de emociones
         emotions_result = self.emotion_classifier(text)[0]
         emotions_dict = {item['label']: item['score'] for item in emotions_result}
@@ -70,11 +124,14 @@ class AdvancedEmotionAnalyzer:
             'others': 'neutral'
         }
         
+        # Léxicos: una sola pasada sobre el texto para riesgo y necesidades
+        lexicon_hits = ADVANCED_LEXICON.scan(text)
+        
         # Evaluación de riesgo
-        risk_score = self._calculate_risk(text, emotions_dict, sentiment_result)
+        risk_score = self._calculate_risk(lexicon_hits, emotions_dict, sentiment_result)
         
         # Detección de necesidades terapéuticas
-        therapeutic_needs = self._detect_therapeutic_needs(text, emotions_dict)
+        therapeutic_needs = self._detect_therapeutic_needs(lexicon_hits, emotions_dict)
         
         return {
             'dominant_emotion': emotion_map.get(dominant_emotion['label'], 'neutral'),
@@ -93,20 +150,12 @@ class AdvancedEmotionAnalyzer:
             'intensity': self._calculate_intensity(emotions_dict)
         }
     
-    def _calculate_risk(self, text: str, emotions: Dict, sentiment: Dict) -> float:
+    def _calculate_risk(self, lexicon_hits: LexiconResult, emotions: Dict, sentiment: Dict) -> float:
         """Calcula score de riesgo basado en múltiples factores"""
         risk_score = 0.0
         
         # Palabras de crisis
-        crisis_keywords = [
-            'suicidio', 'matarme', 'acabar con todo', 'no quiero vivir',
-            'hacerme daño', 'terminar con mi vida', 'morir', 'muerte',
-            'no aguanto más', 'ya no puedo', 'sin salida', 'desesperado'
-        ]
-        
-        text_lower = text.lower()
-        crisis_matches = sum(1 for keyword in crisis_keywords if keyword in text_lower)
-        risk_score += min(crisis_matches * 0.3, 0.6)
+        risk_score += min(lexicon_hits.count('crisis') * 0.3, 0.6)
         
         # Emociones negativas intensas
         if emotions.get('sadness', 0) > 0.7:
@@ -121,11 +170,7 @@ class AdvancedEmotionAnalyzer:
             risk_score += 0.20
         
         # Frases de desesperanza
-        hopelessness_phrases = [
-            'no tiene sentido', 'nada importa', 'todo está perdido',
-            'no hay esperanza', 'nunca mejorará', 'siempre será así'
-        ]
-        if any(phrase in text_lower for phrase in hopelessness_phrases):
+        if lexicon_hits.has('desesperanza'):
             risk_score += 0.25
         
         return min(risk_score, 1.0)
@@ -147,34 +192,28 @@ class AdvancedEmotionAnalyzer:
         
         return round(intensity, 1)
     
-    def _detect_therapeutic_needs(self, text: str, emotions: Dict) -> List[str]:
+    def _detect_therapeutic_needs(self, lexicon_hits: LexiconResult, emotions: Dict) -> List[str]:
         """Detecta necesidades terapéuticas específicas"""
         needs = []
         
-        text_lower = text.lower()
-        
         # Regulación emocional
         if emotions.get('anger', 0) > 0.6 or emotions.get('fear', 0) > 0.6:
             needs.append('regulacion_emocional')
         
         # Manejo de ansiedad
-        anxiety_keywords = ['ansiedad', 'ansioso', 'nervioso', 'preocupado', 'agobiado']
-        if any(keyword in text_lower for keyword in anxiety_keywords):
+        if lexicon_hits.has('ansiedad'):
             needs.append('manejo_ansiedad')
         
         # Procesamiento del duelo
-        grief_keywords = ['perdí', 'falleció', 'murió', 'extraño', 'duelo', 'luto']
-        if any(keyword in text_lower for keyword in grief_keywords):
+        if lexicon_hits.has('duelo'):
             needs.append('procesamiento_duelo')
         
         # Habilidades sociales
-        social_keywords = ['solo', 'aislado', 'nadie me entiende', 'sin amigos']
-        if any(keyword in text_lower for keyword in social_keywords):
+        if lexicon_hits.has('social'):
             needs.append('habilidades_sociales')
         
         # Autoestima
-        self_esteem_keywords = ['inútil', 'fracaso', 'no sirvo', 'no valgo', 'incapaz']
-        if any(keyword in text_lower for keyword in self_esteem_keywords):
+        if lexicon_hits.has('autoestima'):
             needs.append('trabajo_autoestima')
         
         # Técnicas de afrontamiento
@@ -193,18 +232,18 @@ class ConversationMemory:
     
     def __init__(self):
         self.mongo = mongodb_service
+        self.cache = context_cache
     
-    def get_conversation_context(self, user_id: int, messages_limit: int = 10) -> Dict:
-        """Obtiene el contexto completo de la conversación"""
-        
-        # Últimos mensajes
-        recent_messages = self.mongo.get_conversation_context(user_id, messages_limit)
-        
-        # Patrones emocionales recientes (últimos 7 días)
-        emotional_patterns = self.mongo.get_emotional_patterns(user_id, days=7)
+    def get_conversation_context(self, user_id: int) -> Dict:
+        """
+        Obtiene el contexto completo de la conversación: últimos mensajes,
+        patrones de 7 días y entradas de alto riesgo (ver conversation_context_cache)
+        """
         
-        # Entradas de alto riesgo recientes
-        high_risk_entries = self.mongo.get_high_risk_entries(user_id, days=7)
+        contexto = self.cache.get(self.mongo.db, user_id)
+        recent_messages = contexto['recent_messages']
+        emotional_patterns = contexto['emotional_patterns']
+        high_risk_entries = contexto['high_risk_entries']
         
         # Resumen del perfil emocional
         emotional_profile = self._build_emotional_profile(emotional_patterns)
@@ -245,10 +284,13 @@ class ConversationMemory:
     
     def save_interaction(self, user_id: int, user_message: str, 
                         bot_response: str, analysis: Dict):
-        """Guarda la interacción en MongoDB"""
+        """
+        Guarda la interacción en MongoDB (escritura diferida, no bloquea la respuesta)
+        y aplica los mismos documentos al contexto en caché
+        """
         
         # Guardar mensaje del usuario
-        self.mongo.save_chat_message(
+        mensaje_usuario = self.mongo.queue_chat_message(
             user_id=user_id,
             message=user_message,
             is_bot=False,
@@ -258,7 +300,7 @@ class ConversationMemory:
         )
         
         # Guardar respuesta del bot
-        self.mongo.save_chat_message(
+        mensaje_bot = self.mongo.queue_chat_message(
             user_id=user_id,
             message=bot_response,
             is_bot=True,
@@ -268,12 +310,14 @@ class ConversationMemory:
         )
         
         # Guardar análisis emocional completo
-        self.mongo.save_emotional_text(
+        texto_emocional = self.mongo.queue_emotional_text(
             user_id=user_id,
             text=user_message,
             emotional_analysis=analysis,
             source='advanced_chat'
         )
+        
+        self.cache.record_interaction(user_id, [mensaje_usuario, mensaje_bot], texto_emocional)
 
 
 # ============================================
@@ -299,9 +343,41 @@ class TherapeuticLLM:
             return self._generate_with_claude(prompt, analysis)
         elif self.provider == "openai" and openai_client:
             return self._generate_with_openai(prompt, analysis)
+        elif self.provider == "fake":
+            return "".join(fake_stream()).strip()
         else:
             return self._generate_fallback(user_message, analysis)
     
+    def stream_response(self, user_message: str, context: Dict,
+                        analysis: Dict) -> Iterator[str]:
+        """
+        Igual que generate_response pero devuelve los fragmentos según llegan.
+        Si el proveedor falla antes del primer fragmento se emite el fallback;
+        si falla a mitad se corta ahí (el cliente ya recibió texto parcial).
+        """
+        
+        prompt = self._build_therapeutic_prompt(user_message, context, analysis)
+        
+        if self.provider == "claude" and anthropic_client:
+            chunks = timed_stream("claude", self._stream_with_claude(prompt))
+        elif self.provider == "openai" and openai_client:
+            chunks = timed_stream("openai", self._stream_with_openai(prompt))
+        elif self.provider == "fake":
+            chunks = timed_stream("fake", fake_stream())
+        else:
+            yield self._generate_fallback(user_message, analysis)
+            return
+        
+        emitido = False
+        try:
+            for chunk in chunks:
+                emitido = True
+                yield chunk
+        except Exception as e:
+            print(f"❌ Error en streaming con {self.provider}: {e}")
+            if not emitido:
+                yield self._generate_fallback(user_message, analysis)
+    
     def _build_therapeutic_prompt(self, message: str, context: Dict, 
                                   analysis: Dict) -> str:
         """Construye el prompt para el LLM con contexto terapéutico"""
@@ -380,6 +456,30 @@ RESPONDE DE FORMA NATURAL, EMPÁTICA Y TERAPÉUTICAMENTE ÚTIL:"""
             print(f"❌ Error con OpenAI: {e}")
             return self._generate_fallback("", analysis)
     
+    def _stream_with_claude(self, prompt: str) -> Iterator[str]:
+        """Stream de Claude; la petición sale al pedir el primer fragmento"""
+        yield from anthropic_text(anthropic_client.messages.stream(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=300,
+            temperature=0.7,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        ))
+    
+    def _stream_with_openai(self, prompt: str) -> Iterator[str]:
+        """Stream de GPT; la petición sale al pedir el primer fragmento"""
+        yield from openai_deltas(openai_client.chat.completions.create(
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": "Eres un asistente terapéutico empático y profesional."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=300,
+            temperature=0.7,
+            stream=True
+        ))
+    
     def _generate_fallback(self, message: str, analysis: Dict) -> str:
         """Sistema de respuestas de fallback basado en reglas"""
         
@@ -503,6 +603,35 @@ class AdvancedChatbotService:
             analysis=emotional_analysis
         )
         
+        return self._finish_interaction(user_id, message, response, emotional_analysis)
+    
+    def process_message_stream(self, user_id: int, message: str) -> Iterator[Dict]:
+        """
+        Como process_message pero con la respuesta en streaming: emite
+        {'type': 'delta', 'text': ...} por cada fragmento del LLM y al final
+        {'type': 'final', ...} con el mismo contenido que process_message.
+        La interacción se guarda cuando la respuesta está completa.
+        """
+        
+        emotional_analysis = self.emotion_analyzer.analyze(message)
+        conversation_context = self.memory.get_conversation_context(user_id)
+        
+        partes = []
+        for fragmento in self.llm.stream_response(
+            user_message=message,
+            context=conversation_context,
+            analysis=emotional_analysis
+        ):
+            partes.append(fragmento)
+            yield {'type': 'delta', 'text': fragmento}
+        
+        response = "".join(partes).strip()
+        yield {'type': 'final', **self._finish_interaction(user_id, message, response, emotional_analysis)}
+    
+    def _finish_interaction(self, user_id: int, message: str, response: str,
+                            emotional_analysis: Dict) -> Dict:
+        """Guarda la interacción, alerta si hace falta y arma el resultado"""
+        
         # 4. Guardar interacción
         self.memory.save_interaction(
             user_id=user_id,
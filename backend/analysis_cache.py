@@ -0,0 +1,226 @@
+# backend/analysis_cache.py
+# ✅ CACHÉ DE RESULTADOS DE ANÁLISIS EMOCIONAL
+# Clave = hash(texto normalizado + versión del modelo)
+# LRU por número de entradas y por memoria, con TTL y contadores hit/miss
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# Configuración
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "3600"))
+# "memory" (solo este worker) o "mongo" (compartido entre workers de uvicorn)
+ANALYSIS_CACHE_BACKEND = os.getenv("ANALYSIS_CACHE_BACKEND", "memory")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza el texto para que variaciones triviales compartan entrada"""
+    text = unicodedata.normalize("NFC", text or "")
+    return _WHITESPACE.sub(" ", text.strip().lower())
+
+
+def cache_key(text: str, model_version: str) -> str:
+    """Hash del texto normalizado + versión del modelo"""
+    payload = f"{model_version}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class MongoCacheBackend:
+    """
+    Backend compartido sobre la colección `analysis_cache`.
+    La expiración la aplica el índice TTL sobre `expires_at`.
+    """
+
+    def __init__(self, collection_name: str = "analysis_cache"):
+        self.collection_name = collection_name
+        if collection_name != "analysis_cache":
+            # analysis_cache ya tiene su índice TTL en mongo_indexes.INDEX_SPEC
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    @property
+    def collection(self):
+        # Se resuelve en cada uso: tras un fork mongodb_service cambia de cliente
+        from mongodb_config import mongodb_service
+        return mongodb_service.db[self.collection_name]
+
+    def get(self, key: str) -> Optional[str]:
+        doc = self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.utcnow()}},
+            {"value": 1}
+        )
+        return doc["value"] if doc else None
+
+    def set(self, key: str, value: str, ttl: int):
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+
+
+class AnalysisCache:
+    """
+    Caché LRU en proceso con TTL.
+    Los valores se guardan serializados en JSON: así el tamaño en memoria es
+    medible y cada lectura devuelve una copia que el llamador puede modificar.
+    """
+
+    def __init__(self,
+                 namespace: str,
+                 model_version: str,
+                 max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES,
+                 max_bytes: int = ANALYSIS_CACHE_MAX_BYTES,
+                 ttl_seconds: int = ANALYSIS_CACHE_TTL_SECONDS,
+                 backend: Optional[str] = ANALYSIS_CACHE_BACKEND,
+                 enabled: bool = ANALYSIS_CACHE_ENABLED):
+        self.namespace = namespace
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._shared = None
+        if enabled and backend == "mongo":
+            try:
+                self._shared = MongoCacheBackend()
+            except Exception as e:
+                print(f"⚠️ Caché compartida no disponible, usando solo memoria: {e}")
+
+        # Contadores
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        _caches.append(self)
+
+    def _key(self, text: str) -> str:
+        return cache_key(text, f"{self.namespace}:{self.model_version}")
+
+    def get(self, text: str, local_only: bool = False) -> Optional[Dict]:
+        """
+        Busca en memoria y, si hay, en la caché compartida.
+        local_only=True no consulta la compartida (no hace I/O: apto para el event loop);
+        un fallo local en ese modo no cuenta como miss.
+        """
+        if not self.enabled:
+            return None
+
+        key = self._key(text)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+                self._remove(key)
+                self.expirations += 1
+
+        if local_only:
+            return None
+
+        if self._shared is not None:
+            try:
+                value = self._shared.get(key)
+            except Exception as e:
+                print(f"⚠️ Error leyendo caché compartida: {e}")
+                value = None
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return json.loads(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, text: str, analysis: Dict):
+        if not self.enabled:
+            return
+
+        key = self._key(text)
+        value = json.dumps(analysis, ensure_ascii=False, default=str)
+        self._store(key, value)
+
+        if self._shared is not None:
+            try:
+                self._shared.set(key, value, self.ttl_seconds)
+            except Exception as e:
+                print(f"⚠️ Error escribiendo caché compartida: {e}")
+
+    def _store(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "namespace": self.namespace,
+                "model_version": self.model_version,
+                "enabled": self.enabled,
+                "shared_backend": self._shared is not None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 3) if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+# Registro de cachés creadas en este proceso (para /metrics)
+_caches: List[AnalysisCache] = []
+
+
+def all_cache_stats() -> List[Dict]:
+    return [cache.stats() for cache in _caches]
@@ -0,0 +1,196 @@
+# backend/benchmark_patrones_emocionales.py
+# ✅ BENCHMARK: PATRONES EMOCIONALES EN PYTHON vs. AGREGACIÓN EN MONGODB
+# Siembra N documentos de emotional_texts para un usuario en una base de datos
+# aparte y compara, con el mismo resultado:
+#   - bucle:    find() de toda la ventana y conteo en Python (implementación anterior)
+#   - pipeline: mongo_pipelines.emotional_patterns_pipeline ($match -> $facet)
+# También mide get_high_risk_entries y get_user_engagement_stats.
+#
+# Uso:
+#   python benchmark_patrones_emocionales.py                    # 10k y 100k
+#   python benchmark_patrones_emocionales.py --sizes 5000 --runs 10
+#   python benchmark_patrones_emocionales.py --keep             # no borrar la base al terminar
+
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from pymongo import MongoClient
+
+from mongodb_config import MONGODB_URL, DATABASE_NAME
+from mongo_indexes import ensure_indexes
+from mongo_pipelines import (
+    emotional_patterns_pipeline, emotional_patterns_from_facet,
+    high_risk_entries_pipeline, engagement_pipeline, engagement_from_groups
+)
+
+USER_ID = 1
+EMOCIONES = ["alegría", "tristeza", "ansiedad", "enojo", "miedo", "neutral"]
+NIVELES = ["bajo", "bajo", "bajo", "medio", "alto"]
+
+
+def sembrar(db, n: int, dias: int = 30, lote: int = 5000):
+    db.emotional_texts.delete_many({})
+    db.chat_logs.delete_many({})
+    ahora = datetime.utcnow()
+    rnd = random.Random(42)
+
+    for inicio in range(0, n, lote):
+        textos, chats = [], []
+        for _ in range(min(lote, n - inicio)):
+            ts = ahora - timedelta(seconds=rnd.randint(0, dias * 86400))
+            textos.append({
+                "user_id": USER_ID,
+                "text": "texto de prueba " * 8,
+                "source": "chat",
+                "sentiment": {"sentiment_score": round(rnd.uniform(-1, 1), 3), "label": "x"},
+                "emotions": {"dominant_emotion": rnd.choice(EMOCIONES), "confidence": 0.8},
+                "risk_assessment": {"level": rnd.choice(NIVELES), "score": rnd.random()},
+                "timestamp": ts
+            })
+            chats.append({"user_id": USER_ID, "message": "hola", "is_bot": rnd.random() < 0.5,
+                          "timestamp": ts})
+        db.emotional_texts.insert_many(textos)
+        db.chat_logs.insert_many(chats)
+
+
+# ============================================
+# IMPLEMENTACIONES ANTERIORES (REFERENCIA)
+# ============================================
+
+def patrones_bucle(db, user_id: int, days: int) -> Dict:
+    start_date = datetime.utcnow() - timedelta(days=days)
+    texts_list = list(db.emotional_texts.find({
+        "user_id": user_id,
+        "timestamp": {"$gte": start_date}
+    }).sort("timestamp", 1))
+
+    if not texts_list:
+        return {"total_entries": 0, "dominant_emotions": {}, "average_sentiment": 0, "risk_alerts": 0}
+
+    emotion_counts = {}
+    sentiment_sum = 0
+    high_risk_count = 0
+    for text in texts_list:
+        if text.get("emotions") and text["emotions"].get("dominant_emotion"):
+            emotion = text["emotions"]["dominant_emotion"]
+            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+        if text.get("sentiment") and text["sentiment"].get("sentiment_score"):
+            sentiment_sum += text["sentiment"]["sentiment_score"]
+        if text.get("risk_assessment") and text["risk_assessment"].get("level") == "alto":
+            high_risk_count += 1
+
+    return {
+        "total_entries": len(texts_list),
+        "dominant_emotions": emotion_counts,
+        "average_sentiment": sentiment_sum / len(texts_list),
+        "risk_alerts": high_risk_count,
+        "period_days": days
+    }
+
+
+def riesgo_find(db, user_id: int, days: int) -> List[Dict]:
+    start_date = datetime.utcnow() - timedelta(days=days)
+    return list(db.emotional_texts.find({
+        "user_id": user_id,
+        "timestamp": {"$gte": start_date},
+        "risk_assessment.level": "alto"
+    }).sort("timestamp", -1))
+
+
+def engagement_dos_conteos(db, user_id: int, days: int) -> Dict:
+    start_date = datetime.utcnow() - timedelta(days=days)
+    chat_count = db.chat_logs.count_documents({"user_id": user_id, "is_bot": False,
+                                               "timestamp": {"$gte": start_date}})
+    text_entries = db.emotional_texts.count_documents({"user_id": user_id,
+                                                       "timestamp": {"$gte": start_date}})
+    return {"chat_messages": chat_count, "emotional_entries": text_entries}
+
+
+# ============================================
+# MEDICIÓN
+# ============================================
+
+def medir(fn: Callable, runs: int) -> Dict:
+    fn()  # calentamiento (caché de WiredTiger, planes)
+    tiempos = []
+    for _ in range(runs):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {"mediana_ms": statistics.median(tiempos), "min_ms": min(tiempos)}
+
+
+def comparar_patrones(a: Dict, b: Dict) -> bool:
+    return (a["total_entries"] == b["total_entries"]
+            and a["dominant_emotions"] == b["dominant_emotions"]
+            and a["risk_alerts"] == b["risk_alerts"]
+            and abs(a["average_sentiment"] - b["average_sentiment"]) < 1e-9)
+
+
+def benchmark(db, n: int, runs: int, days: int):
+    print(f"\n📦 Sembrando {n} documentos...")
+    sembrar(db, n)
+
+    def patrones_pipeline():
+        return emotional_patterns_from_facet(
+            list(db.emotional_texts.aggregate(
+                emotional_patterns_pipeline(USER_ID, datetime.utcnow() - timedelta(days=days))
+            )), days)
+
+    def riesgo_pipeline():
+        return list(db.emotional_texts.aggregate(
+            high_risk_entries_pipeline(USER_ID, datetime.utcnow() - timedelta(days=days))
+        ))
+
+    def engagement_un_pipeline():
+        return engagement_from_groups(list(db.chat_logs.aggregate(
+            engagement_pipeline(USER_ID, datetime.utcnow() - timedelta(days=days))
+        )), days)
+
+    # Mismo resultado antes de medir
+    assert comparar_patrones(patrones_bucle(db, USER_ID, days), patrones_pipeline()), "patrones distintos"
+    assert riesgo_find(db, USER_ID, days) == riesgo_pipeline(), "riesgo alto distinto"
+    previo, nuevo = engagement_dos_conteos(db, USER_ID, days), engagement_un_pipeline()
+    assert previo["chat_messages"] == nuevo["chat_messages"] \
+        and previo["emotional_entries"] == nuevo["emotional_entries"], "engagement distinto"
+
+    casos = [
+        ("get_emotional_patterns", lambda: patrones_bucle(db, USER_ID, days), patrones_pipeline),
+        ("get_high_risk_entries", lambda: riesgo_find(db, USER_ID, days), riesgo_pipeline),
+        ("get_user_engagement_stats", lambda: engagement_dos_conteos(db, USER_ID, days), engagement_un_pipeline),
+    ]
+    print(f"{'consulta':<28} {'anterior (ms)':>14} {'pipeline (ms)':>14} {'mejora':>8}")
+    for nombre, anterior, pipeline in casos:
+        a = medir(anterior, runs)
+        p = medir(pipeline, runs)
+        print(f"{nombre:<28} {a['mediana_ms']:>14.1f} {p['mediana_ms']:>14.1f} "
+              f"{a['mediana_ms'] / max(p['mediana_ms'], 1e-6):>7.1f}x")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark de las agregaciones de MongoDBService')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                        help='Documentos por usuario (por defecto 10000 100000)')
+    parser.add_argument('--runs', type=int, default=5, help='Repeticiones por consulta')
+    parser.add_argument('--days', type=int, default=30, help='Ventana de las consultas')
+    parser.add_argument('--database', default=f"{DATABASE_NAME}_benchmark",
+                        help='Base de datos de prueba (se borra al terminar)')
+    parser.add_argument('--keep', action='store_true', help='No borrar la base de prueba')
+
+    args = parser.parse_args()
+
+    client = MongoClient(MONGODB_URL)
+    db = client[args.database]
+    ensure_indexes(db, ["emotional_texts", "chat_logs"])
+
+    try:
+        for n in args.sizes:
+            benchmark(db, n, args.runs, args.days)
+    finally:
+        if not args.keep:
+            client.drop_database(args.database)
@@ -0,0 +1,126 @@
+# backend/blocking_executor.py
+# ✅ EJECUTOR PARA TRABAJO BLOQUEANTE (pymongo, SQLAlchemy, inferencia)
+# Los endpoints async hacen `await blocking_executor.run(func, ...)` en lugar
+# de llamar directo a código bloqueante dentro del event loop
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+# Configuración
+BLOCKING_MAX_WORKERS = int(os.getenv("BLOCKING_MAX_WORKERS", "8"))
+BLOCKING_MAX_QUEUE = int(os.getenv("BLOCKING_MAX_QUEUE", "64"))
+
+
+class BlockingExecutor:
+    """
+    Pool de hilos acotado con métricas de cola.
+    - max_workers: hilos ejecutando a la vez
+    - max_queue: tareas admitidas (en cola + en ejecución); el resto espera
+      en el event loop sin ocupar memoria del pool
+    """
+
+    def __init__(self, max_workers: int = BLOCKING_MAX_WORKERS,
+                 max_queue: int = BLOCKING_MAX_QUEUE,
+                 name: str = "blocking"):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max(max_queue, max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._admission = None
+        self._lock = threading.Lock()
+
+        # Métricas
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+        self._max_wait = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Ejecuta func en el pool y espera su resultado sin bloquear el loop"""
+        if self._admission is None:
+            self._admission = asyncio.Semaphore(self.max_queue)
+
+        enqueued_at = time.monotonic()
+        async with self._admission:
+            # "queued" -> "started" (lo marca el hilo) o "abandoned" (el llamador
+            # fue cancelado antes de que la tarea empezara: no se ejecuta)
+            estado = ["queued"]
+            with self._lock:
+                self._queued += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._pool,
+                    partial(self._execute, func, enqueued_at, estado, args, kwargs)
+                )
+            finally:
+                with self._lock:
+                    if estado[0] == "queued":
+                        estado[0] = "abandoned"
+                        self._queued -= 1
+                        self._cancelled += 1
+
+    def _execute(self, func: Callable, enqueued_at: float, estado: list, args, kwargs) -> Any:
+        started_at = time.monotonic()
+        wait = started_at - enqueued_at
+        with self._lock:
+            if estado[0] == "abandoned":
+                return None
+            estado[0] = "started"
+            self._queued -= 1
+            self._active += 1
+            self._wait_times.append(wait)
+            self._max_wait = max(self._max_wait, wait)
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._run_times.append(time.monotonic() - started_at)
+
+        return result
+
+    def stats(self) -> Dict:
+        """Métricas para dimensionar el pool"""
+        with self._lock:
+            waits = sorted(self._wait_times)
+            runs = list(self._run_times)
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 2) if waits else 0,
+                "wait_ms_p95": round(waits[int(len(waits) * 0.95) - 1] * 1000, 2) if waits else 0,
+                "wait_ms_max": round(self._max_wait * 1000, 2),
+                "run_ms_avg": round(sum(runs) / len(runs) * 1000, 2) if runs else 0
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+# Instancia global del ejecutor
+blocking_executor = BlockingExecutor()
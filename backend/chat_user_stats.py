@@ -0,0 +1,158 @@
+# backend/chat_user_stats.py
+# ✅ CONTADORES DE CHAT POR USUARIO (colección chat_user_stats)
+# Un documento por paciente (_id = user_id) que se actualiza con $inc/$max al
+# guardar cada mensaje, vía write-behind. /chat/estadisticas lo lee por _id en
+# lugar de contar y agrupar todo el historial en cada llamada.
+#
+#   {_id: 7, user_messages: 120, bot_replies: 131,
+#    emotions: {tristeza: 40, neutral: 55, ...},
+#    last_activity: ISODate, created_at: ISODate}
+#
+# Los $inc suman sobre lo que haya: el historial anterior a los contadores se
+# carga antes de desplegarlos (migrar_user_id.py llama a rebuild al terminar,
+# con el backend parado). El endpoint no reconstruye: un rebuild en mitad del
+# tráfico competiría con los $inc pendientes del write-behind y contaría doble.
+#
+# Si los contadores se desvían (reintentos tras un fallo de red, documentos
+# borrados a mano), se recalculan desde chat_messages:
+#   python chat_user_stats.py rebuild               # todos los usuarios
+#   python chat_user_stats.py rebuild --user-id 7
+#   python chat_user_stats.py show --user-id 7
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from mongodb_config import canonical_user_id
+
+STATS_COLLECTION = "chat_user_stats"
+
+
+def _emotion_key(emotion: str) -> str:
+    """Las claves de subdocumento no pueden contener '.' ni empezar por '$'"""
+    return emotion.replace(".", "_").lstrip("$") or "desconocida"
+
+
+def interaction_update(user_id: int, bot_replies: int, emotion: Optional[str],
+                       at: Optional[datetime] = None) -> Tuple[Dict, Dict]:
+    """(filtro, update) de un mensaje del paciente y sus respuestas del bot"""
+    at = at or datetime.utcnow()
+    inc = {"user_messages": 1, "bot_replies": bot_replies}
+    if emotion:
+        inc[f"emotions.{_emotion_key(emotion)}"] = 1
+    return (
+        {"_id": canonical_user_id(user_id)},
+        {
+            "$inc": inc,
+            "$max": {"last_activity": at},
+            "$setOnInsert": {"created_at": at}
+        }
+    )
+
+
+def record_interaction(user_id: int, bot_replies: int, emotion: Optional[str],
+                       at: Optional[datetime] = None):
+    """Encola el incremento en write-behind (misma vía que los mensajes)"""
+    from write_behind import write_behind
+    filtro, update = interaction_update(user_id, bot_replies, emotion, at)
+    write_behind.enqueue_update(STATS_COLLECTION, filtro, update)
+
+
+def empty_stats(user_id: int) -> Dict:
+    return {
+        "_id": canonical_user_id(user_id),
+        "user_messages": 0,
+        "bot_replies": 0,
+        "emotions": {},
+        "last_activity": None
+    }
+
+
+def top_emotions(stats: Dict, limit: int = 5) -> List[Dict]:
+    emociones = sorted((stats.get("emotions") or {}).items(), key=lambda e: e[1], reverse=True)
+    return [{"emocion": emocion, "cantidad": cantidad} for emocion, cantidad in emociones[:limit]]
+
+
+# ============================================
+# RECONSTRUCCIÓN DESDE chat_messages
+# ============================================
+
+def rebuild(db, user_id: Optional[int] = None) -> int:
+    """
+    Recalcula los contadores desde chat_messages y reemplaza los documentos.
+    Los incrementos que lleguen durante la reconstrucción pueden perderse:
+    conviene ejecutarla con poco tráfico. Devuelve cuántos usuarios se escribieron.
+    """
+    from pymongo import ReplaceOne
+
+    match = {} if user_id is None else {"user_id": canonical_user_id(user_id)}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "is_bot": "$is_bot",
+                "emotion": "$emotional_analysis.emotions.dominant_emotion"
+            },
+            "count": {"$sum": 1},
+            "first": {"$min": "$timestamp"},
+            "last": {"$max": "$timestamp"}
+        }}
+    ]
+
+    por_usuario: Dict[int, Dict] = {}
+    for grupo in db.chat_messages.aggregate(pipeline, allowDiskUse=True):
+        try:
+            uid = canonical_user_id(grupo["_id"].get("user_id"))
+        except (TypeError, ValueError):
+            continue
+        stats = por_usuario.setdefault(uid, {**empty_stats(uid), "created_at": grupo["first"]})
+        if grupo["_id"].get("is_bot"):
+            stats["bot_replies"] += grupo["count"]
+        else:
+            stats["user_messages"] += grupo["count"]
+            emocion = grupo["_id"].get("emotion")
+            if emocion:
+                clave = _emotion_key(emocion)
+                stats["emotions"][clave] = stats["emotions"].get(clave, 0) + grupo["count"]
+        if grupo["last"] and (stats["last_activity"] is None or grupo["last"] > stats["last_activity"]):
+            stats["last_activity"] = grupo["last"]
+        if grupo["first"] and (stats["created_at"] is None or grupo["first"] < stats["created_at"]):
+            stats["created_at"] = grupo["first"]
+
+    if user_id is not None and not por_usuario:
+        # Sin historial: se borra el documento (el endpoint devuelve ceros)
+        db[STATS_COLLECTION].delete_one({"_id": canonical_user_id(user_id)})
+        return 0
+
+    operaciones = [ReplaceOne({"_id": uid}, stats, upsert=True) for uid, stats in por_usuario.items()]
+    for inicio in range(0, len(operaciones), 1000):
+        db[STATS_COLLECTION].bulk_write(operaciones[inicio:inicio + 1000], ordered=False)
+    return len(operaciones)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from mongodb_config import get_database
+
+    parser = argparse.ArgumentParser(description='Contadores de chat por usuario')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    reconstruir = sub.add_parser('rebuild', help='Recalcular desde chat_messages')
+    reconstruir.add_argument('--user-id', type=int, help='Solo este usuario (por defecto todos)')
+    mostrar = sub.add_parser('show', help='Mostrar los contadores de un usuario')
+    mostrar.add_argument('--user-id', type=int, required=True)
+
+    args = parser.parse_args()
+    db = get_database()
+
+    if args.comando == 'rebuild':
+        total = rebuild(db, args.user_id)
+        print(f"✅ Contadores reconstruidos para {total} usuario(s)")
+    else:
+        stats = db[STATS_COLLECTION].find_one({"_id": args.user_id}) or empty_stats(args.user_id)
+        print(f"👤 Usuario {args.user_id}")
+        print(f"  Mensajes del paciente: {stats['user_messages']}")
+        print(f"  Respuestas del bot:    {stats['bot_replies']}")
+        print(f"  Última actividad:      {stats.get('last_activity')}")
+        for e in top_emotions(stats, limit=10):
+            print(f"  {e['emocion']:<15} {e['cantidad']}")
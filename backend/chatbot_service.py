@@ -1,32 +1,27 @@
-import requests
-from typing import Dict, List
+import httpx
+from typing import Dict, List, Optional
 import json
-from nlp_service import analyze_text
+from nlp_batcher import nlp_batcher
+from rasa_client import rasa_client, RasaClient, RasaUnavailable
 
 class ChatbotService:
-    def __init__(self, rasa_url: str = "http://localhost:5006"):
-        self.rasa_url = rasa_url
-        self.webhook_url = f"{rasa_url}/webhooks/rest/webhook"
+    def __init__(self, client: RasaClient = rasa_client):
+        # Cliente compartido: reutiliza el pool de conexiones del worker
+        self.client = client
+        self.rasa_url = client.base_url
+        self.webhook_url = client.webhook_url
         
-    def send_message(self, sender_id: str, message: str) -> Dict:
+    async def send_message(self, sender_id: str, message: str) -> Dict:
         """
         Envía un mensaje al chatbot Rasa y recibe la respuesta
         """
+        emotional_analysis = None
         try:
             # Análisis emocional del mensaje del usuario
-            emotional_analysis = analyze_text(message)
+            emotional_analysis = await nlp_batcher.analyze_async(message)
             
-            # Enviar mensaje a Rasa
-            payload = {
-                "sender": sender_id,
-                "message": message
-            }
-            
-            response = requests.post(
-                self.webhook_url,
-                json=payload,
-                timeout=10
-            )
+            # Enviar mensaje a Rasa (presupuesto de latencia + circuit breaker)
+            response = await self.client.send_message_guarded(sender_id, message)
             
             if response.status_code == 200:
                 bot_responses = response.json()
@@ -44,21 +39,23 @@ class ChatbotService:
                     'intent': bot_responses[0].get('intent', 'unknown') if bot_responses else 'unknown'
                 }
             else:
-                return self._fallback_response(message, emotional_analysis)
+                return self.fallback_response(message, emotional_analysis)
                 
-        except requests.exceptions.ConnectionError:
+        except (RasaUnavailable, httpx.HTTPError):
             # Si Rasa no está disponible, usar respuestas de respaldo
-            return self._fallback_response(message, emotional_analysis)
+            return self.fallback_response(message, emotional_analysis)
         except Exception as e:
             print(f"Error en chatbot: {e}")
-            return self._fallback_response(message, emotional_analysis)
+            return self.fallback_response(message, emotional_analysis)
     
-    def _fallback_response(self, message: str, emotional_analysis: Dict) -> Dict:
+    def fallback_response(self, message: str, emotional_analysis: Optional[Dict] = None) -> Dict:
         """
-        Sistema de respuestas de respaldo cuando Rasa no está disponible
+        Sistema de respuestas de respaldo cuando Rasa no está disponible.
+        Sin análisis (p. ej. falló el NLP) se usan las respuestas genéricas.
         """
-        emotion = emotional_analysis['emotions']['dominant_emotion']
-        sentiment_score = emotional_analysis['sentiment']['sentiment_score']
+        emotions = (emotional_analysis or {}).get('emotions') or {}
+        risk = (emotional_analysis or {}).get('risk_assessment') or {}
+        emotion = emotions.get('dominant_emotion') or 'neutral'
         
         # Respuestas basadas en emociones
         responses = {
@@ -85,7 +82,7 @@ class ChatbotService:
         }
         
         # Respuestas de alto riesgo
-        if emotional_analysis['risk_assessment']['level'] == 'alto':
+        if risk.get('level') in ('alto', 'crítico'):
             high_risk_responses = [
                 "Noto que podrías estar pasando por un momento muy difícil. Por favor, considera contactar a tu psicólogo o llamar a una línea de ayuda si necesitas apoyo inmediato.",
                 "Tu bienestar es muy importante. Si sientes que necesitas ayuda urgente, por favor contacta a un profesional de salud mental."
@@ -122,6 +119,6 @@ class ChatbotService:
 # Instancia global del servicio
 chatbot_service = ChatbotService()
 
-def process_chat_message(user_id: str, message: str) -> Dict:
+async def process_chat_message(user_id: str, message: str) -> Dict:
     """Función auxiliar para procesar mensajes"""
-    return chatbot_service.send_message(user_id, message)
\ No newline at end of file
+    return await chatbot_service.send_message(user_id, message)
\ No newline at end of file
@@ -0,0 +1,108 @@
+# backend/circuit_breaker.py
+# ✅ CIRCUIT BREAKER (closed / open / half-open)
+# - closed: las llamadas pasan; N fallos seguidos -> open
+# - open: se rechazan sin llamar durante recovery_seconds
+# - half-open: pasa un número limitado de llamadas de prueba;
+#   si salen bien -> closed, si falla una -> open otra vez
+#
+# Se usa desde el event loop (un hilo por worker), por eso no lleva locks.
+
+import os
+import time
+from typing import Dict, Optional
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_SECONDS = float(os.getenv("BREAKER_RECOVERY_SECONDS", "30"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str,
+                 failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_seconds: float = BREAKER_RECOVERY_SECONDS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_seconds = recovery_seconds
+        self.half_open_calls = max(1, half_open_calls)
+
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open_in_flight = 0
+
+        # Métricas
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+        self.last_failure: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        # open -> half-open al vencer el tiempo de recuperación
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+        return self._state
+
+    def allow_request(self) -> bool:
+        """True si la llamada puede hacerse; en half-open reserva una de prueba"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._half_open_in_flight < self.half_open_calls:
+            self._half_open_in_flight += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.successes += 1
+        self._consecutive_failures = 0
+        if self._state == HALF_OPEN:
+            print(f"✅ Circuit breaker '{self.name}' cerrado")
+        self._state = CLOSED
+        self._half_open_in_flight = 0
+
+    def record_failure(self, reason: str = ""):
+        self.failures += 1
+        self._consecutive_failures += 1
+        self.last_failure = reason or None
+        if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def release(self):
+        """La llamada se abandonó sin resultado (cancelada): libera su turno de prueba"""
+        if self._state == HALF_OPEN and self._half_open_in_flight > 0:
+            self._half_open_in_flight -= 1
+
+    def _open(self):
+        if self._state != OPEN:
+            self.times_opened += 1
+            print(f"⚠️ Circuit breaker '{self.name}' abierto ({self.last_failure})")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_in_flight = 0
+
+    def stats(self) -> Dict:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self._consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_seconds": self.recovery_seconds,
+            "seconds_until_half_open": (
+                round(max(0.0, self.recovery_seconds - (time.monotonic() - self._opened_at)), 1)
+                if state == OPEN else None
+            ),
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+            "last_failure": self.last_failure
+        }
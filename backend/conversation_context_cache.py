@@ -0,0 +1,283 @@
+# backend/conversation_context_cache.py
+# ✅ CACHÉ DE CONTEXTO DE CONVERSACIÓN (chat avanzado)
+# ConversationMemory hacía tres lecturas a MongoDB en cada turno (últimos
+# mensajes, patrones de 7 días y entradas de riesgo alto). Ahora:
+#   - en un fallo de caché se carga todo con una sola agregación
+#     (mongo_pipelines.conversation_context_pipeline)
+#   - save_interaction actualiza la entrada en memoria con lo que encola en
+#     write-behind, así que los turnos siguientes no leen MongoDB
+#   - LRU acotado por usuarios + TTL desde la carga
+#
+# Los patrones se guardan agregados por hora: la ventana de 7 días se desliza
+# descartando horas completas (la primera hora de la ventana cuenta entera).
+#
+# La caché es por proceso: con varios workers, lo que escribe otro worker se ve
+# al expirar el TTL. Borrar el historial invalida la entrada local.
+#
+# Las entradas guardan copias de los documentos (los originales son los que
+# escribe el hilo de write-behind) y get() devuelve copias. Una carga no se
+# guarda si hubo una interacción del usuario durante la carga o poco antes
+# (CONTEXT_CACHE_SETTLE_SECONDS): lo encolado en write-behind podría no estar
+# todavía en MongoDB y la entrada quedaría sin ello hasta el TTL.
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from mongodb_config import canonical_user_id
+from mongo_pipelines import conversation_context_pipeline, pattern_fields
+
+CONTEXT_CACHE_MAX_USERS = int(os.getenv("CONTEXT_CACHE_MAX_USERS", "1000"))
+CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "900"))
+# Margen tras una interacción sin entrada en caché para que write-behind la
+# escriba (su intervalo de vaciado es WRITE_BEHIND_FLUSH_MS)
+CONTEXT_CACHE_SETTLE_SECONDS = float(os.getenv("CONTEXT_CACHE_SETTLE_SECONDS", "2"))
+CONTEXT_MESSAGES_LIMIT = 10
+CONTEXT_PATTERN_DAYS = 7
+CONTEXT_HIGH_RISK_LIMIT = 5
+
+
+def _hora(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+class UserContext:
+    """Contexto en memoria de un usuario"""
+
+    def __init__(self, messages_limit: int, high_risk_limit: int):
+        self.recent_messages = deque(maxlen=messages_limit)  # más antiguo primero
+        # hora -> {"total", "sentiment_sum", "high_risk", "emotions": {emoción: n}}
+        self.horas: Dict[datetime, Dict] = {}
+        self.high_risk = deque(maxlen=high_risk_limit)  # más reciente primero
+        self.loaded_at = time.monotonic()
+
+    def add_pattern(self, hora: datetime, total: int, sentiment_sum: float,
+                    high_risk: int, emotion: Optional[str]):
+        bucket = self.horas.setdefault(
+            hora, {"total": 0, "sentiment_sum": 0.0, "high_risk": 0, "emotions": {}}
+        )
+        bucket["total"] += total
+        bucket["sentiment_sum"] += sentiment_sum
+        bucket["high_risk"] += high_risk
+        if emotion:
+            bucket["emotions"][emotion] = bucket["emotions"].get(emotion, 0) + total
+
+    def patterns(self, days: int, now: datetime) -> Dict:
+        """Mismo formato que MongoDBService.get_emotional_patterns"""
+        inicio = _hora(now - timedelta(days=days))
+        for hora in [h for h in self.horas if h < inicio]:
+            del self.horas[hora]
+
+        total, sentiment_sum, high_risk, emociones = 0, 0.0, 0, {}
+        for bucket in self.horas.values():
+            total += bucket["total"]
+            sentiment_sum += bucket["sentiment_sum"]
+            high_risk += bucket["high_risk"]
+            for emocion, n in bucket["emotions"].items():
+                emociones[emocion] = emociones.get(emocion, 0) + n
+
+        if not total:
+            return {"total_entries": 0, "dominant_emotions": {}, "average_sentiment": 0, "risk_alerts": 0}
+        return {
+            "total_entries": total,
+            "dominant_emotions": emociones,
+            "average_sentiment": sentiment_sum / total,
+            "risk_alerts": high_risk,
+            "period_days": days
+        }
+
+    def high_risk_entries(self, days: int, now: datetime) -> List[Dict]:
+        inicio = now - timedelta(days=days)
+        return [e for e in self.high_risk if e.get("timestamp") and e["timestamp"] >= inicio]
+
+
+class ConversationContextCache:
+    """LRU de contextos por usuario con TTL; thread-safe"""
+
+    def __init__(self, max_users: int = CONTEXT_CACHE_MAX_USERS,
+                 ttl_seconds: float = CONTEXT_CACHE_TTL_SECONDS,
+                 settle_seconds: float = CONTEXT_CACHE_SETTLE_SECONDS,
+                 messages_limit: int = CONTEXT_MESSAGES_LIMIT,
+                 days: int = CONTEXT_PATTERN_DAYS,
+                 high_risk_limit: int = CONTEXT_HIGH_RISK_LIMIT):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.settle_seconds = settle_seconds
+        self.messages_limit = messages_limit
+        self.days = days
+        self.high_risk_limit = high_risk_limit
+        self._entries: "OrderedDict[int, UserContext]" = OrderedDict()
+        # uid -> monotonic de su última interacción/invalidación (más antigua primero)
+        self._last_write: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_loads = 0
+
+    # ============================================
+    # LECTURA
+    # ============================================
+
+    def get(self, db, user_id: int) -> Dict:
+        """
+        recent_messages, emotional_patterns y high_risk_entries del usuario.
+        Solo va a MongoDB (una agregación) si no está en caché o expiró.
+        """
+        uid = canonical_user_id(user_id)
+        with self._lock:
+            entry = self._lookup(uid)
+            if entry is not None:
+                self.hits += 1
+                return self._snapshot(entry)
+            self.misses += 1
+
+        # La carga se hace fuera del lock para no bloquear a otros usuarios
+        inicio = time.monotonic()
+        entry = self._load(db, uid)
+        with self._lock:
+            self.loads += 1
+            # Si otro hilo cargó mientras tanto se conserva su entrada (puede
+            # tener ya interacciones aplicadas)
+            actual = self._lookup(uid)
+            if actual is None:
+                actual = entry
+                ultima = self._last_write.get(uid)
+                if ultima is not None and ultima >= inicio - self.settle_seconds:
+                    # La carga puede no incluir esa interacción: se usa para esta
+                    # petición pero no se guarda
+                    self.stale_loads += 1
+                else:
+                    self._store(uid, entry)
+            return self._snapshot(actual)
+
+    def _lookup(self, uid: int) -> Optional[UserContext]:
+        entry = self._entries.get(uid)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl_seconds:
+            del self._entries[uid]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(uid)
+        return entry
+
+    def _store(self, uid: int, entry: UserContext):
+        self._entries[uid] = entry
+        self._entries.move_to_end(uid)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _snapshot(self, entry: UserContext) -> Dict:
+        # Copias profundas: el llamador usa (y puede modificar) el contexto fuera del lock
+        now = datetime.utcnow()
+        return copy.deepcopy({
+            "recent_messages": list(entry.recent_messages),
+            "emotional_patterns": entry.patterns(self.days, now),
+            "high_risk_entries": entry.high_risk_entries(self.days, now)
+        })
+
+    def _mark_write(self, uid: int):
+        """
+        Anota la interacción y olvida las que ya no pueden afectar a una carga
+        (se supone que ninguna carga dura más que el TTL)
+        """
+        ahora = time.monotonic()
+        self._last_write[uid] = ahora
+        self._last_write.move_to_end(uid)
+        while self._last_write:
+            primero, momento = next(iter(self._last_write.items()))
+            if momento >= ahora - self.settle_seconds - self.ttl_seconds:
+                break
+            del self._last_write[primero]
+
+    def _load(self, db, uid: int) -> UserContext:
+        start_date = datetime.utcnow() - timedelta(days=self.days)
+        resultado = list(db.chat_logs.aggregate(conversation_context_pipeline(
+            uid, start_date, self.messages_limit, self.high_risk_limit
+        )))
+        facet = resultado[0] if resultado else {}
+
+        entry = UserContext(self.messages_limit, self.high_risk_limit)
+        for mensaje in reversed(facet.get("mensajes", [])):
+            entry.recent_messages.append(mensaje)
+        for grupo in facet.get("horas", []):
+            entry.add_pattern(
+                grupo["_id"]["hora"], grupo["total"], grupo.get("sentiment_sum") or 0.0,
+                grupo.get("high_risk", 0), grupo["_id"].get("emotion")
+            )
+        for riesgo in facet.get("riesgo_alto", []):
+            entry.high_risk.append(riesgo)
+        return entry
+
+    # ============================================
+    # ACTUALIZACIÓN INCREMENTAL
+    # ============================================
+
+    def record_interaction(self, user_id: int, messages: List[Dict],
+                           emotional_text: Optional[Dict] = None):
+        """
+        Aplica los documentos que se acaban de encolar (chat_logs y emotional_texts).
+        Si el usuario no está en caché no hace nada: la próxima carga los leerá.
+        Se guardan copias: los originales los escribe el hilo de write-behind.
+        """
+        messages = copy.deepcopy(messages)
+        emotional_text = copy.deepcopy(emotional_text)
+        uid = canonical_user_id(user_id)
+        with self._lock:
+            self._mark_write(uid)
+            entry = self._lookup(uid)
+            if entry is None:
+                return
+            for mensaje in messages:
+                entry.recent_messages.append(mensaje)
+            if emotional_text is not None:
+                emocion, sentiment, riesgo = pattern_fields(emotional_text)
+                es_alto = riesgo == "alto"
+                entry.add_pattern(_hora(emotional_text["timestamp"]), 1, sentiment or 0.0,
+                                  1 if es_alto else 0, emocion)
+                if es_alto:
+                    entry.high_risk.appendleft(emotional_text)
+
+    def invalidate(self, user_id: int):
+        uid = canonical_user_id(user_id)
+        with self._lock:
+            # Una carga en curso no debe volver a guardar lo que se invalida
+            self._mark_write(uid)
+            if self._entries.pop(uid, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_write.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "users": len(self._entries),
+                "max_users": self.max_users,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / consultas, 3) if consultas else 0.0,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_loads": self.stale_loads
+            }
+
+
+# Instancia global
+context_cache = ConversationContextCache()
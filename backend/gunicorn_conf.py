@@ -0,0 +1,94 @@
+# backend/gunicorn_conf.py
+# ✅ MODO PRE-FORK: los modelos NLP se cargan UNA vez en el proceso maestro
+# y los workers los comparten copy-on-write tras el fork.
+#
+# Uso:
+#   cd backend
+#   gunicorn -c gunicorn_conf.py main:app
+#
+# Con `uvicorn --workers N` cada worker importa la app por su cuenta y copia
+# los pesos en su memoria privada; con este modo se comparten las páginas.
+
+import gc
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", str(max(2, multiprocessing.cpu_count() // 2))))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = 5
+
+# Importar main:app en el maestro antes del fork
+preload_app = True
+
+# Hilos de PyTorch por worker (evita N workers x todos los cores)
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "1"))
+
+
+def when_ready(server):
+    """
+    Se ejecuta en el maestro después de importar la app y antes de crear workers.
+    Solo se cargan los pesos: NO se ejecuta inferencia aquí, porque el pool de
+    hilos de OpenMP no sobrevive a un fork.
+    """
+    # Con NLP_INFERENCE_BACKEND=onnx los modelos se exportan antes de crear
+    # workers (los workers no exportan). En un subproceso: exportar traza el
+    # modelo, es decir, ejecuta inferencia, y eso no debe pasar en el maestro.
+    try:
+        from inference_backend import resolve_backend
+        if resolve_backend() == "onnx":
+            subprocess.run(
+                [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference_backend.py"), "export"],
+                check=True
+            )
+            server.log.info("Modelos ONNX exportados")
+    except Exception as e:
+        server.log.warning(f"No se pudieron exportar los modelos ONNX (se usará torch donde falten): {e}")
+
+    try:
+        from nlp_service import nlp_service
+        nlp_service.load()
+        server.log.info("Modelos NLP cargados en el maestro (pre-fork)")
+    except Exception as e:
+        server.log.warning(f"No se pudieron precargar los modelos NLP: {e}")
+
+    # BETO del chat avanzado: el router lo importa en la primera petición, así
+    # que sin esto cada worker lo cargaría por su cuenta (robertuito-sentiment
+    # ya está en el registro y se reutiliza)
+    try:
+        from advanced_chatbot_service import advanced_chatbot
+        advanced_chatbot.emotion_analyzer.load()
+        server.log.info("Modelos del chat avanzado cargados en el maestro (pre-fork)")
+    except Exception as e:
+        server.log.warning(f"No se pudieron precargar los modelos del chat avanzado: {e}")
+
+    # Sacar todo lo cargado hasta ahora del recolector de basura: si el GC de
+    # cada worker recorriera estos objetos, tocaría sus páginas y rompería el CoW
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Con preload_app el maestro ya importó main (create_all del engine, cliente
+    de MongoDB y ensure_indexes). Las conexiones heredadas no se comparten:
+    cada worker abre las suyas.
+    """
+    try:
+        import torch
+        torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+    except ImportError:
+        pass
+
+    # close=False: las conexiones del pool heredado siguen siendo del maestro;
+    # el worker las olvida sin cerrarlas y crea un pool nuevo
+    from database import engine
+    engine.dispose(close=False)
+
+    from mongodb_config import mongodb_service
+    mongodb_service.reset_after_fork()
+    from mongodb_async import async_mongodb_service
+    async_mongodb_service.reset_after_fork()
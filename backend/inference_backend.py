@@ -0,0 +1,368 @@
+# backend/inference_backend.py
+# ✅ BACKEND DE INFERENCIA INTERCAMBIABLE (PyTorch / ONNX Runtime int8)
+#
+# NLP_INFERENCE_BACKEND=torch  -> transformers.pipeline sobre PyTorch (por defecto)
+# NLP_INFERENCE_BACKEND=onnx   -> modelo exportado a ONNX con cuantización dinámica int8
+#
+# La exportación ONNX se hace por adelantado (CLI o when_ready de gunicorn, en
+# el maestro): los workers nunca exportan, solo cargan lo ya exportado.
+#
+# Uso por línea de comandos:
+#   python inference_backend.py export                 # exporta todos los modelos conocidos
+#   python inference_backend.py export <model_id>      # exporta un modelo concreto
+#   python inference_backend.py parity                 # compara ONNX vs PyTorch
+#   python inference_backend.py safetensors            # convierte los checkpoints a safetensors locales
+
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Configuración
+NLP_INFERENCE_BACKEND = os.getenv("NLP_INFERENCE_BACKEND", "torch").lower()
+ONNX_MODELS_DIR = os.getenv(
+    "ONNX_MODELS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_models")
+)
+# avx512_vnni, avx2 o arm64 según la CPU de los nodos
+ONNX_QUANTIZATION_TARGET = os.getenv("ONNX_QUANTIZATION_TARGET", "avx2")
+ONNX_QUANTIZED_FILE = "model_quantized.onnx"
+
+# Pesos en safetensors locales: la carga no deserializa un pickle ni descarga
+# del hub. transformers copia los tensores a memoria del proceso, así que las
+# páginas NO se comparten entre procesos por esto: lo que comparten los
+# workers viene del preload de gunicorn (copy-on-write, ver gunicorn_conf.py).
+SAFETENSORS_MODELS_DIR = os.getenv(
+    "SAFETENSORS_MODELS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "safetensors_models")
+)
+
+# Modelos usados por el backend y por el action server de Rasa
+KNOWN_MODELS = {
+    "pysentimiento/robertuito-sentiment-analysis": "sentiment-analysis",
+    "pysentimiento/robertuito-emotion-analysis": "text-classification",
+    "finiteautomata/beto-emotion-analysis": "text-classification",
+    "nlptown/bert-base-multilingual-uncased-sentiment": "sentiment-analysis",
+}
+
+
+def onnx_model_dir(model_id: str) -> str:
+    """Carpeta donde se guarda la versión ONNX cuantizada de un modelo"""
+    return os.path.join(ONNX_MODELS_DIR, model_id.replace("/", "__"))
+
+
+def onnx_available() -> bool:
+    try:
+        import optimum.onnxruntime  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """Backend efectivo: si se pide onnx pero optimum no está instalado, cae a torch"""
+    backend = (backend or NLP_INFERENCE_BACKEND).lower()
+    if backend == "onnx" and not onnx_available():
+        print("⚠️ NLP_INFERENCE_BACKEND=onnx pero optimum[onnxruntime] no está instalado - usando torch")
+        return "torch"
+    return backend if backend in ("torch", "onnx") else "torch"
+
+
+def onnx_exported(model_id: str) -> bool:
+    return os.path.exists(os.path.join(onnx_model_dir(model_id), ONNX_QUANTIZED_FILE))
+
+
+@contextmanager
+def _export_lock(output_dir: str, timeout: float = 1800, stale_after: float = 3600):
+    """
+    Lock entre procesos con un archivo creado en exclusiva (O_EXCL), portable a
+    Windows. Un lock más viejo que stale_after se considera abandonado.
+    """
+    lock_path = f"{output_dir}.lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Otro proceso está exportando {output_dir} ({lock_path})")
+            time.sleep(1)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def export_onnx_quantized(model_id: str, force: bool = False) -> str:
+    """
+    Exporta un checkpoint de Hugging Face a ONNX y aplica cuantización
+    dinámica int8 (pesos int8, activaciones cuantizadas en ejecución).
+    Se exporta en una carpeta temporal y se mueve con os.replace, bajo lock:
+    un lector nunca ve un model_quantized.onnx a medio escribir.
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    output_dir = onnx_model_dir(model_id)
+    if not force and onnx_exported(model_id):
+        return output_dir
+
+    with _export_lock(output_dir):
+        # Otro proceso pudo terminar la exportación mientras se esperaba el lock
+        if not force and onnx_exported(model_id):
+            return output_dir
+
+        tmp_dir = tempfile.mkdtemp(prefix=".export_", dir=ONNX_MODELS_DIR)
+        try:
+            fp32_dir = os.path.join(tmp_dir, "fp32")
+            quantized_dir = os.path.join(tmp_dir, "quantized")
+            print(f"📦 Exportando {model_id} a ONNX...")
+            model = ORTModelForSequenceClassification.from_pretrained(model_id, export=True)
+            tokenizer = AutoTokenizer.from_pretrained(model_id)
+            model.save_pretrained(fp32_dir)
+            tokenizer.save_pretrained(fp32_dir)
+
+            print(f"🗜️ Cuantizando {model_id} (int8 dinámico, {ONNX_QUANTIZATION_TARGET})...")
+            quantization_config = getattr(AutoQuantizationConfig, ONNX_QUANTIZATION_TARGET)(
+                is_static=False,
+                per_channel=False
+            )
+            quantizer = ORTQuantizer.from_pretrained(fp32_dir)
+            quantizer.quantize(save_dir=quantized_dir, quantization_config=quantization_config)
+            tokenizer.save_pretrained(quantized_dir)
+
+            # os.replace no sustituye una carpeta con contenido (ni en Windows
+            # una existente): con --force se retira primero la anterior
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+            os.replace(quantized_dir, output_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"✅ Modelo ONNX cuantizado en {output_dir}")
+    return output_dir
+
+
+def safetensors_model_dir(model_id: str) -> str:
+    """Carpeta con la copia local del checkpoint en formato safetensors"""
+    return os.path.join(SAFETENSORS_MODELS_DIR, model_id.replace("/", "__"))
+
+
+def export_safetensors(model_id: str, force: bool = False) -> str:
+    """Guarda modelo + tokenizer en safetensors (algunos checkpoints solo traen .bin)"""
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    output_dir = safetensors_model_dir(model_id)
+    if not force and os.path.exists(os.path.join(output_dir, "model.safetensors")):
+        return output_dir
+
+    print(f"📦 Convirtiendo {model_id} a safetensors...")
+    model = AutoModelForSequenceClassification.from_pretrained(model_id)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model.save_pretrained(output_dir, safe_serialization=True)
+    tokenizer.save_pretrained(output_dir)
+    print(f"✅ Safetensors en {output_dir}")
+    return output_dir
+
+
+def _build_onnx_classifier(task: str, model_id: str, **pipeline_kwargs):
+    """Pipeline sobre el modelo ONNX ya exportado; lanza si no existe o no carga"""
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import pipeline, AutoTokenizer
+
+    if not onnx_exported(model_id):
+        raise FileNotFoundError(
+            f"{model_id} no está exportado a ONNX: ejecuta `python inference_backend.py export`"
+        )
+    model_dir = onnx_model_dir(model_id)
+    model = ORTModelForSequenceClassification.from_pretrained(
+        model_dir,
+        file_name=ONNX_QUANTIZED_FILE
+    )
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    # ONNX Runtime corre en CPU: se ignora el device de PyTorch
+    pipeline_kwargs.pop("device", None)
+    return pipeline(task, model=model, tokenizer=tokenizer, **pipeline_kwargs)
+
+
+def build_text_classifier(task: str, model_id: str, backend: Optional[str] = None,
+                          strict: bool = False, **pipeline_kwargs):
+    """
+    Construye un pipeline de clasificación con el backend configurado.
+    La interfaz es la misma en ambos casos (transformers.pipeline), así que los
+    servicios no necesitan saber qué backend están usando.
+    transformers se importa aquí para no pagar su coste al importar el módulo.
+    strict=True: si se pide onnx y no se puede usar, lanza en lugar de caer a torch.
+    """
+    from transformers import pipeline
+
+    if strict and (backend or NLP_INFERENCE_BACKEND).lower() == "onnx":
+        if not onnx_available():
+            raise RuntimeError("optimum[onnxruntime] no está instalado")
+        return _build_onnx_classifier(task, model_id, **pipeline_kwargs)
+
+    backend = resolve_backend(backend)
+
+    if backend == "onnx":
+        try:
+            return _build_onnx_classifier(task, model_id, **dict(pipeline_kwargs))
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar {model_id} en ONNX, usando torch: {e}")
+
+    # Si existe la copia local en safetensors, cargarla en lugar del hub
+    local_dir = safetensors_model_dir(model_id)
+    if os.path.exists(os.path.join(local_dir, "model.safetensors")):
+        return pipeline(
+            task,
+            model=local_dir,
+            tokenizer=local_dir,
+            model_kwargs={"use_safetensors": True},
+            **pipeline_kwargs
+        )
+
+    return pipeline(task, model=model_id, tokenizer=model_id, **pipeline_kwargs)
+
+
+# ============================================
+# VERIFICACIÓN DE PARIDAD ONNX vs PYTORCH
+# ============================================
+
+PARITY_SAMPLE_TEXTS = [
+    "hola",
+    "gracias por escucharme",
+    "me siento muy triste y solo",
+    "hoy fue un día increíble, estoy feliz",
+    "tengo mucha ansiedad por el examen de mañana",
+    "estoy harto de que nadie me entienda",
+    "no sé qué hacer con mi vida",
+    "me da miedo lo que pueda pasar",
+    "ya no aguanto más",
+    "estoy tranquilo, todo bien",
+]
+
+
+def _top(result) -> Dict:
+    items = result if isinstance(result, list) else [result]
+    return max(items, key=lambda x: x["score"])
+
+
+def check_parity(model_id: str, task: str, texts: List[str],
+                 min_agreement: float = 0.98,
+                 max_score_diff: float = 0.05) -> Dict:
+    """
+    Ejecuta el mismo modelo en PyTorch y en ONNX int8 y compara:
+    - acuerdo de la etiqueta dominante
+    - diferencia máxima de score en la etiqueta dominante
+    - latencia media por texto
+    El lado ONNX se construye en modo estricto: si no se puede cargar, o el
+    modelo del pipeline no es un ORTModel*, el informe sale con ok=False y el
+    motivo (nunca se comparan dos pipelines de PyTorch).
+    """
+    informe = {"model": model_id}
+    try:
+        onnx_pipe = build_text_classifier(task, model_id, backend="onnx", strict=True, top_k=None)
+    except Exception as e:
+        return {**informe, "ok": False, "reason": f"ONNX no disponible: {e}"}
+    modelo_onnx = type(onnx_pipe.model).__name__
+    if not modelo_onnx.startswith("ORTModel"):
+        return {**informe, "ok": False, "reason": f"el pipeline ONNX usa {modelo_onnx}, no un ORTModel"}
+
+    torch_pipe = build_text_classifier(task, model_id, backend="torch", top_k=None)
+
+    def run(pipe):
+        start = time.perf_counter()
+        outputs = [pipe(text)[0] for text in texts]
+        return outputs, (time.perf_counter() - start) / len(texts) * 1000
+
+    torch_outputs, torch_ms = run(torch_pipe)
+    onnx_outputs, onnx_ms = run(onnx_pipe)
+
+    agreements = 0
+    max_diff = 0.0
+    for torch_out, onnx_out in zip(torch_outputs, onnx_outputs):
+        torch_top, onnx_top = _top(torch_out), _top(onnx_out)
+        if torch_top["label"] == onnx_top["label"]:
+            agreements += 1
+        onnx_scores = {item["label"]: item["score"] for item in onnx_out}
+        max_diff = max(max_diff, abs(torch_top["score"] - onnx_scores.get(torch_top["label"], 0.0)))
+
+    agreement = agreements / len(texts)
+    return {
+        **informe,
+        "onnx_model_class": modelo_onnx,
+        "agreement": round(agreement, 4),
+        "max_score_diff": round(max_diff, 4),
+        "torch_ms_per_text": round(torch_ms, 2),
+        "onnx_ms_per_text": round(onnx_ms, 2),
+        "speedup": round(torch_ms / onnx_ms, 2) if onnx_ms else 0,
+        "ok": agreement >= min_agreement and max_diff <= max_score_diff
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Exportación ONNX int8 y verificación de paridad')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Exportar y cuantizar modelos')
+    export_parser.add_argument('model_id', nargs='?', help='Modelo concreto (por defecto todos)')
+    export_parser.add_argument('--force', action='store_true', help='Re-exportar aunque ya exista')
+
+    safetensors_parser = subparsers.add_parser('safetensors', help='Convertir checkpoints a safetensors')
+    safetensors_parser.add_argument('model_id', nargs='?', help='Modelo concreto (por defecto todos)')
+    safetensors_parser.add_argument('--force', action='store_true', help='Re-convertir aunque ya exista')
+
+    parity_parser = subparsers.add_parser('parity', help='Comparar ONNX contra PyTorch')
+    parity_parser.add_argument('--texts-file', help='Archivo con un texto por línea')
+    parity_parser.add_argument('--min-agreement', type=float, default=0.98)
+    parity_parser.add_argument('--max-score-diff', type=float, default=0.05)
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        models_to_export = [args.model_id] if args.model_id else list(KNOWN_MODELS)
+        for model_id in models_to_export:
+            export_onnx_quantized(model_id, force=args.force)
+        sys.exit(0)
+
+    if args.command == 'safetensors':
+        models_to_convert = [args.model_id] if args.model_id else list(KNOWN_MODELS)
+        for model_id in models_to_convert:
+            export_safetensors(model_id, force=args.force)
+        sys.exit(0)
+
+    texts = PARITY_SAMPLE_TEXTS
+    if args.texts_file:
+        with open(args.texts_file, encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    all_ok = True
+    for model_id, task in KNOWN_MODELS.items():
+        report = check_parity(model_id, task, texts, args.min_agreement, args.max_score_diff)
+        all_ok = all_ok and report["ok"]
+        print(f"{'✅' if report['ok'] else '❌'} {model_id}")
+        if "reason" in report:
+            print(f"   {report['reason']}")
+            continue
+        print(f"   Acuerdo de etiqueta: {report['agreement']:.2%} | Δ score máx: {report['max_score_diff']}")
+        print(f"   Latencia: torch {report['torch_ms_per_text']} ms | onnx {report['onnx_ms_per_text']} ms (x{report['speedup']})")
+
+    sys.exit(0 if all_ok else 1)
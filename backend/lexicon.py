@@ -0,0 +1,165 @@
+# backend/lexicon.py
+# ✅ MOTOR DE LÉXICOS (Aho-Corasick)
+# Un autómata por léxico, construido una vez al importar. Cada texto se
+# normaliza una sola vez (minúsculas, sin tildes) y se recorre en una pasada:
+# el coste depende de la longitud del texto, no del número de palabras clave.
+#
+# La semántica es la de `keyword in text_lower`: coincidencia por subcadena,
+# cada palabra clave cuenta como máximo una vez por texto.
+
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Set, Union
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin tildes/diéresis y espacios colapsados"""
+    text = unicodedata.normalize("NFD", (text or "").lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return _WHITESPACE.sub(" ", text)
+
+
+class LexiconMatch(NamedTuple):
+    category: str
+    keyword: str
+    weight: float
+
+
+class LexiconResult:
+    """Coincidencias de un texto, agrupables por categoría"""
+
+    def __init__(self, matches: List[LexiconMatch]):
+        self.matches = matches
+
+    def by_category(self, category: str) -> List[LexiconMatch]:
+        return [m for m in self.matches if m.category == category]
+
+    def has(self, category: str) -> bool:
+        return any(m.category == category for m in self.matches)
+
+    def count(self, category: str) -> int:
+        return len(self.by_category(category))
+
+    def weight(self, category: str) -> float:
+        return sum(m.weight for m in self.matches if m.category == category)
+
+    def categories(self) -> Set[str]:
+        return {m.category for m in self.matches}
+
+    @property
+    def total_weight(self) -> float:
+        return sum(m.weight for m in self.matches)
+
+    def __bool__(self) -> bool:
+        return bool(self.matches)
+
+    def __len__(self) -> int:
+        return len(self.matches)
+
+
+class Lexicon:
+    """
+    Autómata Aho-Corasick sobre categorías de palabras clave con peso.
+    `groups` = {categoria: {keyword: peso}} o {categoria: [keywords]} (peso 1).
+    """
+
+    def __init__(self, groups: Dict[str, Union[Dict[str, float], Iterable[str]]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[LexiconMatch]] = [[]]
+        self.size = 0
+
+        for category, keywords in groups.items():
+            items = keywords.items() if isinstance(keywords, dict) else ((k, 1.0) for k in keywords)
+            for keyword, weight in items:
+                self._add(normalize_text(keyword), LexiconMatch(category, keyword, weight))
+
+        self._build_failure_links()
+
+    def _add(self, pattern: str, match: LexiconMatch):
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(match)
+        self.size += 1
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target
+                # Hereda las salidas del sufijo más largo (p. ej. "morir" dentro de "quiero morir")
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def scan(self, text: str) -> LexiconResult:
+        """Todas las palabras clave presentes en el texto, en una sola pasada"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        seen = set()
+        matches = []
+
+        for char in normalize_text(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for match in output[node]:
+                if match not in seen:
+                    seen.add(match)
+                    matches.append(match)
+
+        return LexiconResult(matches)
+
+
+# ============================================
+# LÉXICOS DEL BACKEND
+# ============================================
+
+# AdvancedEmotionAnalyzer: riesgo y necesidades terapéuticas
+ADVANCED_LEXICON = Lexicon({
+    "crisis": [
+        'suicidio', 'matarme', 'acabar con todo', 'no quiero vivir',
+        'hacerme daño', 'terminar con mi vida', 'morir', 'muerte',
+        'no aguanto más', 'ya no puedo', 'sin salida', 'desesperado'
+    ],
+    "desesperanza": [
+        'no tiene sentido', 'nada importa', 'todo está perdido',
+        'no hay esperanza', 'nunca mejorará', 'siempre será así'
+    ],
+    "ansiedad": ['ansiedad', 'ansioso', 'nervioso', 'preocupado', 'agobiado'],
+    "duelo": ['perdí', 'falleció', 'murió', 'extraño', 'duelo', 'luto'],
+    "social": ['solo', 'aislado', 'nadie me entiende', 'sin amigos'],
+    "autoestima": ['inútil', 'fracaso', 'no sirvo', 'no valgo', 'incapaz'],
+})
+
+# Guarda de seguridad del fast path (nlp_fast_path.py): cualquier coincidencia
+# obliga a pasar por los modelos completos
+CRISIS_LEXICON = Lexicon({
+    "crisis": [
+        'suicid', 'matarme', 'matar me', 'quitarme la vida', 'acabar con mi vida',
+        'acabar con todo', 'terminar con todo', 'terminar con mi vida',
+        'no quiero vivir', 'quiero morir', 'mejor muerto', 'mejor muerta',
+        'no vale la pena', 'quiero desaparecer', 'morir', 'muerte',
+        'hacerme daño', 'lastimarm', 'cortarme', 'pegarme',
+        'no aguanto', 'no puedo más', 'ya no puedo', 'no soporto',
+        'sin salida', 'no hay salida', 'sin esperanza', 'no tiene sentido',
+        'nada importa', 'desesperad', 'vacío', 'solo y abandonado'
+    ]
+})
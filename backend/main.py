@@ -3,10 +3,13 @@
 
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional
+import os
+import threading
 
 # ==================== IMPORTACIONES LOCALES ====================
 import auth  # ✅ auth está en backend/auth.py (raíz)
@@ -206,6 +209,9 @@ except Exception as e:
 
 # ==================== EVENTOS ====================
 
+# Cargar los modelos NLP en segundo plano al arrancar (si no, se cargan en el primer mensaje)
+NLP_WARMUP = os.getenv("NLP_WARMUP", "true").lower() == "true"
+
 @app.on_event("startup")
 async def startup_event():
     """Inicialización al arrancar"""
@@ -226,6 +232,17 @@ async def startup_event():
     except Exception as e:
         print(f"⚠️ Scheduler no disponible: {e}")
     
+    # Cliente HTTP compartido hacia Rasa (pool de conexiones keep-alive)
+    from rasa_client import rasa_client
+    await rasa_client.start()
+    
+    # Warm-up de modelos NLP en segundo plano: el worker acepta tráfico ya,
+    # y /health/ready responde 503 hasta que los modelos estén cargados
+    if 'chat_rasa' in routers_disponibles and NLP_WARMUP:
+        from nlp_service import nlp_service
+        threading.Thread(target=nlp_service.warm_up, name="nlp-warmup", daemon=True).start()
+        print("🔥 Warm-up de modelos NLP iniciado en segundo plano")
+    
     print("\n📊 RESUMEN DE ROUTERS:")
     print(f"  ✅ Disponibles: {len(routers_disponibles)}")
     if routers_disponibles:
@@ -247,6 +264,19 @@ async def shutdown_event():
     """Cierre de la aplicación"""
     print("\n🛑 Cerrando Sistema de Seguimiento Emocional...")
 
+    from rasa_client import rasa_client
+    await rasa_client.close()
+
+    # Vaciar la cola de escrituras diferidas antes de cerrar
+    from write_behind import write_behind
+    write_behind.shutdown(timeout=10.0)
+
+    from mongodb_async import async_mongodb_service
+    async_mongodb_service.close()
+
+    from blocking_executor import blocking_executor
+    blocking_executor.shutdown(wait=True)
+
 # ==================== ENDPOINTS DE INFORMACIÓN ====================
 
 @app.get("/")
@@ -270,6 +300,63 @@ async def health_check():
         "total_routers": len(routers_disponibles)
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: el proceso responde (no depende de los modelos)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 200 solo cuando los modelos NLP están cargados"""
+    modelos = {}
+    listo = True
+
+    if 'chat_rasa' in routers_disponibles:
+        from nlp_service import nlp_service
+        modelos["nlp_service"] = nlp_service.status()
+        listo = nlp_service.is_ready()
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if listo else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "ready" if listo else "not_ready",
+            "models": modelos
+        }
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas internas de los componentes de rendimiento"""
+    from blocking_executor import blocking_executor
+    from analysis_cache import all_cache_stats
+    from model_registry import model_registry
+    from write_behind import write_behind
+    from conversation_context_cache import context_cache
+    from llm_streaming import stream_metrics
+
+    metricas = {
+        "blocking_executor": blocking_executor.stats(),
+        "analysis_cache": all_cache_stats(),
+        "write_behind": write_behind.stats(),
+        "conversation_context_cache": context_cache.stats(),
+        "llm_streaming": stream_metrics.stats(),
+        "model_registry": model_registry.memory_report()
+    }
+
+    if 'chat_rasa' in routers_disponibles:
+        from nlp_batcher import nlp_batcher
+        from nlp_fast_path import fast_path
+        metricas["nlp_batcher"] = nlp_batcher.stats()
+        from rasa_client import rasa_client
+        metricas["nlp_fast_path"] = fast_path.stats()
+        metricas["rasa_client"] = rasa_client.stats()
+        from ws_sessions import ws_sessions
+        metricas["chat_ws"] = ws_sessions.stats()
+        from routers.chat_rasa import metadata_nlp_stats
+        metricas["chat_nlp_metadata"] = metadata_nlp_stats.stats()
+
+    return metricas
+
 @app.get("/api")
 async def api_info():
     """Información de la API"""
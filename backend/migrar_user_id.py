@@ -0,0 +1,150 @@
+# backend/migrar_user_id.py
+# ✅ MIGRACIÓN: user_id EN MONGODB A ENTERO
+# chat_rasa guardaba user_id como string ("7") y MongoDBService como int (7).
+# Con tipos mezclados un mismo usuario ocupa dos rangos del índice y las
+# consultas con un tipo no ven los documentos del otro.
+#
+# Recorre cada colección por _id en lotes, convierte los user_id string
+# (también "paciente_7") con canonical_user_id y guarda un checkpoint tras
+# cada lote: si se interrumpe, vuelve a empezar donde quedó.
+#
+# Al terminar recalcula chat_user_stats desde chat_messages (ya con user_id
+# entero). Es el paso previo al despliegue de los contadores: se ejecuta con
+# el backend parado, para que el historial esté contado antes del primer $inc.
+#
+# Uso:
+#   python migrar_user_id.py --dry-run           # solo contar
+#   python migrar_user_id.py                     # migrar (reanuda si hay checkpoint)
+#   python migrar_user_id.py --collections chat_messages --batch-size 500
+#   python migrar_user_id.py --reset             # ignorar el checkpoint anterior
+#   python migrar_user_id.py --skip-stats        # no recalcular chat_user_stats
+
+import json
+import os
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from mongodb_config import get_database, canonical_user_id
+import chat_user_stats
+
+COLECCIONES = ["chat_messages", "chat_logs", "emotional_texts", "notifications"]
+CHECKPOINT_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "migrar_user_id.checkpoint.json"
+)
+FILTRO_STRING = {"user_id": {"$type": "string"}}
+
+
+def cargar_checkpoint(path: str = CHECKPOINT_FILE) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_checkpoint(checkpoint: Dict, path: str = CHECKPOINT_FILE):
+    # Escritura atómica: un corte a mitad no deja el checkpoint corrupto
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+def migrar_coleccion(db, nombre: str, checkpoint: Dict, batch_size: int,
+                     dry_run: bool = False) -> Dict:
+    """Convierte los user_id string de una colección; devuelve contadores"""
+    estado = checkpoint.setdefault(nombre, {"last_id": None, "migrados": 0, "invalidos": []})
+    coleccion = db[nombre]
+    resultado = {"leidos": 0, "migrados": 0, "invalidos": 0}
+
+    while True:
+        filtro = dict(FILTRO_STRING)
+        if estado["last_id"]:
+            filtro["_id"] = {"$gt": ObjectId(estado["last_id"])}
+
+        lote = list(coleccion.find(filtro, {"user_id": 1}).sort("_id", 1).limit(batch_size))
+        if not lote:
+            break
+
+        operaciones: List[UpdateOne] = []
+        for doc in lote:
+            try:
+                nuevo = canonical_user_id(doc["user_id"])
+            except (TypeError, ValueError):
+                # No convertible: se deja como está y se anota para revisarlo a mano
+                resultado["invalidos"] += 1
+                estado["invalidos"].append(str(doc["_id"]))
+                continue
+            # El filtro incluye el valor viejo: si otro proceso lo cambió, no se pisa
+            operaciones.append(UpdateOne(
+                {"_id": doc["_id"], "user_id": doc["user_id"]},
+                {"$set": {"user_id": nuevo}}
+            ))
+
+        if dry_run:
+            migrados_lote = len(operaciones)
+        elif operaciones:
+            migrados_lote = coleccion.bulk_write(operaciones, ordered=False).modified_count
+        else:
+            migrados_lote = 0
+
+        resultado["leidos"] += len(lote)
+        resultado["migrados"] += migrados_lote
+        estado["migrados"] += migrados_lote
+        estado["last_id"] = str(lote[-1]["_id"])
+        if not dry_run:
+            guardar_checkpoint(checkpoint)
+
+        print(f"  {nombre}: {resultado['leidos']} leídos, {resultado['migrados']} migrados "
+              f"(último _id {estado['last_id']})")
+
+    return resultado
+
+
+def migrar(colecciones: Optional[List[str]] = None, batch_size: int = 1000,
+           dry_run: bool = False, reset: bool = False, stats: bool = True) -> Dict:
+    db = get_database()
+    checkpoint = {} if reset else cargar_checkpoint()
+    if dry_run:
+        # En dry-run se recorre todo sin tocar el checkpoint real
+        checkpoint = {}
+
+    resumen = {}
+    for nombre in colecciones or COLECCIONES:
+        pendientes = db[nombre].count_documents(FILTRO_STRING)
+        print(f"\n📦 {nombre}: {pendientes} documentos con user_id string")
+        resumen[nombre] = migrar_coleccion(db, nombre, checkpoint, batch_size, dry_run)
+
+    if not dry_run:
+        guardar_checkpoint(checkpoint)
+        if stats:
+            print(f"\n📊 Recalculando {chat_user_stats.STATS_COLLECTION} desde chat_messages...")
+            usuarios = chat_user_stats.rebuild(db)
+            print(f"   {usuarios} usuario(s)")
+    return resumen
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Migra user_id de MongoDB a entero (reanudable)')
+    parser.add_argument('--collections', nargs='+', choices=COLECCIONES,
+                        help='Colecciones a migrar (por defecto todas)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documentos por lote')
+    parser.add_argument('--dry-run', action='store_true', help='Solo contar, sin escribir')
+    parser.add_argument('--reset', action='store_true', help='Empezar desde cero ignorando el checkpoint')
+    parser.add_argument('--skip-stats', action='store_true', help='No recalcular chat_user_stats al terminar')
+
+    args = parser.parse_args()
+
+    resumen = migrar(args.collections, args.batch_size, args.dry_run, args.reset,
+                     stats=not args.skip_stats)
+
+    print(f"\n{'='*60}")
+    print(f"{'🔍 DRY RUN' if args.dry_run else '✅ MIGRACIÓN'} - RESUMEN")
+    print(f"{'='*60}")
+    for nombre, r in resumen.items():
+        print(f"  {nombre:<16} leídos={r['leidos']:<8} migrados={r['migrados']:<8} inválidos={r['invalidos']}")
+    if any(r["invalidos"] for r in resumen.values()):
+        print(f"\n⚠️ Los _id no convertibles están en {CHECKPOINT_FILE}")
@@ -0,0 +1,139 @@
+# backend/model_registry.py
+# ✅ REGISTRO GLOBAL DE MODELOS
+# Un mismo checkpoint (modelo + tarea + dispositivo) se carga UNA vez por proceso
+# y se comparte entre nlp_service, advanced_chatbot_service, etc.
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from inference_backend import build_text_classifier, resolve_backend
+
+# Dispositivo por defecto: -1 = CPU, 0 = primera GPU
+NLP_DEVICE = int(os.getenv("NLP_DEVICE", "-1"))
+
+
+def _rss_bytes() -> int:
+    """RSS actual del proceso (Linux); 0 si no está disponible"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _parameter_bytes(pipe) -> int:
+    """Tamaño de los pesos: parámetros de PyTorch o archivo .onnx"""
+    model = getattr(pipe, "model", None)
+    if model is None:
+        return 0
+
+    if hasattr(model, "parameters"):
+        try:
+            return sum(p.numel() * p.element_size() for p in model.parameters())
+        except Exception:
+            pass
+
+    model_path = getattr(model, "model_path", None)
+    if model_path and os.path.exists(str(model_path)):
+        return os.path.getsize(str(model_path))
+    return 0
+
+
+class SharedPipeline:
+    """
+    Envoltorio de un pipeline compartido.
+    Los pipelines de transformers (y los tokenizers rápidos) no son seguros
+    para llamadas concurrentes, así que cada llamada toma el lock del modelo.
+    """
+
+    def __init__(self, pipe, key: Tuple):
+        self._pipe = pipe
+        self._lock = threading.Lock()
+        self.key = key
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            return self._pipe(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pipe, name)
+
+
+class ModelRegistry:
+    """Entrega instancias compartidas de pipelines, indexadas por modelo/tarea/dispositivo"""
+
+    def __init__(self):
+        self._pipelines: Dict[Tuple, SharedPipeline] = {}
+        self._info: Dict[Tuple, Dict] = {}
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _make_key(self, model_id: str, task: str, device: int,
+                  backend: str, pipeline_kwargs: Dict) -> Tuple:
+        return (model_id, task, device, backend, tuple(sorted(pipeline_kwargs.items())))
+
+    def get_pipeline(self, task: str, model_id: str,
+                     device: Optional[int] = None,
+                     backend: Optional[str] = None,
+                     **pipeline_kwargs) -> SharedPipeline:
+        """Devuelve el pipeline compartido, cargándolo si es la primera vez"""
+        device = NLP_DEVICE if device is None else device
+        backend = resolve_backend(backend)
+        key = self._make_key(model_id, task, device, backend, pipeline_kwargs)
+
+        shared = self._pipelines.get(key)
+        if shared is not None:
+            return shared
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Lock por clave: dos modelos distintos pueden cargarse en paralelo
+        with key_lock:
+            shared = self._pipelines.get(key)
+            if shared is not None:
+                return shared
+
+            print(f"📥 Cargando modelo {model_id} ({task}, device={device}, {backend})...")
+            rss_before = _rss_bytes()
+            started_at = time.monotonic()
+
+            pipe = build_text_classifier(task, model_id, backend=backend, device=device, **pipeline_kwargs)
+            shared = SharedPipeline(pipe, key)
+
+            self._info[key] = {
+                "model_id": model_id,
+                "task": task,
+                "device": device,
+                "backend": backend,
+                "load_seconds": round(time.monotonic() - started_at, 2),
+                "parameter_mb": round(_parameter_bytes(pipe) / 1024 ** 2, 1),
+                "rss_delta_mb": round((_rss_bytes() - rss_before) / 1024 ** 2, 1)
+            }
+            self._pipelines[key] = shared
+            print(f"✅ Modelo {model_id} cargado ({self._info[key]['rss_delta_mb']} MB RSS)")
+
+        return shared
+
+    def loaded_models(self) -> List[str]:
+        return [info["model_id"] for info in self._info.values()]
+
+    def memory_report(self) -> Dict:
+        """Memoria residente por modelo y total del proceso"""
+        models = []
+        for key, info in self._info.items():
+            models.append({**info, "calls": self._pipelines[key].calls})
+
+        return {
+            "process_rss_mb": round(_rss_bytes() / 1024 ** 2, 1),
+            "models_loaded": len(models),
+            "models": models
+        }
+
+
+# Instancia global del registro
+model_registry = ModelRegistry()
@@ -0,0 +1,229 @@
+# backend/mongo_indexes.py
+# ✅ ÍNDICES DE MONGODB (DECLARATIVOS)
+# Un solo lugar con los índices de cada colección y las consultas calientes
+# que deben usarlos. Crear índices que ya existen es un no-op, así que se
+# aplican en cada arranque (MongoDBService) sin coste.
+#
+# Uso:
+#   python mongo_indexes.py apply              # crear los que falten
+#   python mongo_indexes.py check --user-id 7  # explain() de las consultas calientes
+#   python mongo_indexes.py list               # índices existentes vs. declarados
+#
+# `check` termina con código 1 si alguna consulta caliente hace COLLSCAN.
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from mongo_pipelines import (
+    emotional_patterns_pipeline, high_risk_entries_pipeline, engagement_pipeline,
+    conversation_context_pipeline
+)
+
+# Códigos de MongoDB: mismo nombre o mismas claves con otras opciones
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+# ============================================
+# ESPECIFICACIÓN
+# ============================================
+# Sin `name` explícito: pymongo genera el nombre por defecto (user_id_1_timestamp_-1),
+# el mismo que tenían los índices creados antes con create_index.
+
+INDEX_SPEC: Dict[str, List[IndexModel]] = {
+    # Chat con Rasa (routers/chat_rasa.py)
+    "chat_messages": [
+        # historial paginado por (timestamp, _id), último mensaje, borrado
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        # conteos por is_bot y emociones frecuentes (solo mensajes del paciente)
+        IndexModel([("user_id", ASCENDING), ("is_bot", ASCENDING), ("timestamp", DESCENDING)]),
+    ],
+    # Chat avanzado (MongoDBService / ConversationMemory)
+    "chat_logs": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+        # get_user_engagement_stats
+        IndexModel([("user_id", ASCENDING), ("is_bot", ASCENDING), ("timestamp", DESCENDING)]),
+    ],
+    "emotional_texts": [
+        # patrones y engagement por ventana de tiempo
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+        # scheduler diario y borrado del historial del chat (filtran por source)
+        IndexModel([("user_id", ASCENDING), ("source", ASCENDING), ("timestamp", DESCENDING)]),
+        # daemon: todas las entradas recientes de un source
+        IndexModel([("source", ASCENDING), ("timestamp", DESCENDING)]),
+        # get_high_risk_entries: índice parcial, solo las entradas de riesgo alto
+        IndexModel(
+            [("user_id", ASCENDING), ("risk_assessment.level", ASCENDING), ("timestamp", DESCENDING)],
+            partialFilterExpression={"risk_assessment.level": "alto"}
+        ),
+    ],
+    "notifications": [
+        IndexModel([("user_id", ASCENDING), ("sent", ASCENDING)]),
+        # get_pending_notifications: parcial, solo las no enviadas
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING)],
+            partialFilterExpression={"sent": False}
+        ),
+    ],
+    # Caché compartida de análisis (analysis_cache.py): TTL sobre expires_at
+    "analysis_cache": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+
+def ensure_indexes(db, collections: Optional[List[str]] = None) -> Dict[str, List[str]]:
+    """
+    Crea los índices declarados (idempotente). Devuelve {colección: [nombres]}.
+    Un conflicto (mismo índice con otras opciones) se informa y no detiene el resto.
+    """
+    creados: Dict[str, List[str]] = {}
+    for collection, models in INDEX_SPEC.items():
+        if collections and collection not in collections:
+            continue
+        for model in models:
+            try:
+                creados.setdefault(collection, []).extend(
+                    db[collection].create_indexes([model])
+                )
+            except OperationFailure as e:
+                if e.code in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                    print(f"⚠️ Índice en conflicto en {collection} {model.document['key']}: {e.details.get('errmsg', e)}")
+                else:
+                    raise
+    return creados
+
+
+# ============================================
+# CONSULTAS CALIENTES
+# ============================================
+
+def hot_queries(user_id) -> List[Dict]:
+    """Consultas que deben resolverse con índice (mismas formas que el código)"""
+    desde = datetime.utcnow() - timedelta(days=30)
+    hoy = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    return [
+        {"name": "chat historial", "collection": "chat_messages",
+         "filter": {"user_id": user_id}, "sort": [("timestamp", -1), ("_id", -1)]},
+        {"name": "chat historial (página anterior)", "collection": "chat_messages",
+         "filter": {"user_id": user_id, "$or": [
+             {"timestamp": {"$lt": desde}},
+             {"timestamp": desde, "_id": {"$lt": ObjectId.from_datetime(desde)}}
+         ]},
+         "sort": [("timestamp", -1), ("_id", -1)]},
+        {"name": "chat conteo por is_bot", "collection": "chat_messages",
+         "filter": {"user_id": user_id, "is_bot": False}},
+        {"name": "chat emociones frecuentes", "collection": "chat_messages",
+         "pipeline": [
+             {"$match": {"user_id": user_id, "is_bot": False,
+                         "emotional_analysis.emotions.dominant_emotion": {"$exists": True}}},
+             {"$group": {"_id": "$emotional_analysis.emotions.dominant_emotion", "count": {"$sum": 1}}}
+         ]},
+        {"name": "chat_logs contexto", "collection": "chat_logs",
+         "filter": {"user_id": user_id}, "sort": [("timestamp", -1)]},
+        {"name": "contexto chat avanzado (una agregación)", "collection": "chat_logs",
+         "pipeline": conversation_context_pipeline(user_id, desde)},
+        {"name": "engagement (chat_logs + emotional_texts)", "collection": "chat_logs",
+         "pipeline": engagement_pipeline(user_id, desde)},
+        {"name": "emotional_texts patrones", "collection": "emotional_texts",
+         "pipeline": emotional_patterns_pipeline(user_id, desde)},
+        {"name": "emotional_texts riesgo alto", "collection": "emotional_texts",
+         "pipeline": high_risk_entries_pipeline(user_id, desde, limit=5)},
+        {"name": "emotional_texts scheduler diario", "collection": "emotional_texts",
+         "filter": {"user_id": user_id, "source": "chat_rasa", "timestamp": {"$gte": hoy}}},
+        {"name": "emotional_texts daemon", "collection": "emotional_texts",
+         "filter": {"source": "chat", "timestamp": {"$gte": desde}}, "sort": [("timestamp", -1)]},
+        {"name": "notificaciones pendientes", "collection": "notifications",
+         "filter": {"user_id": user_id, "sent": False}, "sort": [("created_at", -1)]},
+    ]
+
+
+def _winning_stages(explain: Dict) -> List[str]:
+    """Etapas de los planes ganadores (find y aggregate anidan distinto)"""
+    stages = []
+
+    def visit(node, in_winning: bool):
+        if isinstance(node, dict):
+            if in_winning and "stage" in node:
+                stages.append(node["stage"])
+            for key, value in node.items():
+                if key == "rejectedPlans":
+                    continue
+                visit(value, in_winning or key in ("winningPlan", "queryPlan"))
+        elif isinstance(node, list):
+            for item in node:
+                visit(item, in_winning)
+
+    visit(explain, False)
+    return stages
+
+
+def explain_query(db, query: Dict) -> Dict:
+    collection = query["collection"]
+    if "pipeline" in query:
+        command = {"aggregate": collection, "pipeline": query["pipeline"], "cursor": {}}
+    else:
+        command = {"find": collection, "filter": query["filter"]}
+        if query.get("sort"):
+            command["sort"] = dict(query["sort"])
+    return db.command("explain", command, verbosity="queryPlanner")
+
+
+def check_query_plans(db, user_id) -> List[Dict]:
+    """explain() de cada consulta caliente; collscan=True si no usa índice"""
+    resultados = []
+    for query in hot_queries(user_id):
+        stages = _winning_stages(explain_query(db, query))
+        resultados.append({
+            "name": query["name"],
+            "collection": query["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return resultados
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from mongodb_config import get_database
+
+    parser = argparse.ArgumentParser(description='Índices de MongoDB y verificación de planes')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('apply', help='Crear los índices declarados que falten')
+    check = sub.add_parser('check', help='explain() de las consultas calientes; falla si hay COLLSCAN')
+    check.add_argument('--user-id', type=int, default=1, help='user_id de ejemplo para las consultas')
+    check.add_argument('--apply', action='store_true', help='Aplicar los índices antes de verificar')
+    sub.add_parser('list', help='Índices existentes frente a los declarados')
+
+    args = parser.parse_args()
+    db = get_database()
+
+    if args.comando == 'apply' or (args.comando == 'check' and args.apply):
+        for collection, nombres in ensure_indexes(db).items():
+            print(f"✅ {collection}: {', '.join(nombres)}")
+
+    if args.comando == 'check':
+        resultados = check_query_plans(db, args.user_id)
+        for r in resultados:
+            marca = "❌" if r["collscan"] else "✅"
+            print(f"{marca} {r['name']:<35} {r['collection']:<16} {' > '.join(r['stages'])}")
+        fallidas = [r for r in resultados if r["collscan"]]
+        if fallidas:
+            print(f"\n❌ {len(fallidas)} consulta(s) con COLLSCAN")
+            sys.exit(1)
+        print(f"\n✅ Todas las consultas calientes usan índice")
+
+    elif args.comando == 'list':
+        for collection, models in INDEX_SPEC.items():
+            existentes = set(db[collection].index_information())
+            print(f"\n📚 {collection}")
+            for model in models:
+                nombre = model.document["name"]
+                print(f"  {'✅' if nombre in existentes else '❌'} {nombre}")
+            for extra in sorted(existentes - {m.document['name'] for m in models} - {'_id_'}):
+                print(f"  ➕ {extra} (no declarado)")
@@ -0,0 +1,212 @@
+# backend/mongo_pipelines.py
+# ✅ PIPELINES DE AGREGACIÓN COMPARTIDOS
+# Los usan MongoDBService (pymongo) y AsyncMongoDBService (motor): el cálculo
+# se hace en el servidor y vuelve un solo documento en lugar de todo el rango.
+#
+# Devuelven lo mismo que los bucles en Python que reemplazan: solo se leen
+# emotions / sentiment / risk_assessment en la raíz del documento (como antes,
+# los documentos de chat_rasa, con esos campos dentro de emotional_analysis,
+# cuentan en total_entries pero no en emociones, sentimiento ni riesgo).
+# tests/test_mongo_pipelines.py compara ambas versiones.
+#
+# engagement_pipeline y conversation_context_pipeline usan $unionWith:
+# requieren MongoDB >= 4.4.
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+# ============================================
+# PATRONES EMOCIONALES
+# ============================================
+
+def emotional_patterns_pipeline(user_id: int, start_date: datetime) -> List[Dict]:
+    """Conteo por emoción dominante, suma de sentimiento y alertas de riesgo alto"""
+    return [
+        {"$match": {"user_id": user_id, "timestamp": {"$gte": start_date}}},
+        {"$project": {
+            "_id": 0,
+            "emotion": "$emotions.dominant_emotion",
+            "sentiment": "$sentiment.sentiment_score",
+            "risk": "$risk_assessment.level"
+        }},
+        {"$facet": {
+            "totales": [
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    # $sum ignora lo que no es numérico (null, ausentes)
+                    "sentiment_sum": {"$sum": "$sentiment"},
+                    "high_risk": {"$sum": {"$cond": [{"$eq": ["$risk", "alto"]}, 1, 0]}}
+                }}
+            ],
+            "emociones": [
+                {"$match": {"emotion": {"$nin": [None, ""]}}},
+                {"$group": {"_id": "$emotion", "count": {"$sum": 1}}}
+            ]
+        }}
+    ]
+
+
+def emotional_patterns_from_facet(resultado: List[Dict], days: int) -> Dict:
+    """Mismo formato que devolvía get_emotional_patterns con el bucle en Python"""
+    facet = resultado[0] if resultado else {}
+    totales = (facet.get("totales") or [{}])[0]
+    total = totales.get("total", 0)
+
+    if not total:
+        return {
+            "total_entries": 0,
+            "dominant_emotions": {},
+            "average_sentiment": 0,
+            "risk_alerts": 0
+        }
+
+    return {
+        "total_entries": total,
+        "dominant_emotions": {e["_id"]: e["count"] for e in facet.get("emociones", [])},
+        "average_sentiment": totales.get("sentiment_sum", 0) / total,
+        "risk_alerts": totales.get("high_risk", 0),
+        "period_days": days
+    }
+
+
+# ============================================
+# ENTRADAS DE ALTO RIESGO
+# ============================================
+
+def high_risk_entries_pipeline(user_id: int, start_date: datetime,
+                               limit: Optional[int] = None) -> List[Dict]:
+    """
+    Entradas de riesgo alto (documentos completos), más recientes primero.
+    El $match coincide con el índice parcial de mongo_indexes (risk_assessment.level = "alto").
+    """
+    pipeline = [
+        {"$match": {
+            "user_id": user_id,
+            "timestamp": {"$gte": start_date},
+            "risk_assessment.level": "alto"
+        }},
+        {"$sort": {"timestamp": -1}}
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return pipeline
+
+
+# ============================================
+# ENGAGEMENT
+# ============================================
+
+def engagement_pipeline(user_id: int, start_date: datetime) -> List[Dict]:
+    """
+    Se ejecuta sobre chat_logs; $unionWith (MongoDB >= 4.4) añade emotional_texts
+    y un solo $group cuenta ambas colecciones en la misma ida y vuelta.
+    """
+    return [
+        {"$match": {"user_id": user_id, "is_bot": False, "timestamp": {"$gte": start_date}}},
+        {"$project": {"_id": 0, "tipo": {"$literal": "chat"}}},
+        {"$unionWith": {
+            "coll": "emotional_texts",
+            "pipeline": [
+                {"$match": {"user_id": user_id, "timestamp": {"$gte": start_date}}},
+                {"$project": {"_id": 0, "tipo": {"$literal": "texto"}}}
+            ]
+        }},
+        {"$group": {"_id": "$tipo", "count": {"$sum": 1}}}
+    ]
+
+
+def engagement_from_groups(resultado: List[Dict], days: int) -> Dict:
+    conteos = {r["_id"]: r["count"] for r in resultado}
+    chat_count = conteos.get("chat", 0)
+    text_entries = conteos.get("texto", 0)
+    return {
+        "chat_messages": chat_count,
+        "emotional_entries": text_entries,
+        "total_interactions": chat_count + text_entries,
+        "period_days": days,
+        "avg_daily_interactions": (chat_count + text_entries) / days if days > 0 else 0
+    }
+
+
+# ============================================
+# CONTEXTO DE CONVERSACIÓN (chat avanzado)
+# ============================================
+
+def conversation_context_pipeline(user_id: int, start_date: datetime,
+                                  messages_limit: int = 10,
+                                  high_risk_limit: int = 5) -> List[Dict]:
+    """
+    Todo el contexto de ConversationMemory en una ida y vuelta: se ejecuta sobre
+    chat_logs (últimos mensajes) y $unionWith añade las entradas de emotional_texts
+    de la ventana; $facet separa mensajes, agregados por hora y riesgo alto.
+    """
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"timestamp": -1}},
+        {"$limit": messages_limit},
+        {"$set": {"_tipo": "mensaje"}},
+        {"$unionWith": {
+            "coll": "emotional_texts",
+            "pipeline": [
+                {"$match": {"user_id": user_id, "timestamp": {"$gte": start_date}}},
+                {"$project": {
+                    "_id": 0,
+                    "timestamp": 1,
+                    "_tipo": {"$literal": "texto"},
+                    "_emotion": "$emotions.dominant_emotion",
+                    "_sentiment": "$sentiment.sentiment_score",
+                    "_risk": "$risk_assessment.level",
+                    # Solo las de riesgo alto llevan el documento completo
+                    "_doc": {"$cond": [
+                        {"$eq": ["$risk_assessment.level", "alto"]}, "$$ROOT", "$$REMOVE"
+                    ]}
+                }}
+            ]
+        }},
+        {"$facet": {
+            "mensajes": [
+                {"$match": {"_tipo": "mensaje"}},
+                {"$sort": {"timestamp": -1}},
+                {"$project": {"_tipo": 0}}
+            ],
+            # Agregados por hora: el caché desliza la ventana sin volver a leer
+            "horas": [
+                {"$match": {"_tipo": "texto"}},
+                {"$group": {
+                    "_id": {
+                        "hora": {"$subtract": [
+                            "$timestamp",
+                            {"$mod": [{"$toLong": "$timestamp"}, 3600 * 1000]}
+                        ]},
+                        "emotion": "$_emotion"
+                    },
+                    "total": {"$sum": 1},
+                    "sentiment_sum": {"$sum": "$_sentiment"},
+                    "high_risk": {"$sum": {"$cond": [{"$eq": ["$_risk", "alto"]}, 1, 0]}}
+                }}
+            ],
+            "riesgo_alto": [
+                {"$match": {"_tipo": "texto", "_risk": "alto"}},
+                {"$sort": {"timestamp": -1}},
+                {"$limit": high_risk_limit},
+                {"$replaceRoot": {"newRoot": "$_doc"}}
+            ]
+        }}
+    ]
+
+
+def pattern_fields(document: Dict) -> Tuple[Optional[str], Optional[float], Optional[str]]:
+    """
+    (emoción dominante, sentiment_score, nivel de riesgo) de un documento de
+    emotional_texts, con las mismas reglas que los pipelines (campos en la raíz)
+    """
+    sentiment = (document.get("sentiment") or {}).get("sentiment_score")
+    if isinstance(sentiment, bool) or not isinstance(sentiment, (int, float)):
+        sentiment = None
+    return (
+        (document.get("emotions") or {}).get("dominant_emotion"),
+        sentiment,
+        (document.get("risk_assessment") or {}).get("level")
+    )
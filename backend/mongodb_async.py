@@ -0,0 +1,258 @@
+# backend/mongodb_async.py
+# ✅ CAPA DE DATOS MONGODB ASÍNCRONA (motor)
+# Versión async de MongoDBService para los endpoints `async def`: las consultas
+# no bloquean el event loop. Un único cliente (y pool) por worker, creado en el
+# primer uso — después del fork de gunicorn — y cerrado en el shutdown.
+#
+# Las escrituras del chat siguen pasando por write_behind (pymongo en su hilo).
+
+import os
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from mongodb_config import MONGODB_URL, DATABASE_NAME, canonical_user_id
+from mongo_pipelines import (
+    emotional_patterns_pipeline, emotional_patterns_from_facet,
+    high_risk_entries_pipeline, engagement_pipeline, engagement_from_groups
+)
+
+# Pool de conexiones
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "60000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+
+class AsyncMongoDBService:
+    def __init__(self, url: str = MONGODB_URL, database: str = DATABASE_NAME):
+        self.url = url
+        self.database = database
+        self._client: Optional[AsyncIOMotorClient] = None
+
+    # ============================================
+    # CLIENTE COMPARTIDO
+    # ============================================
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        if self._client is None:
+            self._client = AsyncIOMotorClient(
+                self.url,
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                minPoolSize=MONGODB_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS
+            )
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.database]
+
+    @property
+    def chat_messages(self):
+        return self.db["chat_messages"]
+
+    @property
+    def chat_logs(self):
+        return self.db["chat_logs"]
+
+    @property
+    def emotional_texts(self):
+        return self.db["emotional_texts"]
+
+    @property
+    def notifications(self):
+        return self.db["notifications"]
+
+    @property
+    def chat_user_stats(self):
+        return self.db["chat_user_stats"]
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def reset_after_fork(self):
+        """Descarta un cliente heredado del maestro sin cerrarlo; se recrea al usarse"""
+        self._client = None
+
+    async def ping(self) -> bool:
+        await self.db.command("ping")
+        return True
+
+    # ============================================
+    # CHAT (colección chat_messages del chat con Rasa)
+    # ============================================
+
+    async def get_chat_messages(self, user_id: int, limit: int = 50) -> List[Dict]:
+        """Últimos mensajes del usuario, del más reciente al más antiguo"""
+        cursor = self.chat_messages.find({"user_id": canonical_user_id(user_id)}).sort("timestamp", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def iter_chat_page(self, user_id: int, limit: int = 50,
+                             before: Optional[Tuple[datetime, ObjectId]] = None,
+                             after: Optional[Tuple[datetime, ObjectId]] = None,
+                             projection: Optional[Dict] = None) -> AsyncIterator[Dict]:
+        """
+        Página del historial por keyset sobre (timestamp, _id), leída del cursor
+        a medida que llega. Sin `after` se recorre hacia atrás (más reciente
+        primero, desde `before` si se da); con `after`, hacia adelante.
+        El coste por página no depende de lo lejos que esté (no hay skip).
+        """
+        query: Dict = {"user_id": canonical_user_id(user_id)}
+        if after is not None:
+            ts, oid = after
+            query["$or"] = [{"timestamp": {"$gt": ts}}, {"timestamp": ts, "_id": {"$gt": oid}}]
+            direction = 1
+        else:
+            if before is not None:
+                ts, oid = before
+                query["$or"] = [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "_id": {"$lt": oid}}]
+            direction = -1
+
+        cursor = self.chat_messages.find(query, projection).sort(
+            [("timestamp", direction), ("_id", direction)]
+        ).limit(limit).batch_size(min(limit, 100))
+        async for document in cursor:
+            yield document
+
+    async def count_chat_messages(self, user_id: int, is_bot: Optional[bool] = None) -> int:
+        query = {"user_id": canonical_user_id(user_id)}
+        if is_bot is not None:
+            query["is_bot"] = is_bot
+        return await self.chat_messages.count_documents(query)
+
+    async def get_last_chat_message(self, user_id: int) -> Optional[Dict]:
+        return await self.chat_messages.find_one(
+            {"user_id": canonical_user_id(user_id)},
+            sort=[("timestamp", -1)]
+        )
+
+    async def get_frequent_emotions(self, user_id: int, limit: int = 5) -> List[Dict]:
+        pipeline = [
+            {
+                "$match": {
+                    "user_id": canonical_user_id(user_id),
+                    "is_bot": False,
+                    "emotional_analysis.emotions.dominant_emotion": {"$exists": True}
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$emotional_analysis.emotions.dominant_emotion",
+                    "count": {"$sum": 1}
+                }
+            },
+            {"$sort": {"count": -1}},
+            {"$limit": limit}
+        ]
+        return await self.chat_messages.aggregate(pipeline).to_list(length=limit)
+
+    async def get_chat_user_stats(self, user_id: int) -> Optional[Dict]:
+        """Contadores mantenidos por chat_user_stats (lectura por _id)"""
+        return await self.chat_user_stats.find_one({"_id": canonical_user_id(user_id)})
+
+    async def delete_chat_history(self, user_id: int) -> Dict:
+        """Borra mensajes del chat y los análisis guardados por chat_rasa"""
+        result_chat = await self.chat_messages.delete_many({"user_id": canonical_user_id(user_id)})
+        result_emotional = await self.emotional_texts.delete_many({
+            "user_id": canonical_user_id(user_id),
+            "source": "chat_rasa"
+        })
+        await self.chat_user_stats.delete_one({"_id": canonical_user_id(user_id)})
+        # Los análisis borrados formaban parte de los patrones del contexto en caché
+        from conversation_context_cache import context_cache
+        context_cache.invalidate(user_id)
+        return {
+            "chat_messages": result_chat.deleted_count,
+            "emotional_texts": result_emotional.deleted_count
+        }
+
+    # ============================================
+    # CHAT LOGS (mismo contrato que MongoDBService)
+    # ============================================
+
+    async def get_chat_history(self, user_id: int, limit: int = 50) -> List[Dict]:
+        cursor = self.chat_logs.find({"user_id": canonical_user_id(user_id)}).sort("timestamp", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_conversation_context(self, user_id: int, last_n: int = 10) -> List[Dict]:
+        messages = await self.get_chat_history(user_id, last_n)
+        return list(reversed(messages))
+
+    # ============================================
+    # EMOTIONAL TEXTS
+    # ============================================
+
+    async def count_emotional_texts(self, user_id: int) -> int:
+        return await self.emotional_texts.count_documents({"user_id": canonical_user_id(user_id)})
+
+    async def get_emotional_patterns(self, user_id: int, days: int = 30) -> Dict:
+        """Analizar patrones emocionales en el tiempo (una agregación en el servidor)"""
+        start_date = datetime.utcnow() - timedelta(days=days)
+        resultado = await self.emotional_texts.aggregate(
+            emotional_patterns_pipeline(canonical_user_id(user_id), start_date)
+        ).to_list(length=1)
+        return emotional_patterns_from_facet(resultado, days)
+
+    async def get_high_risk_entries(self, user_id: int, days: int = 7,
+                                    limit: Optional[int] = None) -> List[Dict]:
+        start_date = datetime.utcnow() - timedelta(days=days)
+        return await self.emotional_texts.aggregate(
+            high_risk_entries_pipeline(canonical_user_id(user_id), start_date, limit)
+        ).to_list(length=limit)
+
+    # ============================================
+    # NOTIFICATIONS
+    # ============================================
+
+    async def create_notification(self, user_id: int, notification_type: str,
+                                  message: str, priority: str = "normal"):
+        document = {
+            "user_id": canonical_user_id(user_id),
+            "type": notification_type,
+            "message": message,
+            "priority": priority,
+            "sent": False,
+            "read": False,
+            "created_at": datetime.utcnow()
+        }
+        return await self.notifications.insert_one(document)
+
+    async def get_pending_notifications(self, user_id: int) -> List[Dict]:
+        cursor = self.notifications.find({"user_id": canonical_user_id(user_id), "sent": False}).sort("created_at", -1)
+        return await cursor.to_list(length=None)
+
+    async def mark_notification_sent(self, notification_id):
+        await self.notifications.update_one(
+            {"_id": notification_id},
+            {"$set": {"sent": True, "sent_at": datetime.utcnow()}}
+        )
+
+    async def mark_notification_read(self, notification_id):
+        await self.notifications.update_one(
+            {"_id": notification_id},
+            {"$set": {"read": True, "read_at": datetime.utcnow()}}
+        )
+
+    # ============================================
+    # ANALYTICS
+    # ============================================
+
+    async def get_user_engagement_stats(self, user_id: int, days: int = 30) -> Dict:
+        start_date = datetime.utcnow() - timedelta(days=days)
+        resultado = await self.chat_logs.aggregate(
+            engagement_pipeline(canonical_user_id(user_id), start_date)
+        ).to_list(length=None)
+        return engagement_from_groups(resultado, days)
+
+
+# Instancia global del servicio async
+async_mongodb_service = AsyncMongoDBService()
@@ -3,12 +3,48 @@ from datetime import datetime
 from typing import List, Dict, Optional
 import os
 
+from write_behind import write_behind
+from mongo_indexes import ensure_indexes
+from mongo_pipelines import (
+    emotional_patterns_pipeline, emotional_patterns_from_facet,
+    high_risk_entries_pipeline, engagement_pipeline, engagement_from_groups
+)
+
 # Configuración de MongoDB
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/")
 DATABASE_NAME = "emotional_tracking"
+MONGODB_ENSURE_INDEXES = os.getenv("MONGODB_ENSURE_INDEXES", "true").lower() == "true"
+
+
+def canonical_user_id(user_id) -> int:
+    """
+    user_id canónico en MongoDB: el id_usuario entero de PostgreSQL.
+    Acepta int, "7" o el sender_id de Rasa "paciente_7"; cualquier otra cosa es un error.
+    """
+    if isinstance(user_id, bool):
+        raise TypeError(f"user_id no válido: {user_id!r}")
+    if isinstance(user_id, int):
+        return int(user_id)
+    if isinstance(user_id, float) and user_id.is_integer():
+        return int(user_id)
+    if isinstance(user_id, str):
+        valor = user_id.strip()
+        if valor.startswith("paciente_"):
+            valor = valor[len("paciente_"):]
+        if valor.isdigit():
+            return int(valor)
+    raise ValueError(f"user_id no válido: {user_id!r}")
+
 
 class MongoDBService:
     def __init__(self):
+        self._connect()
+        
+        # Crear índices
+        if MONGODB_ENSURE_INDEXES:
+            self._create_indexes()
+    
+    def _connect(self):
         self.client = MongoClient(MONGODB_URL)
         self.db = self.client[DATABASE_NAME]
         
@@ -16,15 +52,22 @@ class MongoDBService:
         self.chat_logs = self.db["chat_logs"]
         self.emotional_texts = self.db["emotional_texts"]
         self.notifications = self.db["notifications"]
-        
-        # Crear índices
-        self._create_indexes()
+    
+    def reset_after_fork(self):
+        """
+        MongoClient no es fork-safe: cada worker de gunicorn (preload_app) crea
+        el suyo en lugar de usar los sockets y hilos heredados del maestro.
+        El cliente heredado no se cierra (sus sockets siguen siendo del maestro)
+        y los índices no se vuelven a crear.
+        """
+        self._connect()
     
     def _create_indexes(self):
-        """Crear índices para optimizar consultas"""
-        self.chat_logs.create_index([("user_id", 1), ("timestamp", -1)])
-        self.emotional_texts.create_index([("user_id", 1), ("timestamp", -1)])
-        self.notifications.create_index([("user_id", 1), ("sent", 1)])
+        """Crear índices para optimizar consultas (especificación en mongo_indexes.py)"""
+        try:
+            ensure_indexes(self.db)
+        except Exception as e:
+            print(f"⚠️ No se pudieron crear los índices de MongoDB: {e}")
     
     # Chat Logs
     def save_chat_message(self, user_id: int, message: str, is_bot: bool, 
@@ -32,8 +75,30 @@ class MongoDBService:
                           confidence: Optional[float] = None,
                           emotional_analysis: Optional[Dict] = None):
         """Guardar mensaje de chat con análisis emocional"""
-        document = {
-            "user_id": user_id,
+        document = self.chat_message_document(user_id, message, is_bot, intent,
+                                               confidence, emotional_analysis)
+        return self.chat_logs.insert_one(document)
+    
+    def queue_chat_message(self, user_id: int, message: str, is_bot: bool,
+                           intent: Optional[str] = None,
+                           confidence: Optional[float] = None,
+                           emotional_analysis: Optional[Dict] = None):
+        """
+        Igual que save_chat_message pero con escritura diferida (write-behind).
+        Devuelve el documento encolado (ya con _id).
+        """
+        document = self.chat_message_document(user_id, message, is_bot, intent,
+                                               confidence, emotional_analysis)
+        write_behind.enqueue("chat_logs", document)
+        return document
+    
+    @staticmethod
+    def chat_message_document(user_id: int, message: str, is_bot: bool,
+                              intent: Optional[str] = None,
+                              confidence: Optional[float] = None,
+                              emotional_analysis: Optional[Dict] = None) -> Dict:
+        return {
+            "user_id": canonical_user_id(user_id),
             "message": message,
             "is_bot": is_bot,
             "intent": intent,
@@ -41,19 +106,18 @@ class MongoDBService:
             "emotional_analysis": emotional_analysis,
             "timestamp": datetime.utcnow()
         }
-        return self.chat_logs.insert_one(document)
     
     def get_chat_history(self, user_id: int, limit: int = 50) -> List[Dict]:
         """Obtener historial de chat de un usuario"""
         messages = self.chat_logs.find(
-            {"user_id": user_id}
+            {"user_id": canonical_user_id(user_id)}
         ).sort("timestamp", -1).limit(limit)
         return list(messages)
     
     def get_conversation_context(self, user_id: int, last_n: int = 10) -> List[Dict]:
         """Obtener contexto de conversación reciente"""
         messages = self.chat_logs.find(
-            {"user_id": user_id}
+            {"user_id": canonical_user_id(user_id)}
         ).sort("timestamp", -1).limit(last_n)
         return list(reversed(list(messages)))
     
@@ -62,8 +126,26 @@ class MongoDBService:
                            emotional_analysis: Dict, 
                            source: str = "chat"):
         """Guardar texto con análisis emocional completo"""
-        document = {
-            "user_id": user_id,
+        document = self.emotional_text_document(user_id, text, emotional_analysis, source)
+        return self.emotional_texts.insert_one(document)
+    
+    def queue_emotional_text(self, user_id: int, text: str,
+                             emotional_analysis: Dict,
+                             source: str = "chat"):
+        """
+        Igual que save_emotional_text pero con escritura diferida (write-behind).
+        Devuelve el documento encolado (ya con _id).
+        """
+        document = self.emotional_text_document(user_id, text, emotional_analysis, source)
+        write_behind.enqueue("emotional_texts", document)
+        return document
+    
+    @staticmethod
+    def emotional_text_document(user_id: int, text: str,
+                                emotional_analysis: Dict,
+                                source: str = "chat") -> Dict:
+        return {
+            "user_id": canonical_user_id(user_id),
             "text": text,
             "source": source,  # "chat", "record", "journal"
             "sentiment": emotional_analysis.get("sentiment"),
@@ -71,71 +153,68 @@ class MongoDBService:
             "risk_assessment": emotional_analysis.get("risk_assessment"),
             "timestamp": datetime.utcnow()
         }
-        return self.emotional_texts.insert_one(document)
     
-    def get_emotional_patterns(self, user_id: int, days: int = 30) -> Dict:
-        """Analizar patrones emocionales en el tiempo"""
-        from datetime import timedelta
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        texts = self.emotional_texts.find({
-            "user_id": user_id,
-            "timestamp": {"$gte": start_date}
-        }).sort("timestamp", 1)
-        
-        texts_list = list(texts)
-        
-        if not texts_list:
-            return {
-                "total_entries": 0,
-                "dominant_emotions": {},
-                "average_sentiment": 0,
-                "risk_alerts": 0
+    # Chat con Rasa (routers/chat_rasa.py)
+    @staticmethod
+    def rasa_chat_message_document(user_id: int, message: str, is_bot: bool,
+                                   timestamp: Optional[datetime] = None,
+                                   emotional_analysis: Optional[Dict] = None,
+                                   sender_name: Optional[str] = None) -> Dict:
+        """Documento de la colección chat_messages"""
+        document = {
+            "user_id": canonical_user_id(user_id),
+            "message": message,
+            "is_bot": is_bot,
+            "timestamp": timestamp or datetime.utcnow()
+        }
+        if emotional_analysis is not None:
+            document["emotional_analysis"] = {
+                "sentiment": emotional_analysis.get('sentiment', {}),
+                "emotions": emotional_analysis.get('emotions', {}),
+                "risk_assessment": emotional_analysis.get('risk_assessment', {})
             }
-        
-        # Análisis de emociones dominantes
-        emotion_counts = {}
-        sentiment_sum = 0
-        high_risk_count = 0
-        
-        for text in texts_list:
-            if text.get("emotions") and text["emotions"].get("dominant_emotion"):
-                emotion = text["emotions"]["dominant_emotion"]
-                emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
-            
-            if text.get("sentiment") and text["sentiment"].get("sentiment_score"):
-                sentiment_sum += text["sentiment"]["sentiment_score"]
-            
-            if text.get("risk_assessment") and text["risk_assessment"].get("level") == "alto":
-                high_risk_count += 1
-        
+        if sender_name is not None:
+            document["sender_name"] = sender_name
+        return document
+    
+    @staticmethod
+    def rasa_analysis_document(user_id: int, text: str, analysis: Dict,
+                               timestamp: Optional[datetime] = None) -> Dict:
+        """Análisis completo de un mensaje del chat con Rasa (emotional_texts)"""
         return {
-            "total_entries": len(texts_list),
-            "dominant_emotions": emotion_counts,
-            "average_sentiment": sentiment_sum / len(texts_list) if texts_list else 0,
-            "risk_alerts": high_risk_count,
-            "period_days": days
+            "user_id": canonical_user_id(user_id),
+            "text": text,
+            "emotional_analysis": analysis,
+            "source": "chat_rasa",
+            "timestamp": timestamp or datetime.utcnow()
         }
     
-    def get_high_risk_entries(self, user_id: int, days: int = 7) -> List[Dict]:
-        """Obtener entradas de alto riesgo"""
+    def get_emotional_patterns(self, user_id: int, days: int = 30) -> Dict:
+        """Analizar patrones emocionales en el tiempo (una agregación en el servidor)"""
         from datetime import timedelta
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        entries = self.emotional_texts.find({
-            "user_id": user_id,
-            "timestamp": {"$gte": start_date},
-            "risk_assessment.level": "alto"
-        }).sort("timestamp", -1)
+        resultado = list(self.emotional_texts.aggregate(
+            emotional_patterns_pipeline(canonical_user_id(user_id), start_date)
+        ))
+        return emotional_patterns_from_facet(resultado, days)
+    
+    def get_high_risk_entries(self, user_id: int, days: int = 7,
+                              limit: Optional[int] = None) -> List[Dict]:
+        """Obtener entradas de alto riesgo (más recientes primero)"""
+        from datetime import timedelta
+        start_date = datetime.utcnow() - timedelta(days=days)
         
-        return list(entries)
+        return list(self.emotional_texts.aggregate(
+            high_risk_entries_pipeline(canonical_user_id(user_id), start_date, limit)
+        ))
     
     # Notifications
     def create_notification(self, user_id: int, notification_type: str, 
                            message: str, priority: str = "normal"):
         """Crear notificación para el usuario"""
         document = {
-            "user_id": user_id,
+            "user_id": canonical_user_id(user_id),
             "type": notification_type,  # "reminder", "alert", "achievement"
             "message": message,
             "priority": priority,  # "low", "normal", "high", "critical"
@@ -148,7 +227,7 @@ class MongoDBService:
     def get_pending_notifications(self, user_id: int) -> List[Dict]:
         """Obtener notificaciones pendientes"""
         notifications = self.notifications.find({
-            "user_id": user_id,
+            "user_id": canonical_user_id(user_id),
             "sent": False
         }).sort("created_at", -1)
         
@@ -170,28 +249,14 @@ class MongoDBService:
     
     # Analytics
     def get_user_engagement_stats(self, user_id: int, days: int = 30) -> Dict:
-        """Estadísticas de engagement del usuario"""
+        """Estadísticas de engagement del usuario (chat_logs + emotional_texts en una consulta)"""
         from datetime import timedelta
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        chat_count = self.chat_logs.count_documents({
-            "user_id": user_id,
-            "is_bot": False,
-            "timestamp": {"$gte": start_date}
-        })
-        
-        text_entries = self.emotional_texts.count_documents({
-            "user_id": user_id,
-            "timestamp": {"$gte": start_date}
-        })
-        
-        return {
-            "chat_messages": chat_count,
-            "emotional_entries": text_entries,
-            "total_interactions": chat_count + text_entries,
-            "period_days": days,
-            "avg_daily_interactions": (chat_count + text_entries) / days if days > 0 else 0
-        }
+        resultado = list(self.chat_logs.aggregate(
+            engagement_pipeline(canonical_user_id(user_id), start_date)
+        ))
+        return engagement_from_groups(resultado, days)
 
 # Instancia global del servicio
 mongodb_service = MongoDBService()
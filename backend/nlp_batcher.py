@@ -0,0 +1,154 @@
+# backend/nlp_batcher.py
+# ✅ MICRO-BATCHING DEL ANÁLISIS EMOCIONAL
+# Agrupa los análisis pedidos al mismo tiempo en un único forward pass
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from nlp_fast_path import fast_path
+from nlp_service import nlp_service, EmotionalAnalysisService
+
+# Configuración
+NLP_BATCH_MAX_SIZE = int(os.getenv("NLP_BATCH_MAX_SIZE", "16"))
+NLP_BATCH_MAX_WAIT_MS = float(os.getenv("NLP_BATCH_MAX_WAIT_MS", "10"))
+
+
+class MicroBatcher:
+    """
+    Front-end de EmotionalAnalysisService que junta los textos recibidos
+    dentro de una ventana de tiempo y los analiza como un solo lote.
+    Cada llamador recibe el mismo resultado que daría comprehensive_analysis().
+    Los textos triviales (fast path) y los que ya están en la caché en memoria
+    se resuelven al instante, sin pasar por la cola ni esperar la ventana.
+    """
+
+    def __init__(self,
+                 service: EmotionalAnalysisService,
+                 max_batch_size: int = NLP_BATCH_MAX_SIZE,
+                 max_wait_ms: float = NLP_BATCH_MAX_WAIT_MS):
+        self.service = service
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.total_batches = 0
+        self.total_texts = 0
+        self.max_batch_seen = 0
+        self.fast_path_hits = 0
+        self.cache_hits = 0
+
+    def submit(self, text: str) -> Future:
+        """Devuelve un Future con el análisis; solo se encola si no hay respuesta inmediata"""
+        future: Future = Future()
+        inmediato = self._lookup(text)
+        if inmediato is not None:
+            future.set_result(inmediato)
+            return future
+
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def _lookup(self, text: str) -> Optional[Dict]:
+        """Fast path y caché en memoria (sin I/O: se llama desde el event loop)"""
+        trivial = fast_path.try_analyze(text)
+        if trivial is not None:
+            self.fast_path_hits += 1
+            return trivial
+        cached = self.service.cache.get(text, local_only=True)
+        if cached is not None:
+            self.cache_hits += 1
+        return cached
+
+    def analyze(self, text: str) -> Dict:
+        """Versión bloqueante para llamadores síncronos"""
+        return self.submit(text).result()
+
+    async def analyze_async(self, text: str) -> Dict:
+        """Versión para endpoints async: no bloquea el event loop"""
+        future = self.submit(text)
+        if future.done():
+            return future.result()
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict:
+        """Métricas del batcher"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": self._queue.qsize(),
+            "total_batches": self.total_batches,
+            "total_texts": self.total_texts,
+            "avg_batch_size": round(self.total_texts / self.total_batches, 2) if self.total_batches else 0,
+            "max_batch_seen": self.max_batch_seen,
+            "fast_path_hits": self.fast_path_hits,
+            "cache_hits": self.cache_hits
+        }
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name="nlp-micro-batcher",
+                    daemon=True
+                )
+                self._worker.start()
+
+    def _collect_batch(self) -> List[Tuple[str, Future]]:
+        """Espera el primer texto y junta los que lleguen hasta max_wait o max_batch_size"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Descartar los que fueron cancelados mientras esperaban
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            texts = [text for text, _ in batch]
+            try:
+                # submit ya aplicó el fast path; la caché se vuelve a mirar aquí
+                # porque incluye la compartida y otro lote pudo llenarla
+                results = self.service.comprehensive_analysis_batch(texts, skip_fast_path=True)
+            except Exception as e:
+                print(f"⚠️ Error en lote de análisis NLP ({len(texts)} textos): {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+            self.total_batches += 1
+            self.total_texts += len(texts)
+            self.max_batch_seen = max(self.max_batch_seen, len(texts))
+
+
+# Instancia global del batcher
+nlp_batcher = MicroBatcher(nlp_service)
@@ -0,0 +1,136 @@
+# backend/nlp_fast_path.py
+# ✅ FAST PATH PARA MENSAJES TRIVIALES
+# Saludos, agradecimientos y respuestas de una palabra ("hola", "ok", "gracias")
+# no necesitan los transformers: se devuelve un análisis neutro con fast_path=True.
+#
+# Reglas (en este orden):
+#   1. Coincidencia en el léxico de crisis        -> modelos completos, siempre
+#   2. Más de NLP_FAST_PATH_MAX_CHARS caracteres  -> modelos completos
+#   3. Solo puntuación ("?", "...")               -> fast path
+#   4. Todas las palabras están en la lista blanca y son <= NLP_FAST_PATH_MAX_WORDS
+#                                                 -> fast path
+#   5. Cualquier otro caso                        -> modelos completos
+
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Optional
+
+from lexicon import CRISIS_LEXICON, normalize_text
+
+# Configuración
+NLP_FAST_PATH_ENABLED = os.getenv("NLP_FAST_PATH_ENABLED", "true").lower() == "true"
+NLP_FAST_PATH_MAX_CHARS = int(os.getenv("NLP_FAST_PATH_MAX_CHARS", "40"))
+NLP_FAST_PATH_MAX_WORDS = int(os.getenv("NLP_FAST_PATH_MAX_WORDS", "4"))
+
+# Intenciones triviales (saludo, despedida, agradecimiento, confirmación).
+# Se comparan ya normalizadas: minúsculas y sin tildes.
+TRIVIAL_WORDS = {
+    # saludos / despedidas
+    'hola', 'holi', 'buenas', 'buenos', 'buen', 'dias', 'tardes', 'noches',
+    'hey', 'saludos', 'adios', 'chao', 'chau', 'bye', 'hasta', 'luego', 'pronto',
+    'manana', 'nos', 'vemos',
+    # agradecimientos
+    'gracias', 'muchas', 'mil', 'thanks', 'grax',
+    # confirmaciones / respuestas de una palabra ("no" queda fuera: en este
+    # contexto puede ser la respuesta a "¿estás bien?")
+    'ok', 'okay', 'oki', 'vale', 'si', 'claro', 'listo', 'dale', 'va',
+    'perfecto', 'entendido', 'de', 'acuerdo', 'ya', 'aja', 'mmm', 'mm', 'bueno',
+    'igualmente', 'tambien', 'genial',
+}
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _only_punctuation(text: str) -> bool:
+    stripped = text.strip()
+    return bool(stripped) and all(
+        unicodedata.category(c).startswith(("P", "Z")) for c in stripped
+    )
+
+
+class FastPathClassifier:
+    """Primera etapa barata antes de los pipelines de nlp_service"""
+
+    def __init__(self,
+                 enabled: bool = NLP_FAST_PATH_ENABLED,
+                 max_chars: int = NLP_FAST_PATH_MAX_CHARS,
+                 max_words: int = NLP_FAST_PATH_MAX_WORDS):
+        self.enabled = enabled
+        self.max_chars = max_chars
+        self.max_words = max_words
+
+        self._lock = threading.Lock()
+        self.total = 0
+        self.absorbed = 0
+        self.reasons: Counter = Counter()
+
+    def classify(self, text: str) -> Optional[str]:
+        """
+        Motivo por el que el texto va por el fast path, o None si necesita
+        los modelos completos. No actualiza contadores (lo usa el reporte).
+        """
+        text = text or ""
+
+        if CRISIS_LEXICON.scan(text):
+            return None
+        if len(text) > self.max_chars:
+            return None
+        if _only_punctuation(text):
+            return "puntuacion"
+
+        tokens = _TOKEN.findall(normalize_text(text))
+        if tokens and len(tokens) <= self.max_words and all(t in TRIVIAL_WORDS for t in tokens):
+            return "lista_blanca"
+        return None
+
+    def try_analyze(self, text: str) -> Optional[Dict]:
+        """Análisis neutro si el texto es trivial; None si hay que usar los modelos"""
+        if not self.enabled:
+            return None
+
+        reason = self.classify(text)
+        with self._lock:
+            self.total += 1
+            if reason is not None:
+                self.absorbed += 1
+            self.reasons[reason or "modelos"] += 1
+
+        if reason is None:
+            return None
+        return self.neutral_analysis()
+
+    @staticmethod
+    def neutral_analysis() -> Dict:
+        """Mismo formato que EmotionalAnalysisService._build_analysis"""
+        return {
+            'sentiment': {'label': 'NEU', 'score': 1.0, 'sentiment_score': 0},
+            'emotions': {
+                'dominant_emotion': 'neutral',
+                'confidence': 1.0,
+                'all_emotions': {'neutral': 1.0}
+            },
+            'risk_assessment': {
+                'score': 0,
+                'level': 'bajo'
+            },
+            'fast_path': True
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_chars": self.max_chars,
+                "max_words": self.max_words,
+                "total": self.total,
+                "absorbed": self.absorbed,
+                "absorbed_ratio": round(self.absorbed / self.total, 3) if self.total else 0,
+                "reasons": dict(self.reasons)
+            }
+
+
+# Instancia global
+fast_path = FastPathClassifier()
@@ -1,25 +1,121 @@
-from transformers import pipeline, AutoModelForSequenceClassification, AutoTokenizer
-import torch
-from typing import Dict, Tuple
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from analysis_cache import AnalysisCache
+from inference_backend import resolve_backend
+from model_registry import model_registry
+from nlp_fast_path import fast_path
+
+# Mapeo de etiquetas del modelo a español
+EMOTION_MAP = {
+    'joy': 'alegría',
+    'sadness': 'tristeza',
+    'anger': 'enojo',
+    'fear': 'miedo',
+    'surprise': 'sorpresa',
+    'disgust': 'disgusto'
+}
 
 class EmotionalAnalysisService:
     def __init__(self):
+        # Los modelos NO se cargan al importar: se cargan en el primer uso
+        # o en el warm-up en segundo plano que lanza main.py al arrancar
+        # (PyTorch u ONNX int8 según NLP_INFERENCE_BACKEND)
+        self.backend = resolve_backend()
+        
         # Modelo de análisis de sentimientos en español
         self.sentiment_model = "pysentimiento/robertuito-sentiment-analysis"
-        self.sentiment_analyzer = pipeline(
-            "sentiment-analysis",
-            model=self.sentiment_model,
-            tokenizer=self.sentiment_model
-        )
-        
         # Modelo de detección de emociones en español
         self.emotion_model = "pysentimiento/robertuito-emotion-analysis"
-        self.emotion_analyzer = pipeline(
-            "text-classification",
-            model=self.emotion_model,
-            tokenizer=self.emotion_model,
-            top_k=None
-        )
+        
+        self._sentiment_analyzer = None
+        self._emotion_analyzer = None
+        self._load_lock = threading.Lock()
+        self.load_state = "not_loaded"  # not_loaded, loading, ready, error
+        self.load_error = None
+        self.load_seconds = None
+        
+        # Caché de resultados (la versión incluye ambos modelos y el backend)
+        self.model_version = f"{self.backend}:{self.sentiment_model}|{self.emotion_model}"
+        self.cache = AnalysisCache(namespace="nlp_service", model_version=self.model_version)
+    
+    # ============================================
+    # CARGA PEREZOSA Y WARM-UP
+    # ============================================
+    
+    @property
+    def sentiment_analyzer(self):
+        self._ensure_loaded()
+        return self._sentiment_analyzer
+    
+    @property
+    def emotion_analyzer(self):
+        self._ensure_loaded()
+        return self._emotion_analyzer
+    
+    def _ensure_loaded(self):
+        if self.load_state == "ready":
+            return
+        
+        with self._load_lock:
+            if self.load_state == "ready":
+                return
+            
+            self.load_state = "loading"
+            started_at = time.monotonic()
+            try:
+                # Instancias compartidas con el resto del proceso
+                self._sentiment_analyzer = model_registry.get_pipeline(
+                    "sentiment-analysis",
+                    self.sentiment_model,
+                    backend=self.backend
+                )
+                self._emotion_analyzer = model_registry.get_pipeline(
+                    "text-classification",
+                    self.emotion_model,
+                    backend=self.backend,
+                    top_k=None
+                )
+            except Exception as e:
+                self.load_state = "error"
+                self.load_error = str(e)
+                print(f"❌ Error cargando modelos NLP: {e}")
+                raise
+            
+            self.load_seconds = round(time.monotonic() - started_at, 2)
+            self.load_error = None
+            self.load_state = "ready"
+            print(f"✅ Modelos NLP cargados en {self.load_seconds}s ({self.backend})")
+    
+    def load(self):
+        """Carga los modelos sin ejecutar inferencia (usado antes del fork en gunicorn)"""
+        self._ensure_loaded()
+    
+    def warm_up(self):
+        """Carga los modelos y hace una inferencia de prueba (primer forward pass)"""
+        try:
+            self._ensure_loaded()
+            self._sentiment_analyzer("hola")
+            self._emotion_analyzer("hola")
+        except Exception as e:
+            print(f"⚠️ Warm-up NLP falló: {e}")
+    
+    def is_ready(self) -> bool:
+        return self.load_state == "ready"
+    
+    def status(self) -> Dict:
+        return {
+            "state": self.load_state,
+            "backend": self.backend,
+            "models": [self.sentiment_model, self.emotion_model],
+            "load_seconds": self.load_seconds,
+            "error": self.load_error
+        }
+    
+    # ============================================
+    # ANÁLISIS
+    # ============================================
         
     def analyze_sentiment(self, text: str) -> Dict:
         """
@@ -28,22 +124,10 @@ class EmotionalAnalysisService:
         """
         try:
             result = self.sentiment_analyzer(text)[0]
-            
-            # Convertir a escala -1 a 1
-            sentiment_score = 0
-            if result['label'] == 'POS':
-                sentiment_score = result['score']
-            elif result['label'] == 'NEG':
-                sentiment_score = -result['score']
-            
-            return {
-                'label': result['label'],
-                'score': result['score'],
-                'sentiment_score': sentiment_score
-            }
+            return self._format_sentiment(result)
         except Exception as e:
             print(f"Error en análisis de sentimiento: {e}")
-            return {'label': 'NEU', 'score': 0.5, 'sentiment_score': 0}
+            return self._default_sentiment()
     
     def analyze_emotions(self, text: str) -> Dict:
         """
@@ -52,45 +136,126 @@ class EmotionalAnalysisService:
         """
         try:
             results = self.emotion_analyzer(text)[0]
-            
-            # Obtener la emoción dominante
-            dominant_emotion = max(results, key=lambda x: x['score'])
-            
-            # Mapeo a español
-            emotion_map = {
-                'joy': 'alegría',
-                'sadness': 'tristeza',
-                'anger': 'enojo',
-                'fear': 'miedo',
-                'surprise': 'sorpresa',
-                'disgust': 'disgusto'
-            }
-            
-            emotions_dict = {}
-            for item in results:
-                emotion_name = emotion_map.get(item['label'], item['label'])
-                emotions_dict[emotion_name] = round(item['score'], 3)
-            
-            return {
-                'dominant_emotion': emotion_map.get(dominant_emotion['label'], dominant_emotion['label']),
-                'confidence': dominant_emotion['score'],
-                'all_emotions': emotions_dict
-            }
+            return self._format_emotions(results)
         except Exception as e:
             print(f"Error en análisis de emociones: {e}")
-            return {
-                'dominant_emotion': 'desconocida',
-                'confidence': 0,
-                'all_emotions': {}
-            }
+            return self._default_emotions()
     
     def comprehensive_analysis(self, text: str) -> Dict:
         """
         Análisis completo: sentimiento + emociones
         """
+        trivial = fast_path.try_analyze(text)
+        if trivial is not None:
+            return trivial
+        
+        cached = self.cache.get(text)
+        if cached is not None:
+            return cached
+        
         sentiment = self.analyze_sentiment(text)
         emotions = self.analyze_emotions(text)
+        analysis = self._build_analysis(sentiment, emotions)
+        self._cache_analysis(text, analysis)
+        return analysis
+    
+    # ============================================
+    # ANÁLISIS POR LOTES
+    # ============================================
+    
+    def analyze_sentiment_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        Analiza el sentimiento de varios textos en un solo forward pass.
+        El pipeline rellena (padding) los textos a la longitud del más largo.
+        """
+        try:
+            results = self.sentiment_analyzer(texts, batch_size=len(texts), truncation=True)
+            return [self._format_sentiment(result) for result in results]
+        except Exception as e:
+            # Un texto problemático no debe dejar sin análisis al resto del lote:
+            # se repite uno a uno y solo los que vuelvan a fallar llevan el defecto
+            print(f"Error en análisis de sentimiento por lotes, reintentando por texto: {e}")
+            return [self.analyze_sentiment(text) for text in texts]
+    
+    def analyze_emotions_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        Detecta emociones de varios textos en un solo forward pass
+        """
+        try:
+            results = self.emotion_analyzer(texts, batch_size=len(texts), truncation=True)
+            return [self._format_emotions(items) for items in results]
+        except Exception as e:
+            print(f"Error en análisis de emociones por lotes, reintentando por texto: {e}")
+            return [self.analyze_emotions(text) for text in texts]
+    
+    def comprehensive_analysis_batch(self, texts: List[str], skip_fast_path: bool = False) -> List[Dict]:
+        """
+        Análisis completo de un lote de textos.
+        Retorna un resultado por texto, en el mismo orden que la entrada.
+        skip_fast_path=True si el llamador ya descartó los textos triviales.
+        """
+        if not texts:
+            return []
         
+        # Fast path primero, luego caché: solo el resto llega a los modelos
+        if skip_fast_path:
+            results: List[Dict] = [None] * len(texts)
+        else:
+            results = [fast_path.try_analyze(text) for text in texts]
+        results = [r if r is not None else self.cache.get(text) for r, text in zip(results, texts)]
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        if pending:
+            pending_texts = [texts[i] for i in pending]
+            sentiments = self.analyze_sentiment_batch(pending_texts)
+            emotions = self.analyze_emotions_batch(pending_texts)
+            
+            for i, sentiment, emotion in zip(pending, sentiments, emotions):
+                results[i] = self._build_analysis(sentiment, emotion)
+                self._cache_analysis(texts[i], results[i])
+        
+        return results
+    
+    def _cache_analysis(self, text: str, analysis: Dict):
+        """Guarda en caché solo análisis válidos (no los valores por defecto de error)"""
+        if analysis['emotions']['dominant_emotion'] != 'desconocida':
+            self.cache.set(text, analysis)
+    
+    # ============================================
+    # FORMATEO DE RESULTADOS
+    # ============================================
+    
+    def _format_sentiment(self, result: Dict) -> Dict:
+        """Convierte la salida del pipeline de sentimiento a escala -1 a 1"""
+        sentiment_score = 0
+        if result['label'] == 'POS':
+            sentiment_score = result['score']
+        elif result['label'] == 'NEG':
+            sentiment_score = -result['score']
+        
+        return {
+            'label': result['label'],
+            'score': result['score'],
+            'sentiment_score': sentiment_score
+        }
+    
+    def _format_emotions(self, results: List[Dict]) -> Dict:
+        """Obtiene la emoción dominante y la distribución en español"""
+        dominant_emotion = max(results, key=lambda x: x['score'])
+        
+        emotions_dict = {}
+        for item in results:
+            emotion_name = EMOTION_MAP.get(item['label'], item['label'])
+            emotions_dict[emotion_name] = round(item['score'], 3)
+        
+        return {
+            'dominant_emotion': EMOTION_MAP.get(dominant_emotion['label'], dominant_emotion['label']),
+            'confidence': dominant_emotion['score'],
+            'all_emotions': emotions_dict
+        }
+    
+    def _build_analysis(self, sentiment: Dict, emotions: Dict) -> Dict:
+        """Combina sentimiento y emociones con la evaluación de riesgo"""
         # Evaluación de riesgo basada en emociones negativas
         risk_score = 0
         if 'tristeza' in emotions['all_emotions']:
@@ -112,7 +277,18 @@ class EmotionalAnalysisService:
             'risk_assessment': {
                 'score': round(risk_score, 3),
                 'level': risk_level
-            }
+            },
+            'fast_path': False
+        }
+    
+    def _default_sentiment(self) -> Dict:
+        return {'label': 'NEU', 'score': 0.5, 'sentiment_score': 0}
+    
+    def _default_emotions(self) -> Dict:
+        return {
+            'dominant_emotion': 'desconocida',
+            'confidence': 0,
+            'all_emotions': {}
         }
 
 # Instancia global del servicio
@@ -13,7 +13,7 @@ sys.path.insert(0, os.path.dirname(__file__))
 
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
-from mongodb_config import mongodb_service
+from mongodb_config import mongodb_service, canonical_user_id
 import models
 
 # Configuración
@@ -62,10 +62,13 @@ def procesar_emociones():
         
         for doc in documentos:
             try:
-                user_id = doc.get('user_id')
                 timestamp = doc.get('timestamp')
+                try:
+                    user_id = canonical_user_id(doc.get('user_id'))
+                except (TypeError, ValueError):
+                    continue
                 
-                if not user_id or not timestamp:
+                if not timestamp:
                     continue
                 
                 # Verificar si ya existe un registro para este timestamp
@@ -0,0 +1,211 @@
+# backend/rasa_client.py
+# ✅ CLIENTE HTTP COMPARTIDO BACKEND -> RASA
+# Un único httpx.AsyncClient por worker, creado en el startup y cerrado en el
+# shutdown de main.py. Las conexiones se reutilizan (keep-alive) entre mensajes
+# en lugar de abrir una conexión TCP nueva por cada POST al webhook.
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import httpx
+
+from circuit_breaker import CircuitBreaker
+
+# Configuración
+RASA_URL = os.getenv("RASA_URL", "http://localhost:5006")
+RASA_POOL_MAX_CONNECTIONS = int(os.getenv("RASA_POOL_MAX_CONNECTIONS", "20"))
+RASA_POOL_MAX_KEEPALIVE = int(os.getenv("RASA_POOL_MAX_KEEPALIVE", "10"))
+RASA_KEEPALIVE_EXPIRY = float(os.getenv("RASA_KEEPALIVE_EXPIRY", "30"))
+# Timeouts por fase (segundos)
+RASA_CONNECT_TIMEOUT = float(os.getenv("RASA_CONNECT_TIMEOUT", "2"))
+RASA_READ_TIMEOUT = float(os.getenv("RASA_READ_TIMEOUT", "30"))
+RASA_WRITE_TIMEOUT = float(os.getenv("RASA_WRITE_TIMEOUT", "5"))
+RASA_POOL_TIMEOUT = float(os.getenv("RASA_POOL_TIMEOUT", "2"))
+# Tiempo máximo que un mensaje del chat espera a Rasa antes de usar el respaldo
+RASA_LATENCY_BUDGET_MS = float(os.getenv("RASA_LATENCY_BUDGET_MS", "4000"))
+
+WEBHOOK_PATH = "/webhooks/rest/webhook"
+
+
+class RasaUnavailable(Exception):
+    """Rasa no respondió a tiempo, falló o el circuit breaker está abierto"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RasaClient:
+    """Cliente asíncrono con pool de conexiones hacia el servidor de Rasa"""
+
+    def __init__(self, base_url: str = RASA_URL):
+        self.base_url = base_url
+        self.webhook_url = f"{base_url}{WEBHOOK_PATH}"
+        self._client: Optional[httpx.AsyncClient] = None
+        self.breaker = CircuitBreaker("rasa")
+
+        # Métricas
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.budget_exceeded = 0
+        self._latencies_ms = deque(maxlen=1000)
+
+    # ============================================
+    # CICLO DE VIDA
+    # ============================================
+
+    async def start(self):
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=RASA_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=RASA_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=RASA_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                connect=RASA_CONNECT_TIMEOUT,
+                read=RASA_READ_TIMEOUT,
+                write=RASA_WRITE_TIMEOUT,
+                pool=RASA_POOL_TIMEOUT
+            )
+        )
+        print(f"✅ Cliente Rasa iniciado ({self.base_url}, pool={RASA_POOL_MAX_CONNECTIONS})")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("RasaClient no iniciado: llamar a start() en el startup")
+        return self._client
+
+    # ============================================
+    # PETICIONES
+    # ============================================
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        if self._client is None:
+            # Uso fuera de la app (scripts): se inicia bajo demanda
+            await self.start()
+
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started_at = time.perf_counter()
+        try:
+            return await self.client.request(method, path, **kwargs)
+        except httpx.TimeoutException:
+            self.timeouts += 1
+            self.errors += 1
+            raise
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._latencies_ms.append((time.perf_counter() - started_at) * 1000)
+
+    async def send_message(self, sender_id: str, message: str,
+                           metadata: Optional[Dict] = None) -> httpx.Response:
+        """POST al webhook REST; el llamador decide qué hacer con el status"""
+        payload = {"sender": sender_id, "message": message}
+        if metadata is not None:
+            payload["metadata"] = metadata
+        return await self._request("POST", WEBHOOK_PATH, json=payload)
+
+    async def send_message_guarded(self, sender_id: str, message: str,
+                                   metadata: Optional[Dict] = None,
+                                   budget_ms: float = RASA_LATENCY_BUDGET_MS) -> httpx.Response:
+        """
+        send_message con presupuesto de latencia y circuit breaker.
+        Lanza RasaUnavailable en lugar de esperar a los timeouts de httpx;
+        timeouts, errores de conexión, 5xx y cualquier otra excepción cuentan
+        como fallo del breaker; una cancelación libera el turno sin resultado.
+        """
+        if not self.breaker.allow_request():
+            raise RasaUnavailable("circuit_open")
+
+        try:
+            response = await asyncio.wait_for(
+                self.send_message(sender_id, message, metadata=metadata),
+                timeout=budget_ms / 1000
+            )
+        except asyncio.TimeoutError:
+            self.budget_exceeded += 1
+            self.breaker.record_failure("budget_exceeded")
+            raise RasaUnavailable("budget_exceeded")
+        except httpx.HTTPError as e:
+            self.breaker.record_failure(type(e).__name__)
+            raise RasaUnavailable(type(e).__name__)
+        except Exception as e:
+            # Cualquier otro error (p. ej. del transporte) también resuelve la
+            # llamada: si no, el turno de prueba en half-open quedaría ocupado
+            self.breaker.record_failure(type(e).__name__)
+            raise RasaUnavailable(type(e).__name__) from e
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.record_failure(f"status_{response.status_code}")
+            raise RasaUnavailable(f"status_{response.status_code}")
+        self.breaker.record_success()
+        return response
+
+    async def ping(self, timeout: float = 5.0) -> bool:
+        try:
+            response = await self._request("GET", "/", timeout=timeout)
+            return response.status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    # ============================================
+    # MÉTRICAS
+    # ============================================
+
+    def _pool_connections(self) -> Dict:
+        """Conexiones abiertas/ociosas del pool (httpcore, si está accesible)"""
+        try:
+            connections = self._client._transport._pool.connections
+            idle = sum(1 for c in connections if c.is_idle())
+            return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+        except AttributeError:
+            return {}
+
+    def stats(self) -> Dict:
+        latencies = sorted(self._latencies_ms)
+        return {
+            "base_url": self.base_url,
+            "started": self._client is not None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "budget_ms": RASA_LATENCY_BUDGET_MS,
+            "budget_exceeded": self.budget_exceeded,
+            "breaker": self.breaker.stats(),
+            "latency_ms_avg": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+            "latency_ms_p95": round(latencies[int(len(latencies) * 0.95) - 1], 2) if latencies else 0,
+            "pool_limits": {
+                "max_connections": RASA_POOL_MAX_CONNECTIONS,
+                "max_keepalive": RASA_POOL_MAX_KEEPALIVE,
+                "keepalive_expiry": RASA_KEEPALIVE_EXPIRY
+            },
+            "pool": self._pool_connections() if self._client is not None else {}
+        }
+
+
+# Instancia global (una por worker)
+rasa_client = RasaClient()
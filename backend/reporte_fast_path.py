@@ -0,0 +1,83 @@
+# backend/reporte_fast_path.py
+# ✅ REPORTE: ¿QUÉ FRACCIÓN DEL TRÁFICO ABSORBE EL FAST PATH?
+#
+# - Observado: análisis guardados en emotional_texts con fast_path=True
+# - Simulado: re-clasifica los mensajes de pacientes de chat_messages con la
+#   configuración actual (sirve para ajustar umbrales antes de desplegar)
+#
+# Uso:
+#   python reporte_fast_path.py                 # últimos 7 días
+#   python reporte_fast_path.py --days 30 --top 20
+#   NLP_FAST_PATH_MAX_CHARS=60 python reporte_fast_path.py --days 30
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+from mongodb_config import get_database
+from nlp_fast_path import FastPathClassifier
+
+
+def reporte_observado(db, desde: datetime) -> dict:
+    filtro = {"source": "chat_rasa", "timestamp": {"$gte": desde}}
+    total = db.emotional_texts.count_documents(filtro)
+    absorbidos = db.emotional_texts.count_documents({**filtro, "emotional_analysis.fast_path": True})
+    return {
+        "total": total,
+        "absorbidos": absorbidos,
+        "fraccion": round(absorbidos / total, 3) if total else 0
+    }
+
+
+def reporte_simulado(db, desde: datetime, top: int) -> dict:
+    clasificador = FastPathClassifier(enabled=True)
+    motivos = Counter()
+    absorbidos_frecuentes = Counter()
+    total = 0
+
+    cursor = db.chat_messages.find(
+        {"is_bot": False, "timestamp": {"$gte": desde}},
+        {"message": 1, "_id": 0}
+    )
+    for doc in cursor:
+        texto = doc.get("message") or ""
+        total += 1
+        motivo = clasificador.classify(texto)
+        motivos[motivo or "modelos"] += 1
+        if motivo:
+            absorbidos_frecuentes[texto.strip().lower()] += 1
+
+    absorbidos = total - motivos["modelos"]
+    return {
+        "total": total,
+        "absorbidos": absorbidos,
+        "fraccion": round(absorbidos / total, 3) if total else 0,
+        "motivos": dict(motivos),
+        "top_absorbidos": absorbidos_frecuentes.most_common(top)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fracción de mensajes resueltos por el fast path')
+    parser.add_argument('--days', type=int, default=7, help='Ventana en días (por defecto 7)')
+    parser.add_argument('--top', type=int, default=15, help='Mensajes absorbidos más frecuentes a mostrar')
+
+    args = parser.parse_args()
+    desde = datetime.utcnow() - timedelta(days=args.days)
+    db = get_database()
+
+    observado = reporte_observado(db, desde)
+    simulado = reporte_simulado(db, desde, args.top)
+
+    print(f"\n{'='*60}")
+    print(f"⚡ FAST PATH - últimos {args.days} días")
+    print(f"{'='*60}")
+    print(f"Observado (emotional_texts): {observado['absorbidos']}/{observado['total']} "
+          f"= {observado['fraccion']:.1%}")
+    print(f"Simulado  (chat_messages):   {simulado['absorbidos']}/{simulado['total']} "
+          f"= {simulado['fraccion']:.1%}")
+    print(f"\nMotivos: {simulado['motivos']}")
+    print(f"\nMensajes absorbidos más frecuentes:")
+    for texto, veces in simulado['top_absorbidos']:
+        print(f"   {veces:>6}  {texto}")
@@ -0,0 +1,119 @@
+# backend/reporte_memoria_workers.py
+# ✅ REPORTE DE MEMORIA POR WORKER (USS / PSS / RSS)
+#
+# USS = memoria privada del proceso (lo que se libera si el proceso muere).
+# Con pre-fork los pesos de los modelos pasan de USS a memoria compartida.
+#
+# Uso (Linux):
+#   python reporte_memoria_workers.py                          # backend + Rasa actions
+#   python reporte_memoria_workers.py --pattern "rasa_sdk"     # solo el action server
+#   python reporte_memoria_workers.py --save antes.json        # guardar medición
+#   python reporte_memoria_workers.py --compare antes.json     # comparar antes/después
+
+import json
+import os
+import re
+import sys
+from typing import Dict, List
+
+DEFAULT_PATTERN = r"uvicorn|gunicorn|main:app|rasa_sdk|rasa run actions"
+
+
+def _read_smaps_rollup(pid: int) -> Dict[str, int]:
+    """Lee /proc/<pid>/smaps_rollup y devuelve los valores en kB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return values
+
+
+def _cmdline(pid: int) -> str:
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return f.read().replace(b"\x00", b" ").decode(errors="replace").strip()
+
+
+def collect(pattern: str = DEFAULT_PATTERN) -> List[Dict]:
+    """Mide todos los procesos cuyo cmdline coincide con el patrón"""
+    regex = re.compile(pattern)
+    own_pid = os.getpid()
+    procesos = []
+
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) == own_pid:
+            continue
+        pid = int(entry)
+        try:
+            cmd = _cmdline(pid)
+            if not cmd or not regex.search(cmd):
+                continue
+            smaps = _read_smaps_rollup(pid)
+        except (OSError, PermissionError):
+            continue
+
+        uss = smaps.get("Private_Clean", 0) + smaps.get("Private_Dirty", 0)
+        procesos.append({
+            "pid": pid,
+            "cmd": cmd[:80],
+            "uss_mb": round(uss / 1024, 1),
+            "pss_mb": round(smaps.get("Pss", 0) / 1024, 1),
+            "rss_mb": round(smaps.get("Rss", 0) / 1024, 1),
+            "shared_mb": round((smaps.get("Shared_Clean", 0) + smaps.get("Shared_Dirty", 0)) / 1024, 1)
+        })
+
+    return sorted(procesos, key=lambda p: p["pid"])
+
+
+def print_report(procesos: List[Dict], titulo: str = "MEMORIA POR PROCESO"):
+    print(f"\n{'='*90}")
+    print(f"📊 {titulo}")
+    print(f"{'='*90}")
+    print(f"{'PID':>7} {'USS MB':>9} {'PSS MB':>9} {'RSS MB':>9} {'SHARED MB':>10}  CMD")
+    for p in procesos:
+        print(f"{p['pid']:>7} {p['uss_mb']:>9} {p['pss_mb']:>9} {p['rss_mb']:>9} {p['shared_mb']:>10}  {p['cmd']}")
+    print(f"{'─'*90}")
+    print(f"Procesos: {len(procesos)} | USS total: {sum(p['uss_mb'] for p in procesos):.1f} MB | "
+          f"PSS total: {sum(p['pss_mb'] for p in procesos):.1f} MB")
+
+
+def _summary(procesos: List[Dict]) -> Dict:
+    n = len(procesos) or 1
+    return {
+        "procesos": len(procesos),
+        "uss_total_mb": round(sum(p["uss_mb"] for p in procesos), 1),
+        "uss_medio_mb": round(sum(p["uss_mb"] for p in procesos) / n, 1),
+        "pss_total_mb": round(sum(p["pss_mb"] for p in procesos), 1)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='USS/PSS por worker del backend y del action server')
+    parser.add_argument('--pattern', default=DEFAULT_PATTERN, help='Regex sobre el cmdline de los procesos')
+    parser.add_argument('--save', help='Guardar la medición en un archivo JSON')
+    parser.add_argument('--compare', help='Comparar contra una medición guardada')
+
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("❌ Se necesita Linux con /proc/<pid>/smaps_rollup (kernel >= 4.14)")
+        sys.exit(1)
+
+    procesos = collect(args.pattern)
+    print_report(procesos)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(procesos, f, indent=2)
+        print(f"💾 Medición guardada en {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            antes = json.load(f)
+        resumen_antes, resumen_despues = _summary(antes), _summary(procesos)
+        print(f"\n{'ANTES':>30} {'DESPUÉS':>12}")
+        for clave in resumen_antes:
+            print(f"{clave:>18} {resumen_antes[clave]:>11} {resumen_despues[clave]:>12}")
@@ -1,35 +1,63 @@
 # backend/routers/chat_rasa.py
 # ✅ VERSIÓN CORREGIDA - Guardado en MongoDB funcional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from datetime import datetime
-import httpx
+import asyncio
+import base64
+import json
 import os
+import time
+from collections import deque
+from concurrent.futures import Future
 import jwt
 from sqlalchemy.orm import Session
+from bson import ObjectId
+from bson.errors import InvalidId
 
-from database import get_db
+from database import get_db, SessionLocal
 import models
-from mongodb_config import get_database
-from nlp_service import nlp_service
+from mongodb_config import MongoDBService
+from mongodb_async import async_mongodb_service
+from nlp_batcher import nlp_batcher
+from blocking_executor import blocking_executor
+from rasa_client import rasa_client, RasaUnavailable, RASA_URL
+from chatbot_service import chatbot_service
+from write_behind import write_behind
+import chat_user_stats
+from stage_timings import StageTimings, CHAT_TIMING_HEADER
+from ws_sessions import (
+    ws_sessions, ChatSession,
+    WS_HEARTBEAT_SECONDS, WS_INBOUND_QUEUE_SIZE, WS_SEND_QUEUE_SIZE
+)
 
 router = APIRouter()
 
-# URL de Rasa
-RASA_URL = os.getenv("RASA_URL", "http://localhost:5006")
+# Cuánto se retrasa la llamada a Rasa esperando al análisis NLP para mandarlo
+# en el metadata (ms). Los textos del fast path y los aciertos de caché ya
+# están resueltos al encolar y viajan siempre, sin esperar.
+# Si el análisis necesita los modelos, cada ms de presupuesto se suma a la
+# latencia de Rasa. Si no llega a tiempo, el action server no repite el
+# análisis (salvo RASA_LOCAL_NLP_FALLBACK=true): fija la emoción del turno como
+# neutral y solo aplica el léxico de crisis; el backend guarda igualmente su
+# análisis completo. Por defecto no se espera (0); para que los slots de Rasa
+# lleven la emoción real, fijarlo cerca del p95 de
+# /metrics -> chat_nlp_metadata.nlp_ms_p95.
+CHAT_NLP_METADATA_BUDGET_MS = int(os.getenv("CHAT_NLP_METADATA_BUDGET_MS", "0"))
+
+RESPUESTA_VACIA = "Lo siento, no tengo una respuesta en este momento."
 
 # IMPORTANTE: Debe coincidir EXACTAMENTE con el SECRET_KEY del main.py
 SECRET_KEY = "tu-clave-secreta-cambiar-en-produccion"
 ALGORITHM = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=True)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """
-    Obtiene el usuario actual desde el token JWT
-    """
+def _usuario_desde_token(token: str, db: Session) -> models.Usuario:
+    """Decodifica el JWT y busca el usuario; lanza 401 si algo no cuadra"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
@@ -50,6 +78,12 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     
     return user
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """
+    Obtiene el usuario actual desde el token JWT
+    """
+    return _usuario_desde_token(token, db)
+
 # ============================================
 # MODELOS PYDANTIC
 # ============================================
@@ -63,11 +97,229 @@ class RespuestaChat(BaseModel):
     emocion_detectada: Optional[str] = None
     intensidad_emocional: Optional[float] = None
     nivel_riesgo: Optional[str] = None
+    degradado: bool = False
     timestamp: datetime
 
-class HistorialChat(BaseModel):
-    mensajes: List[dict]
-    total: int
+# ============================================
+# PERSISTENCIA
+# ============================================
+
+def _guardar_conversacion_mongo(current_user: models.Usuario, mensaje: str,
+                                respuestas_texto: List[str], analisis: Dict):
+    """
+    Encola mensaje, respuestas y análisis en el buffer write-behind.
+    No espera a MongoDB: el hilo de write_behind los inserta por lotes.
+    """
+    try:
+        print(f"💾 Encolando conversación para MongoDB...")
+        ahora = datetime.utcnow()
+
+        # 3.1 Mensaje del usuario
+        write_behind.enqueue("chat_messages", MongoDBService.rasa_chat_message_document(
+            current_user.id_usuario,
+            mensaje,
+            is_bot=False,
+            timestamp=ahora,
+            emotional_analysis=analisis,
+            sender_name=f"{current_user.nombre} {current_user.apellido}"
+        ))
+
+        # 3.2 Respuesta(s) del bot (timestamp posterior para mantener el orden)
+        for resp_texto in respuestas_texto:
+            write_behind.enqueue("chat_messages", MongoDBService.rasa_chat_message_document(
+                current_user.id_usuario, resp_texto, is_bot=True
+            ))
+
+        # 3.3 Análisis emocional detallado
+        write_behind.enqueue("emotional_texts", MongoDBService.rasa_analysis_document(
+            current_user.id_usuario, mensaje, analisis, timestamp=ahora
+        ))
+
+        # 3.4 Contadores del usuario (/chat/estadisticas)
+        chat_user_stats.record_interaction(
+            current_user.id_usuario,
+            bot_replies=len(respuestas_texto),
+            emotion=analisis.get('emotions', {}).get('dominant_emotion'),
+            at=ahora
+        )
+
+        print(f"✅ {2 + len(respuestas_texto)} documentos encolados")
+
+    except Exception as e:
+        print(f"❌ ERROR CRÍTICO guardando en MongoDB: {e}")
+        print(f"   Tipo de error: {type(e).__name__}")
+        import traceback
+        traceback.print_exc()
+        # ⚠️ NO FALLAR - Continuar aunque MongoDB falle
+
+
+def _crear_alerta_riesgo(db: Session, current_user: models.Usuario,
+                         mensaje: str, analisis: Dict):
+    """Crea la notificación de crisis para el psicólogo asignado"""
+    try:
+        print(f"🚨 Nivel de riesgo {analisis['risk_assessment']['level']} detectado")
+        # Buscar psicólogo asignado
+        asignacion = db.query(models.PacientePsicologo).filter(
+            models.PacientePsicologo.id_paciente == current_user.id_usuario,
+            models.PacientePsicologo.activo == True
+        ).first()
+
+        if asignacion:
+            # Crear notificación de alerta
+            notificacion = models.Notificacion(
+                id_usuario=asignacion.id_psicologo,
+                tipo=models.NotificationType.ALERTA,
+                titulo=f"🚨 Alerta de Crisis - {analisis['risk_assessment']['level'].upper()}",
+                mensaje=(
+                    f"El paciente {current_user.nombre} {current_user.apellido} "
+                    f"ha mostrado indicadores de riesgo nivel {analisis['risk_assessment']['level']} en el chat.\n\n"
+                    f"Mensaje: {mensaje[:200]}{'...' if len(mensaje) > 200 else ''}\n\n"
+                    f"⚠️ Requiere atención inmediata."
+                ),
+                prioridad="critica" if analisis['risk_assessment']['level'] == 'crítico' else "alta"
+            )
+            db.add(notificacion)
+            db.commit()
+            print(f"🚨 Alerta de crisis enviada al psicólogo {asignacion.id_psicologo}")
+    except Exception as e:
+        print(f"⚠️ Error creando alerta: {e}")
+
+
+async def _analizar_mensaje(nlp_future: Future) -> Dict:
+    """Etapa NLP (future de nlp_batcher.submit): nunca lanza; ante error devuelve un análisis neutro"""
+    try:
+        print(f"🧠 Analizando emoción del mensaje...")
+        analisis = await asyncio.wrap_future(nlp_future)
+        print(f"✅ Análisis completado: {analisis['emotions']['dominant_emotion']} ({analisis['risk_assessment']['level']})")
+        return analisis
+    except Exception as e:
+        print(f"⚠️ Error en análisis NLP: {e}")
+        return {
+            'sentiment': {'sentiment_score': 0, 'label': 'neutral'},
+            'emotions': {
+                'dominant_emotion': 'neutral',
+                'scores': {'neutral': 1.0},
+                'confidence': 0.5
+            },
+            'risk_assessment': {
+                'level': 'bajo',
+                'score': 0
+            },
+            'fallback': True
+        }
+
+
+class _MetadataNLPStats:
+    """Cuántos análisis llegan al metadata de Rasa y cuánto tarda el NLP"""
+
+    def __init__(self, samples: int = 1000):
+        self.inmediatos = 0
+        self.en_presupuesto = 0
+        self.fuera_de_presupuesto = 0
+        self._nlp_ms = deque(maxlen=samples)
+
+    def record_nlp(self, ms: float):
+        self._nlp_ms.append(ms)
+
+    def stats(self) -> Dict:
+        nlp_ms = sorted(self._nlp_ms)
+        return {
+            "budget_ms": CHAT_NLP_METADATA_BUDGET_MS,
+            "inmediatos": self.inmediatos,
+            "en_presupuesto": self.en_presupuesto,
+            "fuera_de_presupuesto": self.fuera_de_presupuesto,
+            "nlp_ms_avg": round(sum(nlp_ms) / len(nlp_ms), 2) if nlp_ms else 0,
+            "nlp_ms_p95": round(nlp_ms[int(len(nlp_ms) * 0.95) - 1], 2) if nlp_ms else 0
+        }
+
+
+metadata_nlp_stats = _MetadataNLPStats()
+
+
+def _metadata_para_rasa(analisis: Dict) -> Dict:
+    """
+    Análisis emocional que viaja en el `metadata` del webhook REST.
+    Solo se envía un análisis real: con el de respaldo, Rasa usa sus modelos.
+    """
+    if analisis.get('fallback') or analisis['emotions'].get('dominant_emotion') in (None, 'desconocida'):
+        return {}
+
+    return {
+        "emotional_analysis": {
+            "dominant_emotion": analisis['emotions']['dominant_emotion'],
+            "confidence": analisis['emotions'].get('confidence', 0),
+            "sentiment_score": analisis['sentiment'].get('sentiment_score', 0),
+            "risk_level": analisis['risk_assessment']['level'],
+            "risk_score": analisis['risk_assessment']['score'],
+            "source": "backend_nlp_service"
+        }
+    }
+
+
+async def _consultar_rasa(sender_id: str, texto: str, tiempos: StageTimings):
+    """
+    Lanza el análisis NLP y la llamada a Rasa en paralelo.
+    Devuelve (nlp_task, respuestas, degradado): el análisis puede seguir en curso.
+    Si Rasa no contesta dentro del presupuesto, falla o el breaker está abierto,
+    las respuestas salen de chatbot_service.fallback_response (degradado=True).
+    """
+    nlp_future = nlp_batcher.submit(texto)
+    nlp_task = asyncio.ensure_future(tiempos.measure("nlp", _analizar_mensaje(nlp_future)))
+    try:
+        # Fast path o caché: el future ya está resuelto y el análisis viaja en
+        # el metadata sin esperar; el action server no recalcula
+        if nlp_future.done():
+            metadata_nlp_stats.inmediatos += 1
+            metadata_rasa = _metadata_para_rasa(await nlp_task)
+        else:
+            # Análisis con modelos: solo se espera hasta el presupuesto
+            inicio = time.perf_counter()
+            nlp_future.add_done_callback(
+                lambda _: metadata_nlp_stats.record_nlp((time.perf_counter() - inicio) * 1000)
+            )
+            done = ()
+            if CHAT_NLP_METADATA_BUDGET_MS > 0:
+                done, _ = await asyncio.wait({nlp_task}, timeout=CHAT_NLP_METADATA_BUDGET_MS / 1000)
+            if nlp_task in done:
+                metadata_nlp_stats.en_presupuesto += 1
+                metadata_rasa = _metadata_para_rasa(nlp_task.result())
+            else:
+                metadata_nlp_stats.fuera_de_presupuesto += 1
+                metadata_rasa = {}
+
+        try:
+            rasa_response = await tiempos.measure("rasa", rasa_client.send_message_guarded(
+                sender_id,
+                texto,
+                metadata=metadata_rasa
+            ))
+            print(f"Status Code: {rasa_response.status_code}")
+            if rasa_response.status_code == 200:
+                respuestas_rasa = rasa_response.json()
+                print(f"Respuestas de Rasa: {respuestas_rasa}")
+                return nlp_task, _extraer_respuestas(respuestas_rasa), False
+            motivo = f"status_{rasa_response.status_code}"
+            print(f"❌ Error de Rasa: {rasa_response.text}")
+        except RasaUnavailable as e:
+            motivo = e.reason
+
+        # Respaldo local: necesita el análisis (las respuestas de alto riesgo
+        # dependen de él); el NLP es local y termina muy por debajo del presupuesto
+        print(f"⚠️ Rasa no disponible ({motivo}): respuesta de respaldo")
+        analisis = await nlp_task
+        respaldo = chatbot_service.fallback_response(texto, analisis)
+        return nlp_task, respaldo['responses'], True
+    except BaseException:
+        nlp_task.cancel()
+        raise
+
+
+def _extraer_respuestas(respuestas_rasa) -> List[str]:
+    """Textos de la respuesta del webhook REST (se ignoran botones, imágenes...)"""
+    return [
+        r.get("text") for r in respuestas_rasa
+        if isinstance(r, dict) and r.get("text")
+    ]
 
 # ============================================
 # ENDPOINTS
@@ -76,11 +328,15 @@ class HistorialChat(BaseModel):
 @router.post("/chat/enviar-mensaje", response_model=RespuestaChat)
 async def enviar_mensaje_rasa(
     mensaje: MensajeChat,
+    response: Response,
     current_user: models.Usuario = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Envía un mensaje al chatbot de Rasa y guarda la conversación
+    Envía un mensaje al chatbot de Rasa y guarda la conversación.
+    El análisis NLP y la llamada a Rasa se ejecutan en paralelo; la latencia
+    por etapa se devuelve en la cabecera Server-Timing.
+    Si Rasa no está disponible se responde con el respaldo local (degradado=True).
     """
     # Verificar que sea paciente
     if current_user.rol != models.UserRole.PACIENTE:
@@ -95,6 +351,9 @@ async def enviar_mensaje_rasa(
             detail="El mensaje no puede estar vacío"
         )
     
+    tiempos = StageTimings()
+    nlp_task = None
+    
     try:
         sender_id = f"paciente_{current_user.id_usuario}"
         
@@ -106,175 +365,45 @@ async def enviar_mensaje_rasa(
         print(f"URL Rasa: {RASA_URL}/webhooks/rest/webhook")
         
         # ============================================
-        # 1. ANÁLISIS EMOCIONAL DEL MENSAJE
+        # 1. ANÁLISIS EMOCIONAL + RASA EN PARALELO
         # ============================================
-        analisis = None
-        try:
-            print(f"🧠 Analizando emoción del mensaje...")
-            analisis = nlp_service.comprehensive_analysis(mensaje.mensaje)
-            print(f"✅ Análisis completado: {analisis['emotions']['dominant_emotion']} ({analisis['risk_assessment']['level']})")
-        except Exception as e:
-            print(f"⚠️ Error en análisis NLP: {e}")
-            analisis = {
-                'sentiment': {'sentiment_score': 0, 'label': 'neutral'},
-                'emotions': {
-                    'dominant_emotion': 'neutral',
-                    'scores': {'neutral': 1.0},
-                    'confidence': 0.5
-                },
-                'risk_assessment': {
-                    'level': 'bajo',
-                    'score': 0
-                }
-            }
-        
-        # ============================================
-        # 2. ENVIAR MENSAJE A RASA
-        # ============================================
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            rasa_response = await client.post(
-                f"{RASA_URL}/webhooks/rest/webhook",
-                json={
-                    "sender": sender_id,
-                    "message": mensaje.mensaje
-                }
-            )
-        
-        print(f"Status Code: {rasa_response.status_code}")
-        
-        if rasa_response.status_code != 200:
-            print(f"❌ Error de Rasa: {rasa_response.text}")
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail=f"El servicio de chat no está disponible (Status: {rasa_response.status_code})"
-            )
-        
-        respuestas_rasa = rasa_response.json()
-        print(f"Respuestas de Rasa: {respuestas_rasa}")
-        
-        # Extraer textos de las respuestas
-        respuestas_texto = []
-        for r in respuestas_rasa:
-            if isinstance(r, dict) and r.get("text"):
-                respuestas_texto.append(r.get("text"))
-        
-        respuesta_principal = respuestas_texto[0] if respuestas_texto else "Lo siento, no tengo una respuesta en este momento."
+        nlp_task, respuestas_texto, degradado = await _consultar_rasa(
+            sender_id, mensaje.mensaje, tiempos
+        )
+        analisis = await nlp_task
+
+        respuesta_principal = respuestas_texto[0] if respuestas_texto else RESPUESTA_VACIA
         
         print(f"✅ Respuesta principal: {respuesta_principal[:100]}...")
         
         # ============================================
-        # 3. GUARDAR EN MONGODB
+        # 2. PERSISTENCIA (write-behind) Y ALERTAS (fuera del event loop)
         # ============================================
-        try:
-            print(f"💾 Guardando en MongoDB...")
-            mongo_db = get_database()
-            
-            # 3.1 Guardar mensaje del usuario
-            print(f"   📝 Guardando mensaje del usuario...")
-            user_message_doc = {
-                "user_id": str(current_user.id_usuario),  # ✅ COMO STRING
-                "message": mensaje.mensaje,
-                "is_bot": False,
-                "timestamp": datetime.utcnow(),
-                "emotional_analysis": {  # ✅ ESTRUCTURA CORRECTA
-                    "sentiment": analisis.get('sentiment', {}),
-                    "emotions": analisis.get('emotions', {}),
-                    "risk_assessment": analisis.get('risk_assessment', {})
-                },
-                "sender_name": f"{current_user.nombre} {current_user.apellido}"
-            }
-            
-            result_user = mongo_db.chat_messages.insert_one(user_message_doc)
-            print(f"   ✅ Mensaje usuario guardado con ID: {result_user.inserted_id}")
-            
-            # 3.2 Guardar respuesta(s) del bot
-            print(f"   📝 Guardando {len(respuestas_texto)} respuesta(s) del bot...")
-            for idx, resp_texto in enumerate(respuestas_texto):
-                bot_message_doc = {
-                    "user_id": str(current_user.id_usuario),  # ✅ COMO STRING
-                    "message": resp_texto,
-                    "is_bot": True,
-                    "timestamp": datetime.utcnow()
-                }
-                result_bot = mongo_db.chat_messages.insert_one(bot_message_doc)
-                print(f"   ✅ Respuesta {idx+1} guardada con ID: {result_bot.inserted_id}")
-            
-            # 3.3 Guardar análisis emocional detallado
-            print(f"   📝 Guardando análisis emocional detallado...")
-            emotional_doc = {
-                "user_id": str(current_user.id_usuario),  # ✅ COMO STRING
-                "text": mensaje.mensaje,
-                "emotional_analysis": analisis,
-                "source": "chat_rasa",
-                "timestamp": datetime.utcnow()
-            }
-            result_emotional = mongo_db.emotional_texts.insert_one(emotional_doc)
-            print(f"   ✅ Análisis emocional guardado con ID: {result_emotional.inserted_id}")
-            
-            print(f"✅ Todo guardado exitosamente en MongoDB")
-            
-        except Exception as e:
-            print(f"❌ ERROR CRÍTICO guardando en MongoDB: {e}")
-            print(f"   Tipo de error: {type(e).__name__}")
-            import traceback
-            traceback.print_exc()
-            # ⚠️ NO FALLAR - Continuar aunque MongoDB falle
+        # Encolar en write-behind no bloquea (cola + buffer de desborde): no hace falta el executor
+        _guardar_conversacion_mongo(current_user, mensaje.mensaje, respuestas_texto, analisis)
         
-        # ============================================
-        # 4. CREAR ALERTA EN POSTGRESQL SI HAY ALTO RIESGO
-        # ============================================
-        if analisis and analisis['risk_assessment']['level'] in ['alto', 'crítico']:
-            try:
-                print(f"🚨 Nivel de riesgo {analisis['risk_assessment']['level']} detectado")
-                # Buscar psicólogo asignado
-                asignacion = db.query(models.PacientePsicologo).filter(
-                    models.PacientePsicologo.id_paciente == current_user.id_usuario,
-                    models.PacientePsicologo.activo == True
-                ).first()
-                
-                if asignacion:
-                    # Crear notificación de alerta
-                    notificacion = models.Notificacion(
-                        id_usuario=asignacion.id_psicologo,
-                        tipo=models.NotificationType.ALERTA,
-                        titulo=f"🚨 Alerta de Crisis - {analisis['risk_assessment']['level'].upper()}",
-                        mensaje=(
-                            f"El paciente {current_user.nombre} {current_user.apellido} "
-                            f"ha mostrado indicadores de riesgo nivel {analisis['risk_assessment']['level']} en el chat.\n\n"
-                            f"Mensaje: {mensaje.mensaje[:200]}{'...' if len(mensaje.mensaje) > 200 else ''}\n\n"
-                            f"⚠️ Requiere atención inmediata."
-                        ),
-                        prioridad="critica" if analisis['risk_assessment']['level'] == 'crítico' else "alta"
-                    )
-                    db.add(notificacion)
-                    db.commit()
-                    print(f"🚨 Alerta de crisis enviada al psicólogo {asignacion.id_psicologo}")
-            except Exception as e:
-                print(f"⚠️ Error creando alerta: {e}")
+        # Alerta en PostgreSQL si hay alto riesgo
+        if analisis['risk_assessment']['level'] in ['alto', 'crítico']:
+            await tiempos.measure("alert", blocking_executor.run(
+                _crear_alerta_riesgo,
+                db, current_user, mensaje.mensaje, analisis
+            ))
         
+        if CHAT_TIMING_HEADER:
+            response.headers["Server-Timing"] = tiempos.header()
+        print(f"⏱️ {tiempos.header()}")
         print(f"{'='*60}\n")
         
         return RespuestaChat(
             respuesta=respuesta_principal,
             respuestas=respuestas_texto,
-            emocion_detectada=analisis['emotions']['dominant_emotion'] if analisis else None,
-            intensidad_emocional=analisis['risk_assessment']['score'] if analisis else None,
-            nivel_riesgo=analisis['risk_assessment']['level'] if analisis else None,
+            emocion_detectada=analisis['emotions']['dominant_emotion'],
+            intensidad_emocional=analisis['risk_assessment']['score'],
+            nivel_riesgo=analisis['risk_assessment']['level'],
+            degradado=degradado,
             timestamp=datetime.utcnow()
         )
         
-    except httpx.ConnectError as e:
-        print(f"❌ Error de conexión con Rasa: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"No se pudo conectar con Rasa en {RASA_URL}"
-        )
-    except httpx.TimeoutException:
-        print(f"⏱️ Timeout conectando con Rasa")
-        raise HTTPException(
-            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
-            detail="El servidor de chat tardó demasiado en responder"
-        )
     except HTTPException:
         raise
     except Exception as e:
@@ -285,66 +414,219 @@ async def enviar_mensaje_rasa(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error procesando el mensaje: {str(e)}"
         )
+    finally:
+        # Si Rasa falló antes de que terminara el análisis, no dejarlo colgado
+        if nlp_task is not None and not nlp_task.done():
+            nlp_task.cancel()
 
 
-@router.get("/chat/historial", response_model=HistorialChat)
-def obtener_historial_chat(
-    limit: int = 50,
+@router.post("/chat/avanzado/stream")
+async def enviar_mensaje_avanzado_stream(
+    mensaje: MensajeChat,
     current_user: models.Usuario = Depends(get_current_user)
 ):
     """
-    Obtiene el historial de chat del usuario actual
+    Chat avanzado (LLM) con la respuesta en streaming, una línea JSON por evento:
+      {"tipo": "delta", "texto": "..."}      fragmento de la respuesta según llega
+      {"tipo": "final", "respuesta": ..., "emocion_detectada": ..., ...}
+      {"tipo": "error", "detalle": ...}      si la generación falla a mitad
+    El time-to-first-token por proveedor queda en /metrics (llm_streaming).
     """
     if current_user.rol != models.UserRole.PACIENTE:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo pacientes pueden ver su historial"
+            detail="Solo pacientes pueden usar el chat"
+        )
+    
+    if not mensaje.mensaje or len(mensaje.mensaje.strip()) < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El mensaje no puede estar vacío"
         )
     
+    # Import diferido: carga clientes de LLM y modelos que el chat con Rasa no usa
+    from advanced_chatbot_service import advanced_chatbot
+    
+    eventos = advanced_chatbot.process_message_stream(current_user.id_usuario, mensaje.mensaje)
+    
+    def siguiente():
+        return next(eventos, None)
+    
+    async def generar():
+        try:
+            while True:
+                # Análisis, contexto y cada fragmento del LLM son bloqueantes
+                evento = await blocking_executor.run(siguiente)
+                if evento is None:
+                    break
+                if evento['type'] == 'delta':
+                    linea = {"tipo": "delta", "texto": evento['text']}
+                else:
+                    analisis = evento['emotional_analysis']
+                    linea = {
+                        "tipo": "final",
+                        "respuesta": evento['response'],
+                        "emocion_detectada": analisis.get('dominant_emotion'),
+                        "nivel_riesgo": analisis['risk_assessment']['level'],
+                        "requiere_seguimiento": evento['requires_followup'],
+                        "recomendaciones": evento['therapeutic_recommendations'],
+                        "timestamp": evento['timestamp']
+                    }
+                yield json.dumps(linea, ensure_ascii=False, default=str) + "\n"
+        except Exception as e:
+            print(f"❌ Error en chat avanzado (stream): {e}")
+            yield json.dumps({"tipo": "error", "detalle": "Error generando la respuesta"}) + "\n"
+        finally:
+            # Cliente desconectado: cerrar el generador corta el stream del proveedor.
+            # Si un hilo sigue dentro de next() el generador termina por su cuenta.
+            try:
+                eventos.close()
+            except ValueError:
+                pass
+    
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
+
+
+def _codificar_cursor(msg: Dict) -> str:
+    """Cursor opaco de paginación: timestamp + _id del mensaje"""
+    crudo = f"{msg['timestamp'].isoformat()}|{msg['_id']}"
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def _decodificar_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
     try:
-        mongo_db = get_database()
-        
-        # ✅ Buscar con user_id como STRING
-        mensajes = list(mongo_db.chat_messages.find({
-            "user_id": str(current_user.id_usuario)
-        }).sort("timestamp", -1).limit(limit))
-        
-        print(f"📊 Encontrados {len(mensajes)} mensajes en MongoDB para usuario {current_user.id_usuario}")
-        
-        # Formatear mensajes (del más antiguo al más reciente)
-        mensajes_formateados = []
-        for msg in reversed(mensajes):
-            mensajes_formateados.append({
-                "role": "assistant" if msg.get("is_bot") else "user",
-                "mensaje": msg.get("message"),
-                "timestamp": msg.get("timestamp").isoformat() if msg.get("timestamp") else None,
-                "emocion_detectada": (
-                    msg.get("emotional_analysis", {}).get("emotions", {}).get("dominant_emotion") 
-                    if not msg.get("is_bot") else None
-                ),
-                "intensidad_emocional": (
-                    msg.get("emotional_analysis", {}).get("risk_assessment", {}).get("score") 
-                    if not msg.get("is_bot") else None
-                )
-            })
-        
-        return HistorialChat(
-            mensajes=mensajes_formateados,
-            total=len(mensajes_formateados)
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, oid = crudo.split("|")
+        return datetime.fromisoformat(ts), ObjectId(oid)
+    except (ValueError, InvalidId):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de historial no válido"
+        )
+
+
+# Solo los campos que muestra la interfaz (sin el análisis completo)
+HISTORIAL_PROJECTION = {
+    "message": 1,
+    "is_bot": 1,
+    "timestamp": 1,
+    "emotional_analysis.emotions.dominant_emotion": 1,
+    "emotional_analysis.risk_assessment.score": 1
+}
+HISTORIAL_MAX_LIMIT = 200
+
+
+def _formatear_mensaje(msg: Dict) -> Dict:
+    analisis = msg.get("emotional_analysis") or {}
+    return {
+        "role": "assistant" if msg.get("is_bot") else "user",
+        "mensaje": msg.get("message"),
+        "timestamp": msg.get("timestamp").isoformat() if msg.get("timestamp") else None,
+        "emocion_detectada": (
+            analisis.get("emotions", {}).get("dominant_emotion")
+            if not msg.get("is_bot") else None
+        ),
+        "intensidad_emocional": (
+            analisis.get("risk_assessment", {}).get("score")
+            if not msg.get("is_bot") else None
+        )
+    }
+
+
+@router.get("/chat/historial")
+async def obtener_historial_chat(
+    limit: int = Query(50, ge=1, le=HISTORIAL_MAX_LIMIT),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: models.Usuario = Depends(get_current_user)
+):
+    """
+    Historial de chat paginado por cursor. Los mensajes van siempre del más
+    antiguo al más nuevo, como antes de paginar.
+    - sin cursor: la página más reciente
+    - before=<cursor_before>: la página anterior (más antigua)
+    - after=<cursor_after>: mensajes posteriores
+    {"mensajes": [...], "total": n, "orden": "asc", "hay_mas": bool,
+     "cursor_before": ..., "cursor_after": ...}
+    Las páginas hacia atrás se leen de MongoDB en orden inverso (keyset) y se
+    invierten en memoria (como mucho HISTORIAL_MAX_LIMIT mensajes); las de
+    `after` se envían a medida que se leen.
+    """
+    if current_user.rol != models.UserRole.PACIENTE:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo pacientes pueden ver su historial"
+        )
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Usa before o after, no ambos"
         )
     
-    except Exception as e:
-        print(f"❌ Error obteniendo historial: {e}")
-        import traceback
-        traceback.print_exc()
-        return HistorialChat(
-            mensajes=[],
-            total=0
+    cursor_before = _decodificar_cursor(before)
+    cursor_after = _decodificar_cursor(after)
+    hacia_atras = cursor_after is None
+    user_id = current_user.id_usuario
+    
+    async def leer_pagina():
+        """(mensaje, hay_mas) en orden ascendente"""
+        # limit + 1: el sobrante solo indica que hay más páginas
+        pagina = async_mongodb_service.iter_chat_page(
+            user_id, limit + 1,
+            before=cursor_before, after=cursor_after,
+            projection=HISTORIAL_PROJECTION
         )
+        if hacia_atras:
+            recientes = [msg async for msg in pagina]
+            hay_mas = len(recientes) > limit
+            for msg in reversed(recientes[:limit]):
+                yield msg, hay_mas
+            return
+        leidos = 0
+        async for msg in pagina:
+            if leidos == limit:
+                yield None, True
+                return
+            leidos += 1
+            yield msg, False
+    
+    async def generar():
+        mas_antiguo = mas_nuevo = None
+        total = 0
+        hay_mas = False
+        error = None
+        yield '{"mensajes": ['
+        try:
+            async for msg, mas in leer_pagina():
+                hay_mas = hay_mas or mas
+                if msg is None:
+                    break
+                yield ("," if total else "") + json.dumps(_formatear_mensaje(msg), ensure_ascii=False)
+                mas_antiguo = mas_antiguo or msg
+                mas_nuevo = msg
+                total += 1
+        except Exception as e:
+            print(f"❌ Error obteniendo historial: {e}")
+            error = "Error obteniendo historial"
+        
+        cierre = {
+            "total": total,
+            "orden": "asc",
+            "hay_mas": hay_mas,
+            "cursor_before": _codificar_cursor(mas_antiguo) if mas_antiguo else before,
+            "cursor_after": _codificar_cursor(mas_nuevo) if mas_nuevo else after
+        }
+        if error:
+            cierre["error"] = error
+        yield "], " + json.dumps(cierre, ensure_ascii=False)[1:]
+    
+    return StreamingResponse(generar(), media_type="application/json")
 
 
 @router.get("/chat/estadisticas")
-def obtener_estadisticas_chat(
+async def obtener_estadisticas_chat(
     current_user: models.Usuario = Depends(get_current_user)
 ):
     """
@@ -357,54 +639,24 @@ def obtener_estadisticas_chat(
         )
     
     try:
-        mongo_db = get_database()
-        
-        # ✅ Buscar con user_id como STRING
-        user_id_str = str(current_user.id_usuario)
+        # Un documento por usuario, mantenido al guardar cada mensaje. El
+        # historial anterior a los contadores lo carga migrar_user_id.py antes
+        # del despliegue: sin documento, el usuario no tiene mensajes
+        stats = (await async_mongodb_service.get_chat_user_stats(current_user.id_usuario)
+                 or chat_user_stats.empty_stats(current_user.id_usuario))
         
-        # Total de mensajes del usuario
-        total_mensajes_usuario = mongo_db.chat_messages.count_documents({
-            "user_id": user_id_str,
-            "is_bot": False
-        })
-        
-        # Total de conversaciones (respuestas del bot)
-        total_respuestas_bot = mongo_db.chat_messages.count_documents({
-            "user_id": user_id_str,
-            "is_bot": True
-        })
-        
-        # Emociones más frecuentes
-        pipeline = [
-            {
-                "$match": {
-                    "user_id": user_id_str,
-                    "is_bot": False,
-                    "emotional_analysis.emotions.dominant_emotion": {"$exists": True}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$emotional_analysis.emotions.dominant_emotion",
-                    "count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"count": -1}},
-            {"$limit": 5}
-        ]
-        
-        emociones = list(mongo_db.chat_messages.aggregate(pipeline))
-        emociones_formateadas = [
-            {"emocion": e["_id"], "cantidad": e["count"]}
-            for e in emociones
-        ]
+        total_mensajes_usuario = stats.get("user_messages", 0)
+        total_respuestas_bot = stats.get("bot_replies", 0)
         
         return {
             "total_mensajes": total_mensajes_usuario,
             "total_conversaciones": total_respuestas_bot,
-            "emociones_frecuentes": emociones_formateadas,
+            "emociones_frecuentes": chat_user_stats.top_emotions(stats, limit=5),
             "promedio_mensajes_por_sesion": (
                 total_mensajes_usuario / max(total_respuestas_bot, 1)
+            ),
+            "ultima_actividad": (
+                stats["last_activity"].isoformat() if stats.get("last_activity") else None
             )
         }
     
@@ -421,7 +673,7 @@ def obtener_estadisticas_chat(
 
 
 @router.post("/chat/limpiar-historial")
-def limpiar_historial_chat(
+async def limpiar_historial_chat(
     current_user: models.Usuario = Depends(get_current_user)
 ):
     """
@@ -434,24 +686,13 @@ def limpiar_historial_chat(
         )
     
     try:
-        mongo_db = get_database()
-        user_id_str = str(current_user.id_usuario)
-        
-        # Eliminar mensajes del chat
-        result_chat = mongo_db.chat_messages.delete_many({
-            "user_id": user_id_str
-        })
-        
-        # Eliminar análisis emocionales del chat
-        result_emotional = mongo_db.emotional_texts.delete_many({
-            "user_id": user_id_str,
-            "source": "chat_rasa"
-        })
+        # Eliminar mensajes del chat y análisis emocionales del chat
+        eliminados = await async_mongodb_service.delete_chat_history(current_user.id_usuario)
         
         return {
             "mensaje": "Historial limpiado exitosamente",
-            "mensajes_eliminados": result_chat.deleted_count,
-            "analisis_eliminados": result_emotional.deleted_count
+            "mensajes_eliminados": eliminados["chat_messages"],
+            "analisis_eliminados": eliminados["emotional_texts"]
         }
     
     except Exception as e:
@@ -463,7 +704,7 @@ def limpiar_historial_chat(
 
 
 @router.get("/chat/health")
-def verificar_estado_chat():
+async def verificar_estado_chat():
     """
     Verifica el estado del servicio de chat (Rasa + MongoDB)
     """
@@ -474,18 +715,11 @@ def verificar_estado_chat():
     }
     
     # Verificar Rasa
-    try:
-        import requests
-        response = requests.get(f"{RASA_URL}/", timeout=5)
-        if response.status_code == 200:
-            status_dict["rasa"] = "online"
-    except:
-        status_dict["rasa"] = "offline"
+    status_dict["rasa"] = "online" if await rasa_client.ping(timeout=5.0) else "offline"
     
     # Verificar MongoDB
     try:
-        mongo_db = get_database()
-        mongo_db.command('ping')
+        await async_mongodb_service.ping()
         status_dict["mongodb"] = "online"
     except Exception as e:
         status_dict["mongodb"] = f"offline: {str(e)}"
@@ -502,6 +736,7 @@ def verificar_estado_chat():
         "status": status_dict["overall"],
         "services": status_dict,
         "rasa_url": RASA_URL,
+        "rasa_breaker": rasa_client.breaker.state,
         "message": f"Chat: {status_dict['overall']}"
     }
 
@@ -511,29 +746,24 @@ def verificar_estado_chat():
 # ============================================
 
 @router.get("/chat/debug/verificar-mongodb")
-def debug_verificar_mongodb(
+async def debug_verificar_mongodb(
     current_user: models.Usuario = Depends(get_current_user)
 ):
     """
     🔍 Endpoint de debugging para verificar MongoDB
     """
     try:
-        mongo_db = get_database()
-        user_id_str = str(current_user.id_usuario)
-        
-        # Contar documentos
-        count_messages = mongo_db.chat_messages.count_documents({"user_id": user_id_str})
-        count_emotional = mongo_db.emotional_texts.count_documents({"user_id": user_id_str})
+        user_id = current_user.id_usuario
         
-        # Obtener último mensaje
-        ultimo_mensaje = mongo_db.chat_messages.find_one(
-            {"user_id": user_id_str},
-            sort=[("timestamp", -1)]
+        # Contar documentos y obtener último mensaje
+        count_messages, count_emotional, ultimo_mensaje = await asyncio.gather(
+            async_mongodb_service.count_chat_messages(user_id),
+            async_mongodb_service.count_emotional_texts(user_id),
+            async_mongodb_service.get_last_chat_message(user_id)
         )
         
         return {
-            "user_id": current_user.id_usuario,
-            "user_id_str": user_id_str,
+            "user_id": user_id,
             "mongodb_status": "connected",
             "collections": {
                 "chat_messages": count_messages,
@@ -550,4 +780,217 @@ def debug_verificar_mongodb(
             "error": str(e),
             "type": type(e).__name__,
             "mongodb_status": "error"
-        }
\ No newline at end of file
+        }
+
+# ============================================
+# 🔌 WEBSOCKET
+# ============================================
+# Una conexión por pestaña: autenticación una sola vez al conectar y la
+# respuesta del bot se empuja en cuanto Rasa contesta; el análisis llega
+# después en un frame aparte.
+#
+# Cliente -> servidor:
+#   {"type": "message", "id": "c1", "mensaje": "..."}
+#   {"type": "ping"} / {"type": "pong"}
+# Servidor -> cliente:
+#   {"type": "ready", "session_id": "...", "last_seq": N, "resumed": bool}
+#   {"type": "reply", "seq": N, "in_reply_to": "c1", "respuesta": "...", "respuestas": [...], "degradado": bool}
+#   {"type": "analysis", "seq": N, "in_reply_to": "c1", "emocion_detectada": ..., ...}
+#   {"type": "error", "in_reply_to": "c1", "detail": "..."}
+#   {"type": "ping"} (heartbeat) / {"type": "pong"}
+#   {"type": "resync"} (los frames perdidos ya no están: recargar el historial)
+#
+# Reconexión: /api/chat/chat/ws?token=...&session_id=...&last_seq=N
+
+WS_CLOSE_POLICY_VIOLATION = 1008
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+WS_CLOSE_SESSION_TAKEN_OVER = 4001
+
+
+def _usuario_ws(token: str) -> Optional[models.Usuario]:
+    """Autenticación del WebSocket con una sesión propia (no hay Depends(get_db))"""
+    db = SessionLocal()
+    try:
+        return _usuario_desde_token(token, db)
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+
+
+def _crear_alerta_riesgo_ws(current_user: models.Usuario, mensaje: str, analisis: Dict):
+    db = SessionLocal()
+    try:
+        _crear_alerta_riesgo(db, current_user, mensaje, analisis)
+    finally:
+        db.close()
+
+
+async def _procesar_mensaje_ws(session: ChatSession, current_user: models.Usuario,
+                               mensaje_id: Optional[str], texto: str):
+    """Mismo flujo que /chat/enviar-mensaje, empujando reply y analysis por separado"""
+    tiempos = StageTimings()
+    nlp_task = None
+    try:
+        sender_id = f"paciente_{current_user.id_usuario}"
+        nlp_task, respuestas_texto, degradado = await _consultar_rasa(sender_id, texto, tiempos)
+
+        session.push(
+            "reply",
+            in_reply_to=mensaje_id,
+            respuesta=respuestas_texto[0] if respuestas_texto else RESPUESTA_VACIA,
+            respuestas=respuestas_texto,
+            degradado=degradado,
+            timestamp=datetime.utcnow().isoformat()
+        )
+
+        analisis = await nlp_task
+        session.push(
+            "analysis",
+            in_reply_to=mensaje_id,
+            emocion_detectada=analisis['emotions']['dominant_emotion'],
+            intensidad_emocional=analisis['risk_assessment']['score'],
+            nivel_riesgo=analisis['risk_assessment']['level']
+        )
+
+        _guardar_conversacion_mongo(current_user, texto, respuestas_texto, analisis)
+        if analisis['risk_assessment']['level'] in ['alto', 'crítico']:
+            await tiempos.measure("alert", blocking_executor.run(
+                _crear_alerta_riesgo_ws, current_user, texto, analisis
+            ))
+        print(f"⏱️ WS {tiempos.header()}")
+
+    except Exception as e:
+        # Un fallo en un mensaje no cierra el socket: se responde con un frame
+        # de error numerado (queda en replay) y se sigue con el siguiente
+        print(f"❌ Error procesando mensaje WS {mensaje_id}: {e}")
+        session.push(
+            "error",
+            in_reply_to=mensaje_id,
+            detail="No se pudo procesar el mensaje, inténtalo de nuevo"
+        )
+
+    finally:
+        if nlp_task is not None and not nlp_task.done():
+            nlp_task.cancel()
+
+
+@router.websocket("/chat/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    token: str = Query(...),
+    session_id: Optional[str] = Query(None),
+    last_seq: int = Query(0)
+):
+    """
+    Chat por WebSocket con heartbeat, contrapresión y reanudación por seq
+    """
+    current_user = await blocking_executor.run(_usuario_ws, token)
+    if current_user is None or current_user.rol != models.UserRole.PACIENTE:
+        await websocket.close(code=WS_CLOSE_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    session, resumed, owner = ws_sessions.attach(current_user.id_usuario, session_id)
+    outbound = session.outbound
+    taken_over = session.taken_over
+    await websocket.send_json({
+        "type": "ready",
+        "session_id": session.id,
+        "last_seq": session.seq,
+        "resumed": resumed
+    })
+
+    # Reenviar lo que se perdió durante la desconexión
+    if resumed:
+        pendientes = session.frames_after(last_seq)
+        if pendientes is None:
+            await websocket.send_json({"type": "resync"})
+        else:
+            for frame in pendientes:
+                await websocket.send_json(frame)
+
+    # Los mensajes se procesan en orden; si el cliente envía más rápido de lo
+    # que responde Rasa, la cola acotada rechaza el exceso
+    entrantes: asyncio.Queue = asyncio.Queue(maxsize=WS_INBOUND_QUEUE_SIZE)
+    loop = asyncio.get_running_loop()
+    ultima_actividad = loop.time()
+
+    async def enviar():
+        while True:
+            frame = await outbound.get()
+            await websocket.send_json(frame)
+
+    async def procesar():
+        while True:
+            mensaje_id, texto = await entrantes.get()
+            # shield: si el socket se cae a mitad, la respuesta termina igual y
+            # queda en el buffer de replay para cuando el cliente reanude
+            await asyncio.shield(_procesar_mensaje_ws(session, current_user, mensaje_id, texto))
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_SECONDS)
+            if loop.time() - ultima_actividad > 2 * WS_HEARTBEAT_SECONDS:
+                print(f"💤 WS sin actividad, cerrando sesión {session.id}")
+                await websocket.close()
+                return
+            session.send({"type": "ping"})
+
+    async def recibir():
+        nonlocal ultima_actividad
+        while True:
+            frame = await websocket.receive_json()
+            ultima_actividad = loop.time()
+            tipo = frame.get("type") if isinstance(frame, dict) else None
+
+            if tipo == "message":
+                texto = (frame.get("mensaje") or "").strip()
+                if not texto:
+                    session.send({"type": "error", "in_reply_to": frame.get("id"),
+                                  "detail": "El mensaje no puede estar vacío"})
+                    continue
+                try:
+                    entrantes.put_nowait((frame.get("id"), texto))
+                except asyncio.QueueFull:
+                    session.send({"type": "error", "in_reply_to": frame.get("id"),
+                                  "detail": "Demasiados mensajes pendientes, espera la respuesta"})
+            elif tipo == "ping":
+                session.send({"type": "pong"})
+            elif tipo != "pong":
+                session.send({"type": "error", "detail": f"Tipo de frame desconocido: {tipo}"})
+
+    tareas = [asyncio.ensure_future(t()) for t in (enviar, procesar, heartbeat, recibir)]
+    desbordada = asyncio.ensure_future(session.overflowed.wait())
+    reemplazada = asyncio.ensure_future(taken_over.wait())
+    try:
+        done, _ = await asyncio.wait(tareas + [desbordada, reemplazada],
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if reemplazada in done:
+            # Otro socket reanudó esta sesión: este ya no es el dueño
+            print(f"🔁 WS {session.id}: sesión reanudada en otra conexión, cerrando la anterior")
+            try:
+                await websocket.close(code=WS_CLOSE_SESSION_TAKEN_OVER)
+            except RuntimeError:
+                pass
+        elif desbordada in done:
+            # El cliente no lee: se corta y reanuda con last_seq
+            ws_sessions.slow_consumer_closes += 1
+            print(f"⚠️ WS {session.id}: cola de salida llena ({WS_SEND_QUEUE_SIZE}), cerrando")
+            try:
+                await websocket.close(code=WS_CLOSE_TRY_AGAIN_LATER)
+            except RuntimeError:
+                pass
+        for tarea in done:
+            if tarea is desbordada or tarea is reemplazada:
+                continue
+            error = tarea.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                print(f"❌ Error en WebSocket de chat: {error}")
+    finally:
+        desbordada.cancel()
+        reemplazada.cancel()
+        for tarea in tareas:
+            tarea.cancel()
+        # No-op si otra conexión ya se quedó con la sesión
+        ws_sessions.detach(session, owner)
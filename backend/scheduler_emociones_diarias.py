@@ -35,7 +35,7 @@ def calcular_emociones_diarias():
                 fin_dia = datetime.combine(fecha_hoy, datetime.max.time())
                 
                 mensajes_hoy = list(mongodb_service.emotional_texts.find({
-                    "user_id": str(paciente.id_usuario),
+                    "user_id": paciente.id_usuario,
                     "timestamp": {
                         "$gte": inicio_dia,
                         "$lte": fin_dia
@@ -0,0 +1,36 @@
+# backend/stage_timings.py
+# ✅ TIEMPOS POR ETAPA DE UNA PETICIÓN
+# Se devuelven en la cabecera estándar Server-Timing (visible en la pestaña
+# Network del navegador) para comprobar qué etapas se solapan.
+#   Server-Timing: nlp;dur=85.2, rasa;dur=410.7, persist;dur=12.4, total;dur=431.0
+
+import os
+import time
+from typing import Awaitable, Dict, TypeVar
+
+CHAT_TIMING_HEADER = os.getenv("CHAT_TIMING_HEADER", "true").lower() == "true"
+
+T = TypeVar("T")
+
+
+class StageTimings:
+    """Cronómetro por etapa; las etapas pueden ejecutarse en paralelo"""
+
+    def __init__(self):
+        self._started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    async def measure(self, stage: str, awaitable: Awaitable[T]) -> T:
+        started_at = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[stage] = (time.perf_counter() - started_at) * 1000
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started_at) * 1000
+
+    def header(self) -> str:
+        parts = [f"{stage};dur={ms:.1f}" for stage, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
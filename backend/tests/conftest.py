@@ -0,0 +1,8 @@
+# backend/tests/conftest.py
+# Los módulos del backend son planos (import mongo_pipelines, ...): se añade
+# backend/ al path para poder ejecutar pytest desde la raíz o desde backend/
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,232 @@
+# backend/tests/test_mongo_pipelines.py
+# ✅ PIPELINES DE mongo_pipelines == BUCLES ANTERIORES
+# Las agregaciones deben devolver lo mismo que las consultas de MongoDBService
+# a las que sustituyen (find + bucle en Python, count_documents). Esas
+# implementaciones se conservan aquí como oráculo de referencia.
+#
+# Los fixtures mezclan las dos formas de documento de emotional_texts
+# (campos en la raíz y anidados en emotional_analysis, como escribe chat_rasa).
+#
+# Patrones y riesgo alto corren sobre mongomock. $unionWith (engagement y
+# contexto de conversación) no está en mongomock: esas pruebas necesitan un
+# MongoDB >= 4.4 en MONGODB_TEST_URL y se omiten si no está definido.
+#
+# Uso:
+#   cd backend
+#   python -m pytest tests/test_mongo_pipelines.py -q
+#   MONGODB_TEST_URL=mongodb://localhost:27017/ python -m pytest tests -q
+
+import math
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import pytest
+
+from conversation_context_cache import UserContext, _hora
+from mongo_pipelines import (
+    emotional_patterns_pipeline, emotional_patterns_from_facet,
+    high_risk_entries_pipeline, engagement_pipeline, engagement_from_groups,
+    conversation_context_pipeline, pattern_fields
+)
+
+mongomock = pytest.importorskip("mongomock")
+
+USER_ID = 7
+AHORA = datetime(2024, 3, 15, 12, 0)
+EMOCIONES = ["alegría", "tristeza", "ansiedad", "enojo", "", None]
+NIVELES = ["bajo", "medio", "alto", None]
+MONGODB_TEST_URL = os.getenv("MONGODB_TEST_URL")
+
+
+# ============================================
+# ORÁCULO: IMPLEMENTACIONES ANTERIORES
+# ============================================
+
+def patrones_referencia(db, user_id: int, start_date: datetime, days: int) -> Dict:
+    texts_list = list(db.emotional_texts.find({
+        "user_id": user_id,
+        "timestamp": {"$gte": start_date}
+    }).sort("timestamp", 1))
+
+    if not texts_list:
+        return {"total_entries": 0, "dominant_emotions": {}, "average_sentiment": 0, "risk_alerts": 0}
+
+    emotion_counts = {}
+    sentiment_sum = 0
+    high_risk_count = 0
+    for text in texts_list:
+        if text.get("emotions") and text["emotions"].get("dominant_emotion"):
+            emotion = text["emotions"]["dominant_emotion"]
+            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+        if text.get("sentiment") and text["sentiment"].get("sentiment_score"):
+            sentiment_sum += text["sentiment"]["sentiment_score"]
+        if text.get("risk_assessment") and text["risk_assessment"].get("level") == "alto":
+            high_risk_count += 1
+
+    return {
+        "total_entries": len(texts_list),
+        "dominant_emotions": emotion_counts,
+        "average_sentiment": sentiment_sum / len(texts_list),
+        "risk_alerts": high_risk_count,
+        "period_days": days
+    }
+
+
+def riesgo_referencia(db, user_id: int, start_date: datetime) -> List[Dict]:
+    return list(db.emotional_texts.find({
+        "user_id": user_id,
+        "timestamp": {"$gte": start_date},
+        "risk_assessment.level": "alto"
+    }).sort("timestamp", -1))
+
+
+def engagement_referencia(db, user_id: int, start_date: datetime) -> Dict:
+    return {
+        "chat_messages": db.chat_logs.count_documents({"user_id": user_id, "is_bot": False,
+                                                       "timestamp": {"$gte": start_date}}),
+        "emotional_entries": db.emotional_texts.count_documents({"user_id": user_id,
+                                                                 "timestamp": {"$gte": start_date}})
+    }
+
+
+# ============================================
+# FIXTURES
+# ============================================
+
+def analisis_aleatorio(r: random.Random) -> Dict:
+    analisis = {}
+    if r.random() < 0.9:
+        analisis["emotions"] = {"dominant_emotion": r.choice(EMOCIONES), "confidence": 0.8}
+    if r.random() < 0.9:
+        analisis["sentiment"] = {"sentiment_score": r.choice([0, round(r.uniform(-1, 1), 3)])}
+    if r.random() < 0.9:
+        analisis["risk_assessment"] = {"level": r.choice(NIVELES)}
+    return analisis
+
+
+def sembrar(db, seed: int, n: int = 200, dias: int = 30):
+    """emotional_texts y chat_logs de varios usuarios, con timestamps distintos"""
+    r = random.Random(seed)
+    segundos = r.sample(range(dias * 86400), n)
+    for i, s in enumerate(segundos):
+        ts = AHORA - timedelta(seconds=s)
+        user_id = USER_ID if r.random() < 0.8 else USER_ID + 1
+        analisis = analisis_aleatorio(r)
+        if r.random() < 0.3:
+            # Forma de chat_rasa: todo dentro de emotional_analysis
+            documento = {"user_id": user_id, "text": f"t{i}", "emotional_analysis": analisis,
+                         "timestamp": ts}
+        else:
+            documento = {"user_id": user_id, "text": f"t{i}", "source": "chat", **analisis,
+                         "timestamp": ts}
+        db.emotional_texts.insert_one(documento)
+        db.chat_logs.insert_one({"user_id": user_id, "message": f"m{i}", "is_bot": r.random() < 0.5,
+                                 "timestamp": ts})
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def mongo_real():
+    if not MONGODB_TEST_URL:
+        pytest.skip("$unionWith requiere MongoDB >= 4.4 (define MONGODB_TEST_URL)")
+    from pymongo import MongoClient
+    client = MongoClient(MONGODB_TEST_URL)
+    nombre = "emotional_tracking_test_pipelines"
+    client.drop_database(nombre)
+    yield client[nombre]
+    client.drop_database(nombre)
+
+
+def mismos_patrones(a: Dict, b: Dict) -> bool:
+    return (a.keys() == b.keys()
+            and a["total_entries"] == b["total_entries"]
+            and a["dominant_emotions"] == b["dominant_emotions"]
+            and a["risk_alerts"] == b["risk_alerts"]
+            and a.get("period_days") == b.get("period_days")
+            and math.isclose(a["average_sentiment"], b["average_sentiment"], abs_tol=1e-9))
+
+
+# ============================================
+# PATRONES Y RIESGO ALTO (mongomock)
+# ============================================
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("days", [1, 7, 30])
+def test_patrones_coinciden_con_referencia(db, seed, days):
+    sembrar(db, seed)
+    inicio = AHORA - timedelta(days=days)
+    obtenido = emotional_patterns_from_facet(
+        list(db.emotional_texts.aggregate(emotional_patterns_pipeline(USER_ID, inicio))), days
+    )
+    assert mismos_patrones(obtenido, patrones_referencia(db, USER_ID, inicio, days))
+
+
+def test_patrones_sin_documentos(db):
+    inicio = AHORA - timedelta(days=7)
+    obtenido = emotional_patterns_from_facet(
+        list(db.emotional_texts.aggregate(emotional_patterns_pipeline(USER_ID, inicio))), 7
+    )
+    assert obtenido == patrones_referencia(db, USER_ID, inicio, 7)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_riesgo_alto_devuelve_los_mismos_documentos(db, seed):
+    sembrar(db, seed)
+    inicio = AHORA - timedelta(days=7)
+    esperado = riesgo_referencia(db, USER_ID, inicio)
+    assert list(db.emotional_texts.aggregate(high_risk_entries_pipeline(USER_ID, inicio))) == esperado
+    assert list(db.emotional_texts.aggregate(high_risk_entries_pipeline(USER_ID, inicio, limit=5))) \
+        == esperado[:5]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_pattern_fields_coincide_con_referencia(db, seed):
+    # Lo que aplica record_interaction en la caché de contexto
+    sembrar(db, seed)
+    inicio = AHORA - timedelta(days=7)
+    entry = UserContext(10, 5)
+    for documento in db.emotional_texts.find({"user_id": USER_ID, "timestamp": {"$gte": inicio}}):
+        emocion, sentiment, riesgo = pattern_fields(documento)
+        entry.add_pattern(_hora(documento["timestamp"]), 1, sentiment or 0.0,
+                          1 if riesgo == "alto" else 0, emocion)
+    assert mismos_patrones(entry.patterns(7, inicio + timedelta(days=7)),
+                           patrones_referencia(db, USER_ID, _hora(inicio), 7))
+
+
+# ============================================
+# $unionWith (MongoDB >= 4.4 en MONGODB_TEST_URL)
+# ============================================
+
+@pytest.mark.parametrize("seed", range(3))
+def test_engagement_coincide_con_referencia(mongo_real, seed):
+    sembrar(mongo_real, seed)
+    inicio = AHORA - timedelta(days=7)
+    obtenido = engagement_from_groups(
+        list(mongo_real.chat_logs.aggregate(engagement_pipeline(USER_ID, inicio))), 7
+    )
+    esperado = engagement_referencia(mongo_real, USER_ID, inicio)
+    assert obtenido["chat_messages"] == esperado["chat_messages"]
+    assert obtenido["emotional_entries"] == esperado["emotional_entries"]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_contexto_coincide_con_tres_consultas(mongo_real, seed):
+    sembrar(mongo_real, seed)
+    inicio = AHORA - timedelta(days=7)
+    facet = list(mongo_real.chat_logs.aggregate(conversation_context_pipeline(USER_ID, inicio)))[0]
+
+    mensajes = list(mongo_real.chat_logs.find({"user_id": USER_ID}).sort("timestamp", -1).limit(10))
+    assert facet["mensajes"] == mensajes
+    assert facet["riesgo_alto"] == riesgo_referencia(mongo_real, USER_ID, inicio)[:5]
+
+    entry = UserContext(10, 5)
+    for grupo in facet["horas"]:
+        entry.add_pattern(grupo["_id"]["hora"], grupo["total"], grupo.get("sentiment_sum") or 0.0,
+                          grupo.get("high_risk", 0), grupo["_id"].get("emotion"))
+    assert mismos_patrones(entry.patterns(7, AHORA), patrones_referencia(mongo_real, USER_ID, _hora(inicio), 7))
@@ -0,0 +1,397 @@
+# backend/write_behind.py
+# ✅ ESCRITURA DIFERIDA (WRITE-BEHIND) A MONGODB
+# Los documentos de chat se encolan en memoria y un hilo los inserta con
+# insert_many(ordered=False) cuando se junta un lote o vence el intervalo.
+# La respuesta del chat ya no espera a MongoDB.
+#
+# - El _id se asigna al encolar: reintentar un lote parcialmente insertado
+#   solo produce errores de clave duplicada, que se tratan como éxito.
+# - Tras WRITE_BEHIND_MAX_RETRIES fallos, el lote se guarda en un archivo
+#   JSONL (dead letter) para reinsertarlo a mano.
+# - En el shutdown se vacía la cola antes de salir.
+# - enqueue nunca escribe en el hilo llamador (suele ser el event loop): si la
+#   cola está llena los documentos pasan a un buffer de desborde que el hilo
+#   vacía primero; si también se llena, a una cola acotada de dead letter que
+#   el hilo escribe al archivo (si esa también está llena, se descartan y se
+#   cuentan en dead_letter_dropped). Solo tras el shutdown, sin hilo, se
+#   escribe el archivo desde el llamador.
+# - WRITE_BEHIND_ENABLED=false desactiva el agrupado (lotes de 1, sin espera),
+#   pero la escritura sigue siendo en el hilo de write-behind.
+# - También acepta updates ($inc/$max/$set, p. ej. contadores): los de un mismo
+#   filtro dentro de un lote se fusionan en una sola operación. Un $inc no es
+#   idempotente: si un lote se reintenta tras un fallo de red puede contarse
+#   dos veces (los contadores tienen comando de reconstrucción).
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+# Configuración
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+WRITE_BEHIND_MAX_OVERFLOW = int(os.getenv("WRITE_BEHIND_MAX_OVERFLOW", "50000"))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+WRITE_BEHIND_MAX_DEAD_LETTER_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_DEAD_LETTER_QUEUE", "10000"))
+WRITE_BEHIND_DEAD_LETTER = os.getenv(
+    "WRITE_BEHIND_DEAD_LETTER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "write_behind_dead_letter.jsonl")
+)
+
+DUPLICATE_KEY = 11000
+
+
+class PendingUpdate(NamedTuple):
+    filter: Dict
+    update: Dict
+    upsert: bool = True
+
+
+def merge_updates(a: Dict, b: Dict) -> Optional[Dict]:
+    """
+    Fusiona dos updates del mismo documento: $inc suma, $max/$min se quedan con
+    el extremo, $set/$setOnInsert con el último. None si hay otro operador.
+    """
+    merged = {op: dict(fields) for op, fields in a.items()}
+    for op, fields in b.items():
+        target = merged.setdefault(op, {})
+        for field, value in fields.items():
+            if field not in target:
+                target[field] = value
+            elif op == "$inc":
+                target[field] += value
+            elif op == "$max":
+                target[field] = max(target[field], value)
+            elif op == "$min":
+                target[field] = min(target[field], value)
+            elif op == "$setOnInsert":
+                pass
+            elif op == "$set":
+                target[field] = value
+            else:
+                return None
+    return merged
+
+
+class WriteBehindBuffer:
+    """Cola de inserciones diferidas, agrupadas por colección"""
+
+    def __init__(self,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+                 max_queue: int = WRITE_BEHIND_MAX_QUEUE,
+                 max_overflow: int = WRITE_BEHIND_MAX_OVERFLOW,
+                 max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+                 max_dead_letter_queue: int = WRITE_BEHIND_MAX_DEAD_LETTER_QUEUE,
+                 enabled: bool = WRITE_BEHIND_ENABLED):
+        # Desactivado = sin agrupar, pero igual fuera del hilo llamador
+        self.batch_size = max(1, batch_size) if enabled else 1
+        self.flush_interval = max(0.0, flush_ms) / 1000.0 if enabled else 0.0
+        self.max_retries = max_retries
+        self.max_overflow = max_overflow
+        self.max_dead_letter_queue = max_dead_letter_queue
+        self.enabled = enabled
+
+        self._queue: "queue.Queue[Tuple[str, Union[Dict, PendingUpdate]]]" = queue.Queue(maxsize=max_queue)
+        self._overflow: deque = deque()
+        # Dead letter pendiente de escribir por el hilo (no por el llamador)
+        self._dead_letter_queue: deque = deque()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._db = None
+
+        # Métricas
+        self.enqueued = 0
+        self.written = 0
+        self.updates_applied = 0
+        self.updates_merged = 0
+        self.batches = 0
+        self.failed_attempts = 0
+        self.overflowed = 0
+        self.dead_lettered = 0
+        self.dead_letter_dropped = 0
+        self._flush_ms = deque(maxlen=500)
+        self.last_flush_at: Optional[float] = None
+
+    # ============================================
+    # API
+    # ============================================
+
+    def enqueue(self, collection: str, document: Dict) -> ObjectId:
+        """Encola un documento; devuelve el _id que tendrá en MongoDB. No bloquea."""
+        document.setdefault("_id", ObjectId())
+        self._put(collection, document)
+        return document["_id"]
+
+    def enqueue_update(self, collection: str, filter: Dict, update: Dict, upsert: bool = True):
+        """Encola un update (p. ej. $inc de contadores) que se aplica con bulk_write. No bloquea."""
+        self._put(collection, PendingUpdate(filter, update, upsert))
+
+    def _put(self, collection: str, item: Union[Dict, PendingUpdate]):
+        if self._stopping.is_set() and (self._worker is None or not self._worker.is_alive()):
+            # Después del shutdown ya no hay hilo que escriba
+            self._dead_letter_items(collection, [item])
+            return
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((collection, item))
+            with self._lock:
+                self.enqueued += 1
+            return
+        except queue.Full:
+            pass
+
+        # Contrapresión sin bloquear: buffer de desborde y, si se llena, la
+        # cola de dead letter que escribe el hilo
+        with self._lock:
+            if len(self._overflow) < self.max_overflow:
+                self._overflow.append((collection, item))
+                self.enqueued += 1
+                self.overflowed += 1
+            elif len(self._dead_letter_queue) < self.max_dead_letter_queue:
+                self._dead_letter_queue.append((collection, item))
+            else:
+                self.dead_letter_dropped += 1
+
+    def shutdown(self, timeout: float = 10.0):
+        """Deja de aceptar documentos en la cola y espera a vaciarla"""
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout=timeout)
+            if self._worker.is_alive():
+                print(f"⚠️ Write-behind: quedaron {self._queue.qsize()} documentos sin escribir")
+            else:
+                # Lo que llegó a la cola de dead letter después del último vaciado del hilo
+                self._drain_dead_letters()
+                print(f"✅ Write-behind vaciado ({self.written} documentos escritos, {self.updates_applied} updates)")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            flushes = sorted(self._flush_ms)
+            return {
+                "enabled": self.enabled,
+                "queue_length": self._queue.qsize(),
+                "overflow_length": len(self._overflow),
+                "batch_size": self.batch_size,
+                "flush_ms": self.flush_interval * 1000,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "updates_applied": self.updates_applied,
+                "updates_merged": self.updates_merged,
+                "batches": self.batches,
+                "failed_attempts": self.failed_attempts,
+                "overflowed": self.overflowed,
+                "dead_lettered": self.dead_lettered,
+                "dead_letter_pending": len(self._dead_letter_queue),
+                "dead_letter_dropped": self.dead_letter_dropped,
+                "flush_latency_ms_avg": round(sum(flushes) / len(flushes), 2) if flushes else 0,
+                "flush_latency_ms_p95": round(flushes[int(len(flushes) * 0.95) - 1], 2) if flushes else 0,
+                "flush_latency_ms_max": round(flushes[-1], 2) if flushes else 0,
+                "seconds_since_last_flush": round(time.time() - self.last_flush_at, 1) if self.last_flush_at else None
+            }
+
+    # ============================================
+    # HILO DE ESCRITURA
+    # ============================================
+
+    def _get_db(self):
+        if self._db is None:
+            from mongodb_config import get_database
+            self._db = get_database()
+        return self._db
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if (self._worker is None or not self._worker.is_alive()) and not self._stopping.is_set():
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name="mongo-write-behind",
+                    daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._drain_dead_letters()
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stopping.is_set():
+                self._drain_dead_letters()
+                return
+
+    def _drain_dead_letters(self):
+        """Escribe lo que _put mandó al dead letter, agrupado por colección"""
+        with self._lock:
+            if not self._dead_letter_queue:
+                return
+            items = list(self._dead_letter_queue)
+            self._dead_letter_queue.clear()
+        by_collection: Dict[str, List[Union[Dict, PendingUpdate]]] = {}
+        for collection, item in items:
+            by_collection.setdefault(collection, []).append(item)
+        for collection, pendientes in by_collection.items():
+            self._dead_letter_items(collection, pendientes)
+
+    def _collect_batch(self) -> List[Tuple[str, Union[Dict, PendingUpdate]]]:
+        """Espera el primer documento y junta más hasta el tamaño o el intervalo"""
+        # Lo desbordado es lo más antiguo: va primero y sin esperar
+        with self._lock:
+            batch = [self._overflow.popleft()
+                     for _ in range(min(self.batch_size, len(self._overflow)))]
+        if len(batch) >= self.batch_size:
+            return batch
+        if batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+        else:
+            try:
+                batch.append(self._queue.get(timeout=0.5))
+            except queue.Empty:
+                return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not self._stopping.is_set():
+                break
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Durante el shutdown no se espera: se toma lo que quede
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[Tuple[str, Union[Dict, PendingUpdate]]]):
+        by_collection: Dict[str, List[Dict]] = {}
+        updates_by_collection: Dict[str, List[PendingUpdate]] = {}
+        for collection, item in batch:
+            if isinstance(item, PendingUpdate):
+                updates_by_collection.setdefault(collection, []).append(item)
+            else:
+                by_collection.setdefault(collection, []).append(item)
+
+        started_at = time.perf_counter()
+        # Primero las inserciones: los updates suelen resumir lo insertado
+        for collection, documents in by_collection.items():
+            self._insert_with_retry(collection, documents)
+        for collection, updates in updates_by_collection.items():
+            self._update_with_retry(collection, self._coalesce(updates))
+
+        with self._lock:
+            self.batches += 1
+            self._flush_ms.append((time.perf_counter() - started_at) * 1000)
+            self.last_flush_at = time.time()
+
+    def _insert_with_retry(self, collection: str, documents: List[Dict]):
+        pending = documents
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._get_db()[collection].insert_many(pending, ordered=False)
+                self._count_written(len(pending))
+                return
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                # Duplicados = ya insertados en un intento anterior
+                failed_idx = {err["index"] for err in errors if err.get("code") != DUPLICATE_KEY}
+                self._count_written(len(pending) - len(failed_idx))
+                pending = [doc for i, doc in enumerate(pending) if i in failed_idx]
+                if not pending:
+                    return
+            except PyMongoError as e:
+                print(f"⚠️ Write-behind: error insertando en {collection}: {e}")
+
+            with self._lock:
+                self.failed_attempts += 1
+            if attempt < self.max_retries:
+                time.sleep(min(0.2 * 2 ** attempt, 5.0))
+
+        self._dead_letter(collection, pending)
+
+    def _coalesce(self, updates: List[PendingUpdate]) -> List[PendingUpdate]:
+        """Un update por documento destino cuando los operadores lo permiten"""
+        merged: Dict[str, PendingUpdate] = {}
+        result: List[PendingUpdate] = []
+        for item in updates:
+            key = json.dumps(item.filter, sort_keys=True, default=str)
+            previous = merged.get(key)
+            combined = merge_updates(previous.update, item.update) if previous else None
+            if combined is not None:
+                merged[key] = PendingUpdate(item.filter, combined, previous.upsert or item.upsert)
+                with self._lock:
+                    self.updates_merged += 1
+            elif previous is None:
+                merged[key] = item
+            else:
+                result.append(item)
+        return list(merged.values()) + result
+
+    def _update_with_retry(self, collection: str, updates: List[PendingUpdate]):
+        pending = updates
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._get_db()[collection].bulk_write(
+                    [UpdateOne(u.filter, u.update, upsert=u.upsert) for u in pending],
+                    ordered=False
+                )
+                with self._lock:
+                    self.updates_applied += len(pending)
+                return
+            except BulkWriteError as e:
+                # Solo se reintentan los que fallaron (los demás ya se aplicaron)
+                failed_idx = {err["index"] for err in e.details.get("writeErrors", [])}
+                with self._lock:
+                    self.updates_applied += len(pending) - len(failed_idx)
+                pending = [u for i, u in enumerate(pending) if i in failed_idx]
+                if not pending:
+                    return
+            except PyMongoError as e:
+                print(f"⚠️ Write-behind: error actualizando {collection}: {e}")
+
+            with self._lock:
+                self.failed_attempts += 1
+            if attempt < self.max_retries:
+                time.sleep(min(0.2 * 2 ** attempt, 5.0))
+
+        self._dead_letter(collection, [u._asdict() for u in pending])
+
+    def _dead_letter_items(self, collection: str, items: List[Union[Dict, PendingUpdate]]):
+        self._dead_letter(collection, [i._asdict() if isinstance(i, PendingUpdate) else i for i in items])
+
+    def _count_written(self, n: int):
+        with self._lock:
+            self.written += n
+
+    def _dead_letter(self, collection: str, documents: List[Dict]):
+        print(f"❌ Write-behind: {len(documents)} documentos de {collection} a {WRITE_BEHIND_DEAD_LETTER}")
+        try:
+            with open(WRITE_BEHIND_DEAD_LETTER, "a", encoding="utf-8") as f:
+                for document in documents:
+                    f.write(json.dumps({"collection": collection, "document": document},
+                                       ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"❌ No se pudo escribir el dead letter: {e}")
+        with self._lock:
+            self.dead_lettered += len(documents)
+
+
+# Instancia global
+write_behind = WriteBehindBuffer()
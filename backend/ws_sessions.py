@@ -0,0 +1,156 @@
+# backend/ws_sessions.py
+# ✅ SESIONES DEL CHAT POR WEBSOCKET
+# Cada sesión numera los frames de datos (reply / analysis) con `seq` y guarda
+# los últimos en un buffer. Si el socket se cae, el cliente reconecta con
+# ?session_id=...&last_seq=N y recibe lo que se perdió.
+#
+# Cada conexión tiene una cola de salida acotada: si el cliente no lee y la
+# cola se llena, se cierra la conexión (el cliente reanuda con last_seq).
+#
+# Cada attach recibe un token de propiedad. Si un cliente reanuda una sesión
+# cuyo socket anterior sigue abierto, el nuevo socket se queda la sesión y se
+# avisa al anterior (evento `taken_over`) para que cierre; el detach del socket
+# anterior no toca la sesión porque su token ya no es el vigente.
+
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Configuración
+WS_REPLAY_BUFFER = int(os.getenv("WS_REPLAY_BUFFER", "100"))
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))
+WS_INBOUND_QUEUE_SIZE = int(os.getenv("WS_INBOUND_QUEUE_SIZE", "8"))
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "20"))
+WS_SESSION_TTL_SECONDS = float(os.getenv("WS_SESSION_TTL_SECONDS", "300"))
+
+
+class ChatSession:
+    def __init__(self, user_id: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.seq = 0
+        self.replay = deque(maxlen=WS_REPLAY_BUFFER)
+        self.outbound: Optional[asyncio.Queue] = None
+        self.overflowed: Optional[asyncio.Event] = None
+        self.taken_over: Optional[asyncio.Event] = None
+        self.owner = 0
+        self.connected = False
+        self.detached_at: Optional[float] = None
+
+    def attach(self) -> int:
+        """
+        Nueva conexión: cola de salida nueva (lo pendiente se recupera por replay).
+        Devuelve el token de propiedad; si había otro socket conectado se le
+        avisa por su `taken_over` para que cierre.
+        """
+        if self.connected and self.taken_over is not None:
+            self.taken_over.set()
+        self.owner += 1
+        self.outbound = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.overflowed = asyncio.Event()
+        self.taken_over = asyncio.Event()
+        self.connected = True
+        self.detached_at = None
+        return self.owner
+
+    def owns(self, token: int) -> bool:
+        return token == self.owner
+
+    def detach(self, token: int) -> bool:
+        """Solo desconecta si `token` sigue siendo el dueño de la sesión"""
+        if not self.owns(token):
+            return False
+        self.connected = False
+        self.outbound = None
+        self.overflowed = None
+        self.taken_over = None
+        self.detached_at = time.monotonic()
+        return True
+
+    def push(self, frame_type: str, **payload) -> Dict:
+        """Frame de datos numerado: se guarda para replay y se envía si hay conexión"""
+        self.seq += 1
+        frame = {"type": frame_type, "seq": self.seq, **payload}
+        self.replay.append(frame)
+        self.send(frame)
+        return frame
+
+    def send(self, frame: Dict):
+        """
+        Encola un frame para la conexión actual. Nunca bloquea: si la cola está
+        llena se descarta y se marca `overflowed` para que el handler cierre
+        la conexión (los frames de datos siguen en el buffer de replay).
+        """
+        if self.outbound is None:
+            return
+        try:
+            self.outbound.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed.set()
+
+    def frames_after(self, last_seq: int) -> Optional[List[Dict]]:
+        """Frames con seq > last_seq, o None si ya salieron del buffer"""
+        if last_seq >= self.seq:
+            return []
+        if not self.replay or self.replay[0]["seq"] > last_seq + 1:
+            return None
+        return [frame for frame in self.replay if frame["seq"] > last_seq]
+
+
+class SessionRegistry:
+    """Sesiones vivas (conectadas o desconectadas hace menos de WS_SESSION_TTL_SECONDS)"""
+
+    def __init__(self):
+        self._sessions: Dict[str, ChatSession] = {}
+        self.resumes = 0
+        self.takeovers = 0
+        self.slow_consumer_closes = 0
+
+    def attach(self, user_id: int, session_id: Optional[str] = None) -> Tuple[ChatSession, bool, int]:
+        """
+        Devuelve (sesión, reanudada, token). Solo se reanuda una sesión del mismo
+        usuario; si seguía conectada, el socket anterior pierde la propiedad.
+        """
+        self._purge()
+        session = self._sessions.get(session_id) if session_id else None
+        resumed = session is not None and session.user_id == user_id
+        if not resumed:
+            session = ChatSession(user_id)
+            self._sessions[session.id] = session
+        else:
+            self.resumes += 1
+            if session.connected:
+                self.takeovers += 1
+        token = session.attach()
+        return session, resumed, token
+
+    def detach(self, session: ChatSession, token: int) -> bool:
+        return session.detach(token)
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [
+            sid for sid, s in self._sessions.items()
+            if not s.connected and s.detached_at and now - s.detached_at > WS_SESSION_TTL_SECONDS
+        ]
+        for sid in expired:
+            del self._sessions[sid]
+
+    def stats(self) -> Dict:
+        self._purge()
+        return {
+            "sessions": len(self._sessions),
+            "connected": sum(1 for s in self._sessions.values() if s.connected),
+            "resumes": self.resumes,
+            "takeovers": self.takeovers,
+            "slow_consumer_closes": self.slow_consumer_closes,
+            "replay_buffer": WS_REPLAY_BUFFER,
+            "send_queue_size": WS_SEND_QUEUE_SIZE
+        }
+
+
+# Registro global (por worker: reanudar requiere volver al mismo worker)
+ws_sessions = SessionRegistry()
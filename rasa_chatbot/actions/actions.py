@@ -7,13 +7,15 @@ from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
 import datetime
 import numpy as np
-from transformers import pipeline
-import torch
 from groq import Groq
 import os
 from dotenv import load_dotenv
 import random
 
+from actions.model_registry import model_registry
+from actions.lexicon import ACCION_CRISIS_LEXICON
+from actions.llm_streaming import openai_deltas, fake_stream, timed_stream, stream_metrics
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -21,32 +23,41 @@ load_dotenv()
 # CONFIGURACIÓN INICIAL
 # ============================================================================
 
-print("🔄 Cargando modelos de análisis emocional...")
+# Si un mensaje llega SIN el análisis del backend (metadata.emotional_analysis)
+# no se ejecutan modelos: emoción neutral y la detección de crisis por léxico.
+# Detrás del backend eso pasa cuando su análisis no llegó dentro de
+# CHAT_NLP_METADATA_BUDGET_MS; repetirlo aquí duplicaría el trabajo de BETO y
+# nlptown. Con RASA_LOCAL_NLP_FALLBACK=true se analizan con los modelos locales
+# (rasa shell o frontend directo, sin backend delante).
+RASA_LOCAL_NLP_FALLBACK = os.getenv('RASA_LOCAL_NLP_FALLBACK', 'false').lower() == 'true'
+MODELOS_LOCALES = {
+    "emociones": ("text-classification", "finiteautomata/beto-emotion-analysis", {"top_k": None}),
+    "sentimiento": ("sentiment-analysis", "nlptown/bert-base-multilingual-uncased-sentiment", {}),
+}
+_modelos_no_disponibles = set()
+
+MAPEO_EMOCIONES = {
+    'joy': 'alegría',
+    'sadness': 'tristeza',
+    'anger': 'enojo',
+    'fear': 'miedo',
+    'surprise': 'sorpresa',
+    'others': 'neutral'
+}
 
-try:
-    emotion_classifier = pipeline(
-        "text-classification",
-        model="finiteautomata/beto-emotion-analysis",
-        top_k=None,
-        device=0 if torch.cuda.is_available() else -1
-    )
-    print("✅ Modelo de emociones cargado")
-except Exception as e:
-    print(f"⚠️ Error cargando modelo de emociones: {e}")
-    emotion_classifier = None
 
-try:
-    sentiment_classifier = pipeline(
-        "sentiment-analysis",
-        model="nlptown/bert-base-multilingual-uncased-sentiment",
-        device=0 if torch.cuda.is_available() else -1
-    )
-    print("✅ Modelo de sentimiento cargado")
-except Exception as e:
-    print(f"⚠️ Error cargando modelo de sentimiento: {e}")
-    sentiment_classifier = None
+def obtener_modelo_local(nombre: str):
+    """Devuelve el pipeline local (cargándolo en el primer uso) o None si falló"""
+    if nombre in _modelos_no_disponibles:
+        return None
 
-print("🎉 Analizador emocional listo\n")
+    task, model_id, kwargs = MODELOS_LOCALES[nombre]
+    try:
+        return model_registry.get_pipeline(task, model_id, **kwargs)
+    except Exception as e:
+        print(f"⚠️ Error cargando modelo de {nombre}: {e}")
+        _modelos_no_disponibles.add(nombre)
+        return None
 
 # ============================================================================
 # ACTION: ANÁLISIS EMOCIONAL AVANZADO
@@ -74,90 +85,38 @@ class ActionAnalizarEmocionAvanzado(Action):
         print(f"👤 Usuario: {user_id}")
         print(f"💬 Mensaje: {texto}")
         
-        emocion_principal = "neutral"
-        intensidad = 5.0
-        confianza = 0.0
+        metadata = tracker.latest_message.get('metadata') or {}
+        analisis_backend = metadata.get('emotional_analysis')
         
-        if emotion_classifier:
-            try:
-                resultados = emotion_classifier(texto)[0]
-                emocion_principal = resultados[0]['label']
-                confianza = resultados[0]['score']
-                
-                mapeo_emociones = {
-                    'joy': 'alegría',
-                    'sadness': 'tristeza',
-                    'anger': 'enojo',
-                    'fear': 'miedo',
-                    'surprise': 'sorpresa',
-                    'others': 'neutral'
-                }
-                
-                emocion_principal = mapeo_emociones.get(emocion_principal, emocion_principal)
-                
-                print(f"😊 Emoción principal: {emocion_principal}")
-                print(f"✅ Confianza: {confianza*100:.2f}%")
-                
-            except Exception as e:
-                print(f"⚠️ Error en análisis de emoción: {e}")
-        
-        if sentiment_classifier:
-            try:
-                sent_result = sentiment_classifier(texto)[0]
-                estrellas = int(sent_result['label'].split()[0])
-                intensidad = (estrellas / 5.0) * 10.0
-                print(f"📊 Intensidad base: {intensidad:.2f}/10")
-            except Exception as e:
-                print(f"⚠️ Error en análisis de sentimiento: {e}")
+        if analisis_backend:
+            # Análisis ya calculado por el backend: no se ejecuta ningún modelo
+            emocion_principal = MAPEO_EMOCIONES.get(
+                analisis_backend.get('dominant_emotion', 'neutral'),
+                analisis_backend.get('dominant_emotion', 'neutral')
+            )
+            confianza = float(analisis_backend.get('confidence', 0.0))
+            # sentiment_score (-1 a 1) a la misma escala que las estrellas de nlptown (2 a 10)
+            intensidad = (float(analisis_backend.get('sentiment_score', 0.0)) + 1) * 4.0 + 2.0
+            
+            print(f"📨 Análisis recibido del backend")
+            print(f"😊 Emoción principal: {emocion_principal}")
+            print(f"✅ Confianza: {confianza*100:.2f}%")
+            print(f"📊 Intensidad base: {intensidad:.2f}/10")
+        elif RASA_LOCAL_NLP_FALLBACK:
+            emocion_principal, confianza, intensidad = self._analizar_localmente(texto)
+        else:
+            emocion_principal, confianza, intensidad = "neutral", 0.0, 5.0
+            print(f"📭 Sin análisis del backend: solo léxico de crisis (RASA_LOCAL_NLP_FALLBACK=false)")
         
         # DETECCIÓN DE CRISIS MEJORADA
-        texto_lower = texto.lower()
+        # Críticas suman 3, de riesgo 2 y de contexto negativo 1 (ver actions/lexicon.py)
+        coincidencias = ACCION_CRISIS_LEXICON.scan(texto)
+        score_crisis = coincidencias.total_weight
         nivel_crisis = "bajo"
-        score_crisis = 0
-        
-        # Palabras críticas (cada una suma 3 puntos)
-        palabras_criticas = [
-            'suicidio', 'suicidarme', 'matarme', 'matar me',
-            'acabar con mi vida', 'terminar con todo',
-            'no quiero vivir', 'no quiero seguir viviendo',
-            'quiero morir', 'quiero morirme',
-            'mejor muerto', 'mejor muerta',
-            'no vale la pena vivir', 'no vale la pena seguir',
-            'quiero desaparecer',
-            'prefiero estar muerto', 'prefiero estar muerta'
-        ]
-        
-        # Palabras de riesgo moderado (cada una suma 2 puntos)
-        palabras_riesgo = [
-            'morir', 'muerte', 'desaparecer', 'acabar',
-            'terminar', 'ya no puedo', 'no puedo más',
-            'no aguanto más', 'no soporto más'
-        ]
         
-        # Palabras de contexto negativo (cada una suma 1 punto)
-        palabras_negativas = [
-            'dolor', 'sufrimiento', 'solo', 'sola',
-            'desesperado', 'desesperada', 'sin salida',
-            'sin esperanza', 'perdido', 'perdida'
-        ]
-        
-        # Contar palabras críticas
-        for palabra in palabras_criticas:
-            if palabra in texto_lower:
-                score_crisis += 3
-                print(f"🚨 Palabra crítica detectada: '{palabra}' (+3 puntos)")
-        
-        # Contar palabras de riesgo
-        for palabra in palabras_riesgo:
-            if palabra in texto_lower:
-                score_crisis += 2
-                print(f"⚠️ Palabra de riesgo detectada: '{palabra}' (+2 puntos)")
-        
-        # Contar palabras negativas
-        for palabra in palabras_negativas:
-            if palabra in texto_lower:
-                score_crisis += 1
-                print(f"⚡ Palabra negativa detectada: '{palabra}' (+1 punto)")
+        if coincidencias:
+            resumen = ", ".join(f"'{m.keyword}' (+{m.weight})" for m in coincidencias.matches)
+            print(f"🚨 Palabras de crisis detectadas: {resumen}")
         
         # Determinar nivel de crisis
         if score_crisis >= 5:
@@ -189,6 +148,40 @@ class ActionAnalizarEmocionAvanzado(Action):
         ]
 
 
+    def _analizar_localmente(self, texto: str):
+        """Respaldo (RASA_LOCAL_NLP_FALLBACK=true) cuando el mensaje no trae el análisis del backend"""
+        emocion_principal = "neutral"
+        intensidad = 5.0
+        confianza = 0.0
+        
+        emotion_classifier = obtener_modelo_local("emociones")
+        if emotion_classifier:
+            try:
+                resultados = emotion_classifier(texto)[0]
+                emocion_principal = resultados[0]['label']
+                confianza = resultados[0]['score']
+                
+                emocion_principal = MAPEO_EMOCIONES.get(emocion_principal, emocion_principal)
+                
+                print(f"😊 Emoción principal: {emocion_principal}")
+                print(f"✅ Confianza: {confianza*100:.2f}%")
+                
+            except Exception as e:
+                print(f"⚠️ Error en análisis de emoción: {e}")
+        
+        sentiment_classifier = obtener_modelo_local("sentimiento")
+        if sentiment_classifier:
+            try:
+                sent_result = sentiment_classifier(texto)[0]
+                estrellas = int(sent_result['label'].split()[0])
+                intensidad = (estrellas / 5.0) * 10.0
+                print(f"📊 Intensidad base: {intensidad:.2f}/10")
+            except Exception as e:
+                print(f"⚠️ Error en análisis de sentimiento: {e}")
+        
+        return emocion_principal, confianza, intensidad
+
+
 # ============================================================================
 # ACTION: RESPUESTA CON GROQ (LLAMA 3.3 70B)
 # ============================================================================
@@ -196,6 +189,11 @@ class ActionAnalizarEmocionAvanzado(Action):
 class ActionRespuestaConGroq(Action):
     """
     Genera respuestas naturales con Groq (Llama 3.3 70B)
+    La respuesta se pide en streaming solo para medir el time-to-first-token:
+    el SDK de acciones entrega los mensajes al terminar la acción y el webhook
+    REST de Rasa no hace streaming, así que aquí se junta el texto completo y
+    el usuario no ve antes el primer fragmento.
+    Con GROQ_FAKE_STREAM=true se usa un proveedor local con tokens fijos.
     """
     
     def name(self) -> Text:
@@ -204,8 +202,11 @@ class ActionRespuestaConGroq(Action):
     def __init__(self):
         super().__init__()
         api_key = os.getenv('GROQ_API_KEY', '')
+        self.fake_stream = os.getenv('GROQ_FAKE_STREAM', 'false').lower() == 'true'
         
-        if not api_key:
+        if self.fake_stream:
+            print("🧪 Groq en modo falso (GROQ_FAKE_STREAM=true)")
+        elif not api_key:
             print("⚠️⚠️⚠️ ERROR: GROQ_API_KEY no encontrada ⚠️⚠️⚠️")
             print("Crea el archivo rasa_chatbot/.env con:")
             print("GROQ_API_KEY=tu_key_aqui")
@@ -282,20 +283,15 @@ Responde con empatía genuina al mensaje del paciente."""
             
             print(f"📨 Enviando {len(mensajes)} mensajes a Groq...")
             
-            # Llamar a Groq
-            chat_completion = self.client.chat.completions.create(
-                messages=mensajes,
-                model=self.model,
-                temperature=0.8,
-                max_tokens=150,
-                top_p=0.9,
-                stream=False
-            )
-            
-            respuesta = chat_completion.choices[0].message.content.strip()
+            # Llamar a Groq en streaming
+            proveedor = "fake" if self.fake_stream else "groq"
+            respuesta = "".join(timed_stream(proveedor, self._stream(mensajes))).strip()
+            if not respuesta:
+                raise ValueError("Groq devolvió una respuesta vacía")
             
+            metricas = stream_metrics.stats().get(proveedor, {})
             print(f"✅ Respuesta generada: {respuesta}")
-            print(f"🔢 Tokens usados: {chat_completion.usage.total_tokens}")
+            print(f"⏱️ TTFT promedio: {metricas.get('ttft_ms_avg', 0)} ms (p95 {metricas.get('ttft_ms_p95', 0)} ms)")
             print(f"{'='*70}\n")
             
             dispatcher.utter_message(text=respuesta)
@@ -322,6 +318,20 @@ Responde con empatía genuina al mensaje del paciente."""
             dispatcher.utter_message(text=random.choice(fallback))
         
         return []
+    
+    def _stream(self, mensajes: List[Dict]):
+        """Fragmentos de la respuesta según llegan (la petición sale con el primero)"""
+        if self.fake_stream:
+            yield from fake_stream()
+            return
+        yield from openai_deltas(self.client.chat.completions.create(
+            messages=mensajes,
+            model=self.model,
+            temperature=0.8,
+            max_tokens=150,
+            top_p=0.9,
+            stream=True
+        ))
 
 
 # ============================================================================
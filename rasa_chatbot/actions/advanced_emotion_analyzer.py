@@ -1,9 +1,11 @@
-from transformers import pipeline
 from typing import Dict, List, Optional
 import numpy as np
 from datetime import datetime
 import re
 
+from actions.model_registry import model_registry
+from actions.lexicon import CRISIS_AVANZADA_LEXICON
+
 class AdvancedEmotionAnalyzer:
     """
     Análisis emocional avanzado con múltiples capas de detección
@@ -13,11 +15,10 @@ class AdvancedEmotionAnalyzer:
         print("🤖 Inicializando analizador emocional avanzado...")
         
         try:
-            self.emotion_classifier = pipeline(
+            self.emotion_classifier = model_registry.get_pipeline(
                 "text-classification",
-                model="finiteautomata/beto-emotion-analysis",
-                top_k=None,
-                device=-1 
+                "finiteautomata/beto-emotion-analysis",
+                top_k=None
             )
             print("✅ Modelo de emociones cargado")
         except Exception as e:
@@ -25,10 +26,9 @@ class AdvancedEmotionAnalyzer:
             self.emotion_classifier = None
         
         try:
-            self.sentiment_analyzer = pipeline(
+            self.sentiment_analyzer = model_registry.get_pipeline(
                 "sentiment-analysis",
-                model="pysentimiento/robertuito-sentiment-analysis",
-                device=-1
+                "pysentimiento/robertuito-sentiment-analysis"
             )
             print("✅ Modelo de sentimiento cargado")
         except Exception as e:
@@ -277,42 +277,18 @@ class AdvancedEmotionAnalyzer:
         risk_score = 0.0
         indicators = []
         
-        text_lower = text.lower()
+        # NIVELES 1-3 y 6: léxicos de crisis en una sola pasada
+        lexicon_hits = CRISIS_AVANZADA_LEXICON.scan(text)
+        etiquetas = {
+            'critica': "🚨 Mención crítica",
+            'grave': "⚠️ Indicador grave",
+            'desesperanza': "💔 Desesperanza",
+            'autolesion': "🩹 Mención de autolesión"
+        }
         
-        # NIVEL 1: Palabras clave críticas (peso máximo)
-        critical_words = [
-            ('suicidio', 3.5), ('suicidarme', 3.5), ('matarme', 3.0),
-            ('quitarme la vida', 3.5), ('acabar con mi vida', 3.5),
-            ('no quiero vivir', 3.0), ('mejor muerto', 2.5)
-        ]
-        
-        for word, weight in critical_words:
-            if word in text_lower:
-                risk_score += weight
-                indicators.append(f"🚨 Mención crítica: '{word}'")
-        
-        # NIVEL 2: Indicadores graves
-        grave_indicators = [
-            ('no aguanto más', 2.0), ('no tiene sentido', 1.8),
-            ('ya no puedo', 1.5), ('quiero desaparecer', 2.0),
-            ('no hay salida', 2.0), ('todo ha terminado', 1.8)
-        ]
-        
-        for phrase, weight in grave_indicators:
-            if phrase in text_lower:
-                risk_score += weight
-                indicators.append(f"⚠️ Indicador grave: '{phrase}'")
-        
-        # NIVEL 3: Desesperanza
-        hopelessness = [
-            ('sin esperanza', 1.5), ('nada tiene sentido', 1.5),
-            ('perdido', 1.0), ('vacío', 1.0), ('solo y abandonado', 1.5)
-        ]
-        
-        for phrase, weight in hopelessness:
-            if phrase in text_lower:
-                risk_score += weight
-                indicators.append(f"💔 Desesperanza: '{phrase}'")
+        for match in lexicon_hits.matches:
+            risk_score += match.weight
+            indicators.append(f"{etiquetas[match.category]}: '{match.keyword}'")
         
         # NIVEL 4: Intensidad emocional extrema
         intensity = emotions.get('intensidad', 0)
@@ -330,13 +306,6 @@ class AdvancedEmotionAnalyzer:
                 risk_score += 1.5
                 indicators.append("📉 Patrón sostenido de alta intensidad negativa")
         
-        # NIVEL 6: Menciones de autolesión
-        self_harm = ['cortarme', 'lastimarme', 'hacerme daño', 'pegarme']
-        for word in self_harm:
-            if word in text_lower:
-                risk_score += 2.5
-                indicators.append(f"🩹 Mención de autolesión: '{word}'")
-        
         # Determinar nivel de crisis
         if risk_score >= 5.0:
             nivel = 'crítico'
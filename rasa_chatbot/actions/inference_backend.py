@@ -0,0 +1,62 @@
+# rasa_chatbot/actions/inference_backend.py
+# Backend de inferencia intercambiable para el action server (PyTorch / ONNX int8)
+#
+# NLP_INFERENCE_BACKEND=onnx carga la versión cuantizada que exporta
+# `python backend/inference_backend.py export` (misma carpeta ONNX_MODELS_DIR).
+# El action server nunca exporta: si el modelo no está exportado se usa torch
+# (exportar aquí escribiría en la carpeta compartida mientras otros la leen).
+
+import os
+from typing import Optional
+
+NLP_INFERENCE_BACKEND = os.getenv("NLP_INFERENCE_BACKEND", "torch").lower()
+ONNX_MODELS_DIR = os.getenv(
+    "ONNX_MODELS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend", "onnx_models")
+)
+ONNX_QUANTIZED_FILE = "model_quantized.onnx"
+
+
+def onnx_model_dir(model_id: str) -> str:
+    return os.path.join(ONNX_MODELS_DIR, model_id.replace("/", "__"))
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    backend = (backend or NLP_INFERENCE_BACKEND).lower()
+    if backend == "onnx":
+        try:
+            import optimum.onnxruntime  # noqa: F401
+        except ImportError:
+            print("⚠️ NLP_INFERENCE_BACKEND=onnx pero optimum[onnxruntime] no está instalado - usando torch")
+            return "torch"
+    return backend if backend in ("torch", "onnx") else "torch"
+
+
+def build_text_classifier(task: str, model_id: str, backend: Optional[str] = None, **pipeline_kwargs):
+    """Mismo contrato que transformers.pipeline, con backend seleccionable"""
+    # Import diferido: si el backend envía el análisis, el action server no carga transformers
+    from transformers import pipeline, AutoTokenizer
+
+    backend = resolve_backend(backend)
+
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+
+            model_dir = onnx_model_dir(model_id)
+            if not os.path.exists(os.path.join(model_dir, ONNX_QUANTIZED_FILE)):
+                raise FileNotFoundError(
+                    f"no exportado: ejecuta `python backend/inference_backend.py export {model_id}`"
+                )
+            model = ORTModelForSequenceClassification.from_pretrained(
+                model_dir,
+                file_name=ONNX_QUANTIZED_FILE
+            )
+            tokenizer = AutoTokenizer.from_pretrained(model_dir)
+            # ONNX Runtime corre en CPU: se ignora el device de PyTorch
+            pipeline_kwargs.pop("device", None)
+            return pipeline(task, model=model, tokenizer=tokenizer, **pipeline_kwargs)
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar {model_id} en ONNX, usando torch: {e}")
+
+    return pipeline(task, model=model_id, **pipeline_kwargs)
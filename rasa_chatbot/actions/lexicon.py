@@ -0,0 +1,194 @@
+# rasa_chatbot/actions/lexicon.py
+# Motor de léxicos Aho-Corasick del action server (misma implementación que
+# backend/lexicon.py). Cada léxico se compila una vez al importar y cada texto
+# se normaliza (minúsculas, sin tildes) y se recorre en una sola pasada.
+
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Set, Union
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin tildes/diéresis y espacios colapsados"""
+    text = unicodedata.normalize("NFD", (text or "").lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return _WHITESPACE.sub(" ", text)
+
+
+class LexiconMatch(NamedTuple):
+    category: str
+    keyword: str
+    weight: float
+
+
+class LexiconResult:
+    """Coincidencias de un texto, agrupables por categoría"""
+
+    def __init__(self, matches: List[LexiconMatch]):
+        self.matches = matches
+
+    def by_category(self, category: str) -> List[LexiconMatch]:
+        return [m for m in self.matches if m.category == category]
+
+    def has(self, category: str) -> bool:
+        return any(m.category == category for m in self.matches)
+
+    def count(self, category: str) -> int:
+        return len(self.by_category(category))
+
+    def weight(self, category: str) -> float:
+        return sum(m.weight for m in self.matches if m.category == category)
+
+    def categories(self) -> Set[str]:
+        return {m.category for m in self.matches}
+
+    @property
+    def total_weight(self) -> float:
+        return sum(m.weight for m in self.matches)
+
+    def __bool__(self) -> bool:
+        return bool(self.matches)
+
+    def __len__(self) -> int:
+        return len(self.matches)
+
+
+class Lexicon:
+    """
+    Autómata Aho-Corasick sobre categorías de palabras clave con peso.
+    `groups` = {categoria: {keyword: peso}} o {categoria: [keywords]} (peso 1).
+    """
+
+    def __init__(self, groups: Dict[str, Union[Dict[str, float], Iterable[str]]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[LexiconMatch]] = [[]]
+        self.size = 0
+
+        for category, keywords in groups.items():
+            items = keywords.items() if isinstance(keywords, dict) else ((k, 1.0) for k in keywords)
+            for keyword, weight in items:
+                self._add(normalize_text(keyword), LexiconMatch(category, keyword, weight))
+
+        self._build_failure_links()
+
+    def _add(self, pattern: str, match: LexiconMatch):
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(match)
+        self.size += 1
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target
+                # Hereda las salidas del sufijo más largo (p. ej. "morir" dentro de "quiero morir")
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def scan(self, text: str) -> LexiconResult:
+        """Todas las palabras clave presentes en el texto, en una sola pasada"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        seen = set()
+        matches = []
+
+        for char in normalize_text(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for match in output[node]:
+                if match not in seen:
+                    seen.add(match)
+                    matches.append(match)
+
+        return LexiconResult(matches)
+
+
+# ============================================================================
+# LÉXICOS DEL ACTION SERVER
+# ============================================================================
+
+# ActionAnalizarEmocionAvanzado: el peso es lo que suma al score de crisis
+ACCION_CRISIS_LEXICON = Lexicon({
+    "critica": {k: 3 for k in [
+        'suicidio', 'suicidarme', 'matarme', 'matar me',
+        'acabar con mi vida', 'terminar con todo',
+        'no quiero vivir', 'no quiero seguir viviendo',
+        'quiero morir', 'quiero morirme',
+        'mejor muerto', 'mejor muerta',
+        'no vale la pena vivir', 'no vale la pena seguir',
+        'quiero desaparecer',
+        'prefiero estar muerto', 'prefiero estar muerta'
+    ]},
+    "riesgo": {k: 2 for k in [
+        'morir', 'muerte', 'desaparecer', 'acabar',
+        'terminar', 'ya no puedo', 'no puedo más',
+        'no aguanto más', 'no soporto más'
+    ]},
+    "negativa": {k: 1 for k in [
+        'dolor', 'sufrimiento', 'solo', 'sola',
+        'desesperado', 'desesperada', 'sin salida',
+        'sin esperanza', 'perdido', 'perdida'
+    ]},
+})
+
+# AdvancedEmotionAnalyzer._advanced_crisis_detection
+CRISIS_AVANZADA_LEXICON = Lexicon({
+    "critica": {
+        'suicidio': 3.5, 'suicidarme': 3.5, 'matarme': 3.0,
+        'quitarme la vida': 3.5, 'acabar con mi vida': 3.5,
+        'no quiero vivir': 3.0, 'mejor muerto': 2.5
+    },
+    "grave": {
+        'no aguanto más': 2.0, 'no tiene sentido': 1.8,
+        'ya no puedo': 1.5, 'quiero desaparecer': 2.0,
+        'no hay salida': 2.0, 'todo ha terminado': 1.8
+    },
+    "desesperanza": {
+        'sin esperanza': 1.5, 'nada tiene sentido': 1.5,
+        'perdido': 1.0, 'vacío': 1.0, 'solo y abandonado': 1.5
+    },
+    "autolesion": {k: 2.5 for k in ['cortarme', 'lastimarme', 'hacerme daño', 'pegarme']},
+})
+
+# ConversationMemory: temas y menciones de crisis
+TEMAS_LEXICON = Lexicon({
+    'trabajo': ['trabajo', 'jefe', 'oficina', 'empleo', 'laboral', 'colega', 'empresa'],
+    'familia': ['familia', 'papá', 'mamá', 'padre', 'madre', 'hermano', 'hermana', 'hijo', 'hija'],
+    'pareja': ['pareja', 'novio', 'novia', 'esposo', 'esposa', 'relación', 'matrimonio'],
+    'salud': ['enfermedad', 'dolor', 'médico', 'hospital', 'salud', 'enfermo', 'síntoma'],
+    'economía': ['dinero', 'deuda', 'pagar', 'económico', 'financiero', 'plata', 'cuenta'],
+    'estudios': ['universidad', 'examen', 'estudiar', 'tarea', 'clase', 'colegio', 'carrera'],
+    'amigos': ['amigo', 'amiga', 'amistad', 'compañero'],
+    'soledad': ['solo', 'soledad', 'aislado', 'abandonado'],
+    'autoestima': ['feo', 'gordo', 'inútil', 'fracaso', 'malo', 'tonto']
+})
+
+MENCION_CRISIS_LEXICON = Lexicon({
+    "crisis": [
+        'suicid', 'suicidio', 'matarme', 'quitarme la vida',
+        'no quiero vivir', 'acabar con todo', 'mejor muerto',
+        'no vale la pena vivir', 'terminar con mi vida',
+        'hacerme daño', 'lastimarm', 'cortarme'
+    ]
+})
@@ -0,0 +1,137 @@
+# rasa_chatbot/actions/llm_streaming.py
+# Streaming de LLM del action server (misma implementación que
+# backend/llm_streaming.py): adaptadores de stream por proveedor, proveedor
+# falso con tokens predefinidos (GROQ_FAKE_STREAM=true) y métrica de
+# time-to-first-token por proveedor.
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, Optional
+
+LLM_FAKE_FIRST_TOKEN_MS = float(os.getenv("LLM_FAKE_FIRST_TOKEN_MS", "150"))
+LLM_FAKE_TOKEN_DELAY_MS = float(os.getenv("LLM_FAKE_TOKEN_DELAY_MS", "40"))
+
+FAKE_RESPONSE = (
+    "Gracias por contarme cómo te sientes 💙 Lo que describes tiene sentido. "
+    "¿Qué es lo que más te ha pesado hoy?"
+)
+
+
+# ============================================
+# ADAPTADORES DE PROVEEDOR
+# ============================================
+
+def openai_deltas(stream) -> Iterator[str]:
+    """Fragmentos de un chat.completions.create(stream=True) (OpenAI / Groq)"""
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        texto = chunk.choices[0].delta.content
+        if texto:
+            yield texto
+
+
+def anthropic_text(stream_manager) -> Iterator[str]:
+    """Fragmentos de anthropic messages.stream(...); cierra el stream al terminar"""
+    with stream_manager as stream:
+        for texto in stream.text_stream:
+            if texto:
+                yield texto
+
+
+def fake_stream(text: str = FAKE_RESPONSE,
+                first_token_ms: float = LLM_FAKE_FIRST_TOKEN_MS,
+                token_delay_ms: float = LLM_FAKE_TOKEN_DELAY_MS) -> Iterator[str]:
+    """Proveedor local: emite `text` palabra a palabra con latencias fijas"""
+    palabras = text.split(" ")
+    time.sleep(first_token_ms / 1000)
+    for i, palabra in enumerate(palabras):
+        if i:
+            time.sleep(token_delay_ms / 1000)
+        yield palabra if i == len(palabras) - 1 else palabra + " "
+
+
+# ============================================
+# MÉTRICAS
+# ============================================
+
+class StreamMetrics:
+    """TTFT y duración de los streams por proveedor (últimas muestras)"""
+
+    def __init__(self, samples: int = 500):
+        self._samples = samples
+        self._providers: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, ttft_ms: Optional[float], total_ms: float,
+               chunks: int, error: bool = False, cancelled: bool = False):
+        with self._lock:
+            p = self._providers.setdefault(provider, {
+                "streams": 0, "errors": 0, "cancelled": 0, "empty": 0, "chunks": 0,
+                "ttft_ms": deque(maxlen=self._samples),
+                "total_ms": deque(maxlen=self._samples)
+            })
+            p["streams"] += 1
+            p["chunks"] += chunks
+            if error:
+                p["errors"] += 1
+            if cancelled:
+                p["cancelled"] += 1
+            if ttft_ms is None:
+                p["empty"] += 1
+            else:
+                p["ttft_ms"].append(ttft_ms)
+            if not error and not cancelled:
+                p["total_ms"].append(total_ms)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            resultado = {}
+            for provider, p in self._providers.items():
+                ttft = sorted(p["ttft_ms"])
+                total = sorted(p["total_ms"])
+                resultado[provider] = {
+                    "streams": p["streams"],
+                    "errors": p["errors"],
+                    "cancelled": p["cancelled"],
+                    "empty": p["empty"],
+                    "chunks": p["chunks"],
+                    "ttft_ms_avg": round(sum(ttft) / len(ttft), 2) if ttft else 0,
+                    "ttft_ms_p95": round(ttft[int(len(ttft) * 0.95) - 1], 2) if ttft else 0,
+                    "total_ms_avg": round(sum(total) / len(total), 2) if total else 0,
+                    "total_ms_p95": round(total[int(len(total) * 0.95) - 1], 2) if total else 0
+                }
+            return resultado
+
+
+def timed_stream(provider: str, chunks: Iterable[str],
+                 metrics: Optional[StreamMetrics] = None) -> Iterator[str]:
+    """
+    Reemite los fragmentos midiendo el primero (TTFT) y el total.
+    Si el consumidor abandona el stream (cliente desconectado) cuenta como cancelado.
+    """
+    metrics = metrics or stream_metrics
+    inicio = time.perf_counter()
+    ttft_ms = None
+    n = 0
+    error = False
+    terminado = False
+    try:
+        for chunk in chunks:
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - inicio) * 1000
+            n += 1
+            yield chunk
+        terminado = True
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.record(provider, ttft_ms, (time.perf_counter() - inicio) * 1000, n,
+                       error=error, cancelled=not terminado and not error)
+
+
+# Instancia global
+stream_metrics = StreamMetrics()
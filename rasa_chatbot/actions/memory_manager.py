@@ -2,23 +2,68 @@
 
 from typing import List, Dict, Optional, Deque
 from datetime import datetime, timedelta
-from collections import deque, Counter
+from fractions import Fraction
+from collections import deque, OrderedDict
 import json
+import os
+import sys
+import threading
+import time
+
+from actions.lexicon import TEMAS_LEXICON, MENCION_CRISIS_LEXICON
+
+# Límites por usuario: la línea de tiempo y las crisis guardan las más recientes
+MEMORY_MAX_TIMELINE = int(os.getenv("MEMORY_MAX_TIMELINE", "200"))
+MEMORY_MAX_CRISIS_MENTIONS = int(os.getenv("MEMORY_MAX_CRISIS_MENTIONS", "50"))
+
+# Almacén global: máximo de usuarios en memoria y expiración por inactividad
+MEMORY_MAX_USERS = int(os.getenv("MEMORY_MAX_USERS", "1000"))
+MEMORY_IDLE_TTL_SECONDS = float(os.getenv("MEMORY_IDLE_TTL_SECONDS", "1800"))
+
+# Volcado opcional a MongoDB de las memorias desalojadas (vacío = desactivado)
+MEMORY_SPILL_MONGODB_URL = os.getenv("MEMORY_SPILL_MONGODB_URL", "")
+MEMORY_SPILL_DATABASE = os.getenv("MEMORY_SPILL_DATABASE", "emotional_tracking")
+MEMORY_SPILL_TTL_SECONDS = int(os.getenv("MEMORY_SPILL_TTL_SECONDS", str(7 * 86400)))
 
 class ConversationMemory:
     """
     Gestiona la memoria conversacional completa del paciente
     Mantiene contexto, emociones, temas y patrones
+    
+    Las métricas se mantienen como agregados que add_message actualiza al
+    entrar un mensaje y al salir el más antiguo de cada ventana (historial y
+    línea de tiempo), así que las lecturas no recorren el historial.
     """
     
-    def __init__(self, max_messages: int = 50):
+    def __init__(self, max_messages: int = 50,
+                 max_timeline: int = MEMORY_MAX_TIMELINE,
+                 max_crisis_mentions: int = MEMORY_MAX_CRISIS_MENTIONS):
         self.max_messages = max_messages
         self.conversation_history: Deque[Dict] = deque(maxlen=max_messages)
-        self.emotional_timeline: List[Dict] = []
+        self.emotional_timeline: Deque[Dict] = deque(maxlen=max_timeline)
         self.topics_discussed: set = set()
-        self.crisis_mentions: List[Dict] = []
+        self.crisis_mentions: Deque[Dict] = deque(maxlen=max_crisis_mentions)
         self.session_start = datetime.now()
         
+        # Agregados del historial (mensajes del paciente dentro de la ventana)
+        self._user_count = 0
+        self._bot_count = 0
+        self._word_sum = 0
+        self._question_count = 0
+        self._user_timestamps: Deque[datetime] = deque()
+        self._gap_sum_us = 0
+        self._gap_count = 0
+        
+        # Agregados de la línea de tiempo emocional
+        self._timeline_seq = 0                     # posiciones absolutas: ventana [seq - len, seq)
+        self._prefix: List[Fraction] = [Fraction(0)]  # sumas acumuladas de intensidad (exactas)
+        self._prefix_offset = 0                    # posición absoluta de _prefix[0]
+        self._max_queue: Deque = deque()           # (posición, intensidad) decreciente
+        self._min_queue: Deque = deque()           # (posición, intensidad) creciente
+        self._emotion_counts: Dict[str, int] = {}
+        self._emotion_positions: Dict[str, Deque[int]] = {}
+        self._emotion_switches = 0
+        
     def add_message(self, 
                    sender: str, 
                    text: str, 
@@ -48,11 +93,11 @@ class ConversationMemory:
             'char_count': len(text)
         }
         
-        self.conversation_history.append(message)
+        self._track_message(message)
         
         # Actualizar línea de tiempo emocional (solo mensajes del usuario)
         if emotion and sender == 'user':
-            self.emotional_timeline.append({
+            self._track_emotion({
                 'timestamp': timestamp,
                 'emotion': emotion.get('emocion', 'neutral'),
                 'intensity': emotion.get('intensidad', 5.0)
@@ -69,6 +114,112 @@ class ConversationMemory:
                 'emotion': emotion
             })
     
+    # ============================================
+    # AGREGADOS INCREMENTALES
+    # ============================================
+    
+    def _track_message(self, message: Dict):
+        """Agrega un mensaje al historial actualizando los agregados de comportamiento"""
+        history = self.conversation_history
+        if history.maxlen is not None and len(history) == history.maxlen:
+            self._untrack_oldest_message()
+        history.append(message)
+        
+        if message['sender'] == 'bot':
+            self._bot_count += 1
+        elif message['sender'] == 'user':
+            self._user_count += 1
+            self._word_sum += message['word_count']
+            self._question_count += 1 if message['has_question'] else 0
+            if self._user_timestamps:
+                self._add_gap(message['timestamp'] - self._user_timestamps[-1], 1)
+            self._user_timestamps.append(message['timestamp'])
+    
+    def _untrack_oldest_message(self):
+        oldest = self.conversation_history.popleft()
+        if oldest['sender'] == 'bot':
+            self._bot_count -= 1
+        elif oldest['sender'] == 'user':
+            self._user_count -= 1
+            self._word_sum -= oldest['word_count']
+            self._question_count -= 1 if oldest['has_question'] else 0
+            first = self._user_timestamps.popleft()
+            if self._user_timestamps:
+                self._add_gap(self._user_timestamps[0] - first, -1)
+    
+    def _add_gap(self, delta: timedelta, sign: int):
+        # En microsegundos enteros: sumar y restar no acumula error de redondeo
+        gap = delta // timedelta(microseconds=1)
+        if gap < 600 * 1_000_000:  # Solo considerar gaps menores a 10 minutos
+            self._gap_sum_us += sign * gap
+            self._gap_count += sign
+    
+    def _track_emotion(self, entry: Dict):
+        """Agrega una entrada a la línea de tiempo actualizando los agregados emocionales"""
+        timeline = self.emotional_timeline
+        if timeline.maxlen is not None and len(timeline) == timeline.maxlen:
+            self._untrack_oldest_emotion()
+        
+        position = self._timeline_seq
+        emotion, intensity = entry['emotion'], entry['intensity']
+        if timeline and timeline[-1]['emotion'] != emotion:
+            self._emotion_switches += 1
+        timeline.append(entry)
+        self._timeline_seq += 1
+        
+        self._emotion_counts[emotion] = self._emotion_counts.get(emotion, 0) + 1
+        self._emotion_positions.setdefault(emotion, deque()).append(position)
+        # Fraction: restar sumas acumuladas grandes en float perdería precisión
+        self._prefix.append(self._prefix[-1] + Fraction(intensity))
+        
+        # Colas monótonas: el frente es el máximo/mínimo de la ventana
+        # (con empates, el más antiguo, como max()/min() sobre la lista)
+        while self._max_queue and self._max_queue[-1][1] < intensity:
+            self._max_queue.pop()
+        self._max_queue.append((position, intensity))
+        while self._min_queue and self._min_queue[-1][1] > intensity:
+            self._min_queue.pop()
+        self._min_queue.append((position, intensity))
+    
+    def _untrack_oldest_emotion(self):
+        timeline = self.emotional_timeline
+        oldest = timeline.popleft()
+        position = self._timeline_seq - len(timeline) - 1
+        if timeline and timeline[0]['emotion'] != oldest['emotion']:
+            self._emotion_switches -= 1
+        
+        emotion = oldest['emotion']
+        self._emotion_counts[emotion] -= 1
+        self._emotion_positions[emotion].popleft()
+        if not self._emotion_counts[emotion]:
+            del self._emotion_counts[emotion]
+            del self._emotion_positions[emotion]
+        
+        if self._max_queue and self._max_queue[0][0] <= position:
+            self._max_queue.popleft()
+        if self._min_queue and self._min_queue[0][0] <= position:
+            self._min_queue.popleft()
+        
+        # Compactar las sumas acumuladas cuando la mitad ya quedó fuera de la ventana
+        start = position + 1 - self._prefix_offset
+        if start > 64 and start * 2 > len(self._prefix):
+            self._prefix = self._prefix[start:]
+            self._prefix_offset += start
+    
+    def _intensity_sum(self, start: int, end: int) -> Fraction:
+        """Suma de intensidades de timeline[start:end] (índices relativos a la ventana)"""
+        window_start = self._timeline_seq - len(self.emotional_timeline) - self._prefix_offset
+        return self._prefix[window_start + end] - self._prefix[window_start + start]
+    
+    def _dominant_emotion(self) -> str:
+        # Más frecuente; con empate, la que aparece primero en la ventana (como Counter)
+        if not self._emotion_counts:
+            return 'neutral'
+        return max(
+            self._emotion_counts,
+            key=lambda e: (self._emotion_counts[e], -self._emotion_positions[e][0])
+        )
+    
     def get_conversation_context(self, last_n: int = 10) -> str:
         """
         Obtiene el contexto conversacional formateado de los últimos N mensajes
@@ -105,47 +256,40 @@ class ConversationMemory:
                 'timeline': []
             }
         
-        emotions = [e['emotion'] for e in self.emotional_timeline]
-        intensities = [e['intensity'] for e in self.emotional_timeline]
-        
-        # Calcular tendencia emocional
-        trend = self._calculate_emotional_trend(intensities)
-        
-        # Emoción dominante
-        emotion_counts = Counter(emotions)
-        dominant_emotion = emotion_counts.most_common(1)[0][0] if emotion_counts else 'neutral'
-        
-        # Número de cambios emocionales
-        emotion_switches = sum(1 for i in range(1, len(emotions)) if emotions[i] != emotions[i-1])
+        count = len(self.emotional_timeline)
         
         return {
-            'trend': trend,
-            'dominant_emotion': dominant_emotion,
-            'recent_intensity': intensities[-1] if intensities else 5.0,
-            'average_intensity': sum(intensities) / len(intensities) if intensities else 5.0,
-            'max_intensity': max(intensities) if intensities else 5.0,
-            'min_intensity': min(intensities) if intensities else 5.0,
-            'emotion_switches': emotion_switches,
-            'timeline': self.emotional_timeline[-10:]  # Últimas 10 emociones
+            'trend': self._calculate_emotional_trend(),
+            'dominant_emotion': self._dominant_emotion(),
+            'recent_intensity': self.emotional_timeline[-1]['intensity'],
+            'average_intensity': float(self._intensity_sum(0, count) / count),
+            'max_intensity': self._max_queue[0][1],
+            'min_intensity': self._min_queue[0][1],
+            'emotion_switches': self._emotion_switches,
+            'timeline': [self.emotional_timeline[i] for i in range(max(0, count - 10), count)]  # Últimas 10 emociones
         }
     
-    def _calculate_emotional_trend(self, intensities: List[float]) -> str:
+    def _calculate_emotional_trend(self) -> str:
         """
-        Calcula la tendencia emocional basándose en las intensidades
+        Calcula la tendencia emocional basándose en las intensidades de la ventana
         
-        Args:
-            intensities: lista de intensidades emocionales
+        Las medias de cada mitad salen de sumas exactas (Fraction) y se pasan a
+        float antes de restarlas. La versión que sumaba floats en orden podía
+        quedar a ~1e-15 de ±1.0 cuando la diferencia real es exactamente 1.0;
+        en ese caso ahora se devuelve 'estable' donde antes salía 'empeorando'
+        o 'mejorando' (p. ej. [5.1, 9.1, 1.9, 2.8, 9.7, 6.6]).
             
         Returns:
             'mejorando', 'empeorando' o 'estable'
         """
-        if len(intensities) < 3:
+        count = len(self.emotional_timeline)
+        if count < 3:
             return 'insuficiente_data'
         
         # Comparar primera mitad vs segunda mitad
-        mid_point = len(intensities) // 2
-        first_half_avg = sum(intensities[:mid_point]) / mid_point
-        second_half_avg = sum(intensities[mid_point:]) / (len(intensities) - mid_point)
+        mid_point = count // 2
+        first_half_avg = float(self._intensity_sum(0, mid_point) / mid_point)
+        second_half_avg = float(self._intensity_sum(mid_point, count) / (count - mid_point))
         
         diff = second_half_avg - first_half_avg
         
@@ -163,22 +307,7 @@ class ConversationMemory:
         Args:
             text: mensaje a analizar
         """
-        topics_keywords = {
-            'trabajo': ['trabajo', 'jefe', 'oficina', 'empleo', 'laboral', 'colega', 'empresa'],
-            'familia': ['familia', 'papá', 'mamá', 'padre', 'madre', 'hermano', 'hermana', 'hijo', 'hija'],
-            'pareja': ['pareja', 'novio', 'novia', 'esposo', 'esposa', 'relación', 'matrimonio'],
-            'salud': ['enfermedad', 'dolor', 'médico', 'hospital', 'salud', 'enfermo', 'síntoma'],
-            'economía': ['dinero', 'deuda', 'pagar', 'económico', 'financiero', 'plata', 'cuenta'],
-            'estudios': ['universidad', 'examen', 'estudiar', 'tarea', 'clase', 'colegio', 'carrera'],
-            'amigos': ['amigo', 'amiga', 'amistad', 'compañero'],
-            'soledad': ['solo', 'soledad', 'aislado', 'abandonado'],
-            'autoestima': ['feo', 'gordo', 'inútil', 'fracaso', 'malo', 'tonto']
-        }
-        
-        text_lower = text.lower()
-        for topic, keywords in topics_keywords.items():
-            if any(keyword in text_lower for keyword in keywords):
-                self.topics_discussed.add(topic)
+        self.topics_discussed.update(TEMAS_LEXICON.scan(text).categories())
     
     def _is_crisis_mention(self, text: str) -> bool:
         """
@@ -190,15 +319,7 @@ class ConversationMemory:
         Returns:
             True si detecta crisis, False caso contrario
         """
-        crisis_keywords = [
-            'suicid', 'suicidio', 'matarme', 'quitarme la vida',
-            'no quiero vivir', 'acabar con todo', 'mejor muerto',
-            'no vale la pena vivir', 'terminar con mi vida',
-            'hacerme daño', 'lastimarm', 'cortarme'
-        ]
-        
-        text_lower = text.lower()
-        return any(keyword in text_lower for keyword in crisis_keywords)
+        return MENCION_CRISIS_LEXICON.scan(text).has('crisis')
     
     def get_behavioral_patterns(self) -> Dict:
         """
@@ -215,26 +336,17 @@ class ConversationMemory:
                 'question_frequency': 'normal'
             }
         
-        user_messages = [m for m in self.conversation_history if m['sender'] == 'user']
-        
-        if not user_messages:
+        if not self._user_count:
             return {}
         
         # Longitud promedio de mensajes
-        avg_word_count = sum(m['word_count'] for m in user_messages) / len(user_messages)
+        avg_word_count = self._word_sum / self._user_count
         
         # Frecuencia de preguntas
-        questions_count = sum(1 for m in user_messages if m['has_question'])
-        question_rate = questions_count / len(user_messages)
-        
-        # Calcular tiempo entre mensajes (si hay suficientes)
-        time_gaps = []
-        for i in range(1, len(user_messages)):
-            gap = (user_messages[i]['timestamp'] - user_messages[i-1]['timestamp']).total_seconds()
-            if gap < 600:  # Solo considerar gaps menores a 10 minutos
-                time_gaps.append(gap)
+        question_rate = self._question_count / self._user_count
         
-        avg_gap = sum(time_gaps) / len(time_gaps) if time_gaps else 60
+        # Tiempo entre mensajes consecutivos del paciente (gaps menores a 10 minutos)
+        avg_gap = self._gap_sum_us / self._gap_count / 1_000_000 if self._gap_count else 60
         
         return {
             'engagement_level': 'alto' if avg_word_count > 15 else 'medio' if avg_word_count > 8 else 'bajo',
@@ -242,7 +354,7 @@ class ConversationMemory:
             'response_speed': 'rápido' if avg_gap < 20 else 'pausado' if avg_gap > 60 else 'normal',
             'question_frequency': 'alto' if question_rate > 0.4 else 'medio' if question_rate > 0.2 else 'bajo',
             'avg_message_length': round(avg_word_count, 1),
-            'total_user_messages': len(user_messages)
+            'total_user_messages': self._user_count
         }
     
     def should_summarize(self) -> bool:
@@ -301,22 +413,262 @@ class ConversationMemory:
         """
         return {
             'total_messages': len(self.conversation_history),
-            'user_messages': len([m for m in self.conversation_history if m['sender'] == 'user']),
-            'bot_messages': len([m for m in self.conversation_history if m['sender'] == 'bot']),
+            'user_messages': self._user_count,
+            'bot_messages': self._bot_count,
             'emotional_trajectory': self.get_emotional_trajectory(),
             'behavioral_patterns': self.get_behavioral_patterns(),
             'topics_discussed': list(self.topics_discussed),
             'crisis_mentions_count': len(self.crisis_mentions),
             'session_duration_minutes': int((datetime.now() - self.session_start).total_seconds() / 60)
         }
+    
+    def to_dict(self) -> Dict:
+        """
+        Estado serializable (documento de MongoDB) para volcar la memoria
+        
+        Returns:
+            Dict con historial, línea de tiempo, temas y crisis
+        """
+        return {
+            'max_messages': self.max_messages,
+            'max_timeline': self.emotional_timeline.maxlen,
+            'max_crisis_mentions': self.crisis_mentions.maxlen,
+            'conversation_history': list(self.conversation_history),
+            'emotional_timeline': list(self.emotional_timeline),
+            'topics_discussed': sorted(self.topics_discussed),
+            'crisis_mentions': list(self.crisis_mentions),
+            'session_start': self.session_start
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ConversationMemory':
+        """
+        Reconstruye una memoria volcada con to_dict
+        
+        Args:
+            data: documento guardado
+            
+        Returns:
+            Instancia de ConversationMemory con el mismo estado
+        """
+        memory = cls(max_messages=data.get('max_messages', 50),
+                     max_timeline=data.get('max_timeline', MEMORY_MAX_TIMELINE),
+                     max_crisis_mentions=data.get('max_crisis_mentions', MEMORY_MAX_CRISIS_MENTIONS))
+        for message in data.get('conversation_history', []):
+            memory._track_message(message)
+        for entry in data.get('emotional_timeline', []):
+            memory._track_emotion(entry)
+        memory.topics_discussed.update(data.get('topics_discussed', []))
+        for mention in data.get('crisis_mentions', []):
+            memory.crisis_mentions.append(mention)
+        memory.session_start = data.get('session_start') or memory.session_start
+        return memory
+    
+    def approx_bytes(self) -> int:
+        """Tamaño aproximado en memoria (sys.getsizeof recursivo)"""
+        return _approx_size(self.to_dict())
+
+
+def _approx_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_approx_size(k) + _approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, deque)):
+        size += sum(_approx_size(item) for item in obj)
+    return size
+
+
+# ============================================
+# VOLCADO A MONGODB (OPCIONAL)
+# ============================================
+
+class MongoMemorySpill:
+    """
+    Guarda en MongoDB las memorias desalojadas y las devuelve cuando el
+    usuario vuelve. Un índice TTL borra las que nadie reclama.
+    """
+    
+    COLLECTION = "rasa_conversation_memories"
+    
+    def __init__(self, url: str, database: str, ttl_seconds: int = MEMORY_SPILL_TTL_SECONDS):
+        from pymongo import MongoClient
+        
+        self.collection = MongoClient(url, serverSelectionTimeoutMS=2000)[database][self.COLLECTION]
+        try:
+            self.collection.create_index("spilled_at", expireAfterSeconds=ttl_seconds)
+        except Exception as e:
+            print(f"⚠️ No se pudo crear el índice TTL de {self.COLLECTION}: {e}")
+    
+    def save(self, user_id: str, memory: ConversationMemory):
+        self.collection.replace_one(
+            {'_id': user_id},
+            {**memory.to_dict(), 'spilled_at': datetime.utcnow()},
+            upsert=True
+        )
+    
+    def load(self, user_id: str) -> Optional[ConversationMemory]:
+        # Se borra al leer: a partir de aquí la copia buena es la de memoria
+        data = self.collection.find_one_and_delete({'_id': user_id})
+        return ConversationMemory.from_dict(data) if data else None
+    
+    def delete(self, user_id: str):
+        self.collection.delete_one({'_id': user_id})
+
+
+def _build_spill() -> Optional[MongoMemorySpill]:
+    if not MEMORY_SPILL_MONGODB_URL:
+        return None
+    try:
+        spill = MongoMemorySpill(MEMORY_SPILL_MONGODB_URL, MEMORY_SPILL_DATABASE)
+        print(f"✅ Volcado de memorias a MongoDB ({MEMORY_SPILL_DATABASE}.{MongoMemorySpill.COLLECTION})")
+        return spill
+    except ImportError:
+        print("⚠️ MEMORY_SPILL_MONGODB_URL definido pero pymongo no está instalado; sin volcado")
+        return None
 
 
 # ============================================
 # GESTIÓN GLOBAL DE MEMORIA POR USUARIO
 # ============================================
 
-# Diccionario global para almacenar memorias de usuarios
-_user_memories: Dict[str, ConversationMemory] = {}
+class MemoryStore:
+    """
+    Memorias por usuario con límite de usuarios: LRU + expiración por inactividad.
+    Las desalojadas se vuelcan al spill (si hay) y se recuperan al volver el usuario.
+    """
+    
+    def __init__(self, max_users: int = MEMORY_MAX_USERS,
+                 idle_ttl_seconds: float = MEMORY_IDLE_TTL_SECONDS,
+                 spill: Optional[MongoMemorySpill] = None):
+        self.max_users = max_users
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.spill = spill
+        # user_id -> (memoria, último acceso); el orden es el de acceso
+        self._memories: "OrderedDict[str, List]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.created = 0
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.spilled = 0
+        self.rehydrated = 0
+        self.spill_errors = 0
+    
+    def get(self, user_id: str) -> ConversationMemory:
+        """Obtiene la memoria del usuario (de memoria, del spill o nueva)"""
+        with self._lock:
+            desalojadas = self._evict_idle()
+            entry = self._memories.get(user_id)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                self._memories.move_to_end(user_id)
+
+        self._spill_all(desalojadas)
+        if entry is not None:
+            return entry[0]
+        
+        # Fuera del lock: la lectura del spill es una ida y vuelta a MongoDB
+        memory = self._rehydrate(user_id)
+        with self._lock:
+            actual = self._memories.get(user_id)
+            if actual is not None:
+                # Otro hilo la creó mientras tanto
+                actual[1] = time.monotonic()
+                self._memories.move_to_end(user_id)
+                return actual[0]
+            if memory is None:
+                memory = ConversationMemory(max_messages=50)
+                self.created += 1
+                print(f"✅ Nueva memoria creada para usuario: {user_id}")
+            self._memories[user_id] = [memory, time.monotonic()]
+            desalojadas = self._evict_lru()
+        
+        self._spill_all(desalojadas)
+        return memory
+    
+    def _evict_idle(self) -> List:
+        """Las inactivas están al principio del OrderedDict (orden de acceso)"""
+        desalojadas = []
+        limite = time.monotonic() - self.idle_ttl_seconds
+        while self._memories:
+            user_id, (memory, last_access) = next(iter(self._memories.items()))
+            if last_access > limite:
+                break
+            del self._memories[user_id]
+            self.evicted_idle += 1
+            desalojadas.append((user_id, memory))
+        return desalojadas
+    
+    def _evict_lru(self) -> List:
+        desalojadas = []
+        while len(self._memories) > self.max_users:
+            user_id, (memory, _) = self._memories.popitem(last=False)
+            self.evicted_lru += 1
+            desalojadas.append((user_id, memory))
+        return desalojadas
+    
+    def _spill_all(self, desalojadas: List):
+        if not self.spill:
+            return
+        for user_id, memory in desalojadas:
+            try:
+                self.spill.save(user_id, memory)
+                self.spilled += 1
+            except Exception as e:
+                self.spill_errors += 1
+                print(f"⚠️ No se pudo volcar la memoria de {user_id}: {e}")
+    
+    def _rehydrate(self, user_id: str) -> Optional[ConversationMemory]:
+        if not self.spill:
+            return None
+        try:
+            memory = self.spill.load(user_id)
+        except Exception as e:
+            self.spill_errors += 1
+            print(f"⚠️ No se pudo recuperar la memoria de {user_id}: {e}")
+            return None
+        if memory is not None:
+            self.rehydrated += 1
+            print(f"♻️ Memoria recuperada para usuario: {user_id}")
+        return memory
+    
+    def clear(self, user_id: str) -> bool:
+        with self._lock:
+            existia = self._memories.pop(user_id, None) is not None
+        if self.spill:
+            try:
+                self.spill.delete(user_id)
+            except Exception as e:
+                self.spill_errors += 1
+                print(f"⚠️ No se pudo borrar la memoria volcada de {user_id}: {e}")
+        return existia
+    
+    def active_users(self) -> List[str]:
+        with self._lock:
+            return list(self._memories.keys())
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            memorias = [memory for memory, _ in self._memories.values()]
+            stats = {
+                'active_users': len(memorias),
+                'max_users': self.max_users,
+                'idle_ttl_seconds': self.idle_ttl_seconds,
+                'created': self.created,
+                'evicted_lru': self.evicted_lru,
+                'evicted_idle': self.evicted_idle,
+                'spill_enabled': self.spill is not None,
+                'spilled': self.spilled,
+                'rehydrated': self.rehydrated,
+                'spill_errors': self.spill_errors
+            }
+        # Recorre todas las memorias: pensado para diagnóstico, no para cada turno
+        stats['approx_bytes'] = sum(memory.approx_bytes() for memory in memorias)
+        return stats
+
+
+# Instancia global
+memory_store = MemoryStore(spill=_build_spill())
 
 def get_user_memory(user_id: str) -> ConversationMemory:
     """
@@ -328,15 +680,11 @@ def get_user_memory(user_id: str) -> ConversationMemory:
     Returns:
         Instancia de ConversationMemory para ese usuario
     """
-    if user_id not in _user_memories:
-        _user_memories[user_id] = ConversationMemory(max_messages=50)
-        print(f"✅ Nueva memoria creada para usuario: {user_id}")
-    
-    return _user_memories[user_id]
+    return memory_store.get(user_id)
 
 def clear_user_memory(user_id: str) -> bool:
     """
-    Limpia la memoria de un usuario específico
+    Limpia la memoria de un usuario específico (también la volcada en MongoDB)
     
     Args:
         user_id: identificador del usuario
@@ -344,8 +692,7 @@ def clear_user_memory(user_id: str) -> bool:
     Returns:
         True si se limpió, False si no existía
     """
-    if user_id in _user_memories:
-        del _user_memories[user_id]
+    if memory_store.clear(user_id):
         print(f"🗑️ Memoria limpiada para usuario: {user_id}")
         return True
     return False
@@ -357,4 +704,15 @@ def get_all_active_users() -> List[str]:
     Returns:
         Lista de user_ids
     """
-    return list(_user_memories.keys())
\ No newline at end of file
+    return memory_store.active_users()
+
+def get_memory_stats() -> Dict:
+    """
+    Estadísticas del almacén: usuarios activos, desalojos, volcados y bytes aproximados
+    
+    Returns:
+        Dict con las métricas de memory_store
+    """
+    return memory_store.stats()
+
+
@@ -0,0 +1,85 @@
+# rasa_chatbot/actions/model_registry.py
+# Registro de modelos del action server: actions.py y advanced_emotion_analyzer.py
+# comparten la misma instancia de BETO en lugar de cargarla dos veces
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from actions.inference_backend import build_text_classifier, resolve_backend
+
+
+def default_device() -> int:
+    """GPU 0 si hay CUDA, si no CPU (-1); igual para todos los llamadores"""
+    try:
+        import torch
+        return 0 if torch.cuda.is_available() else -1
+    except ImportError:
+        return -1
+
+
+def _rss_bytes() -> int:
+    """RSS actual del proceso (Linux); 0 si no está disponible"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class SharedPipeline:
+    """Pipeline compartido; cada llamada toma el lock del modelo"""
+
+    def __init__(self, pipe, key: Tuple):
+        self._pipe = pipe
+        self._lock = threading.Lock()
+        self.key = key
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._pipe(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._pipe, name)
+
+
+class ModelRegistry:
+    """Instancias compartidas por (modelo, tarea, dispositivo)"""
+
+    def __init__(self):
+        self._pipelines: Dict[Tuple, SharedPipeline] = {}
+        self._info: Dict[Tuple, Dict] = {}
+        self._lock = threading.Lock()
+
+    def get_pipeline(self, task: str, model_id: str, device: Optional[int] = None,
+                     backend: Optional[str] = None, **pipeline_kwargs) -> SharedPipeline:
+        device = default_device() if device is None else device
+        backend = resolve_backend(backend)
+        key = (model_id, task, device, backend, tuple(sorted(pipeline_kwargs.items())))
+
+        with self._lock:
+            if key not in self._pipelines:
+                rss_before = _rss_bytes()
+                started_at = time.monotonic()
+                pipe = build_text_classifier(task, model_id, backend=backend, device=device, **pipeline_kwargs)
+                self._pipelines[key] = SharedPipeline(pipe, key)
+                self._info[key] = {
+                    "model_id": model_id,
+                    "task": task,
+                    "device": device,
+                    "backend": backend,
+                    "load_seconds": round(time.monotonic() - started_at, 2),
+                    "rss_delta_mb": round((_rss_bytes() - rss_before) / 1024 ** 2, 1)
+                }
+            return self._pipelines[key]
+
+    def memory_report(self) -> Dict:
+        return {
+            "process_rss_mb": round(_rss_bytes() / 1024 ** 2, 1),
+            "models": list(self._info.values())
+        }
+
+
+# Instancia global del registro
+model_registry = ModelRegistry()
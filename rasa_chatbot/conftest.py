@@ -0,0 +1,8 @@
+# rasa_chatbot/conftest.py
+# Raíz de pytest para el action server: deja `actions` importable desde tests/
+# aunque pytest se lance desde la raíz del repositorio
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
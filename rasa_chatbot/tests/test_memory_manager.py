@@ -0,0 +1,215 @@
+# rasa_chatbot/tests/test_memory_manager.py
+# ✅ PROPIEDADES DE ConversationMemory
+# Los agregados incrementales deben dar lo mismo que la implementación
+# anterior, que recorría el historial y la línea de tiempo en cada lectura.
+# Esa implementación se conserva aquí como oráculo de referencia.
+#
+# Uso:
+#   cd rasa_chatbot
+#   python -m pytest tests/test_memory_manager.py -q
+
+import math
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from fractions import Fraction
+from typing import Dict, List
+
+import pytest
+
+from actions.memory_manager import ConversationMemory
+
+EMOCIONES = ["tristeza", "alegria", "miedo", "enojo", "neutral"]
+
+
+# ============================================
+# ORÁCULO: IMPLEMENTACIÓN ANTERIOR (recorre las listas)
+# ============================================
+
+def trend_referencia(intensities: List[float]) -> str:
+    if len(intensities) < 3:
+        return 'insuficiente_data'
+    mid_point = len(intensities) // 2
+    first_half_avg = sum(intensities[:mid_point]) / mid_point
+    second_half_avg = sum(intensities[mid_point:]) / (len(intensities) - mid_point)
+    diff = second_half_avg - first_half_avg
+    if diff > 1.0:
+        return 'empeorando'
+    elif diff < -1.0:
+        return 'mejorando'
+    return 'estable'
+
+
+def trend_exacta(intensities: List[float]) -> str:
+    """Misma regla con aritmética exacta (lo que hace la versión incremental)"""
+    mid_point = len(intensities) // 2
+    first = float(sum(Fraction(i) for i in intensities[:mid_point]) / mid_point)
+    second = float(sum(Fraction(i) for i in intensities[mid_point:]) / (len(intensities) - mid_point))
+    diff = second - first
+    return 'empeorando' if diff > 1.0 else 'mejorando' if diff < -1.0 else 'estable'
+
+
+def trajectory_referencia(timeline: List[Dict]) -> Dict:
+    if not timeline:
+        return {
+            'trend': 'neutral',
+            'dominant_emotion': 'neutral',
+            'recent_intensity': 5.0,
+            'average_intensity': 5.0,
+            'emotion_switches': 0,
+            'timeline': []
+        }
+    emotions = [e['emotion'] for e in timeline]
+    intensities = [e['intensity'] for e in timeline]
+    return {
+        'trend': trend_referencia(intensities),
+        'dominant_emotion': Counter(emotions).most_common(1)[0][0],
+        'recent_intensity': intensities[-1],
+        'average_intensity': sum(intensities) / len(intensities),
+        'max_intensity': max(intensities),
+        'min_intensity': min(intensities),
+        'emotion_switches': sum(1 for i in range(1, len(emotions)) if emotions[i] != emotions[i - 1]),
+        'timeline': timeline[-10:]
+    }
+
+
+def patterns_referencia(history: List[Dict]) -> Dict:
+    if len(history) < 5:
+        return {
+            'engagement_level': 'bajo',
+            'verbosity': 'normal',
+            'response_speed': 'normal',
+            'question_frequency': 'normal'
+        }
+    user_messages = [m for m in history if m['sender'] == 'user']
+    if not user_messages:
+        return {}
+    avg_word_count = sum(m['word_count'] for m in user_messages) / len(user_messages)
+    question_rate = sum(1 for m in user_messages if m['has_question']) / len(user_messages)
+    time_gaps = []
+    for i in range(1, len(user_messages)):
+        gap = (user_messages[i]['timestamp'] - user_messages[i - 1]['timestamp']).total_seconds()
+        if gap < 600:
+            time_gaps.append(gap)
+    avg_gap = sum(time_gaps) / len(time_gaps) if time_gaps else 60
+    return {
+        'engagement_level': 'alto' if avg_word_count > 15 else 'medio' if avg_word_count > 8 else 'bajo',
+        'verbosity': 'alto' if avg_word_count > 20 else 'medio' if avg_word_count > 10 else 'bajo',
+        'response_speed': 'rápido' if avg_gap < 20 else 'pausado' if avg_gap > 60 else 'normal',
+        'question_frequency': 'alto' if question_rate > 0.4 else 'medio' if question_rate > 0.2 else 'bajo',
+        'avg_message_length': round(avg_word_count, 1),
+        'total_user_messages': len(user_messages)
+    }
+
+
+# ============================================
+# UTILIDADES
+# ============================================
+
+def cerca(a, b) -> bool:
+    """Igualdad estructural; los float se comparan con tolerancia"""
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(cerca(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(cerca(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+
+def conversacion_aleatoria(seed: int):
+    """Genera (memoria, mensajes) con ventanas pequeñas para forzar desalojos"""
+    r = random.Random(seed)
+    memoria = ConversationMemory(max_messages=r.choice([5, 10, 50]),
+                                 max_timeline=r.choice([3, 7, 20, 200]))
+    emociones = r.sample(EMOCIONES, r.randint(1, len(EMOCIONES)))
+    ts = datetime(2024, 1, 1)
+    mensajes = []
+    for _ in range(r.randint(0, 300)):
+        ts += timedelta(seconds=r.choice([1, 5, 30, 90, 700, r.uniform(0, 900)]))
+        sender = r.choice(["user", "user", "bot"])
+        text = " ".join("palabra" for _ in range(r.randint(1, 30)))
+        if r.random() < 0.3:
+            text += " ?"
+        emotion = None
+        if r.random() < 0.8:
+            intensidad = r.randint(1, 10) if r.random() < 0.5 else round(r.uniform(0, 10), 2)
+            emotion = {"emocion": r.choice(emociones), "intensidad": intensidad}
+        mensajes.append((sender, text, emotion, ts))
+    return memoria, mensajes
+
+
+def comprobar(memoria: ConversationMemory):
+    timeline = list(memoria.emotional_timeline)
+    esperado = trajectory_referencia(timeline)
+    obtenido = memoria.get_emotional_trajectory()
+
+    # La tendencia se calcula con sumas exactas: solo puede diferir de la
+    # referencia en float cuando la diferencia de medias cae justo en ±1.0
+    intensidades = [e['intensity'] for e in timeline]
+    if len(intensidades) >= 3 and obtenido['trend'] != esperado['trend']:
+        assert obtenido['trend'] == trend_exacta(intensidades)
+        esperado['trend'] = obtenido['trend']
+
+    assert cerca(obtenido, esperado)
+    assert cerca(memoria.get_behavioral_patterns(), patterns_referencia(list(memoria.conversation_history)))
+
+    stats = memoria.get_stats()
+    historial = list(memoria.conversation_history)
+    assert stats['user_messages'] == sum(1 for m in historial if m['sender'] == 'user')
+    assert stats['bot_messages'] == sum(1 for m in historial if m['sender'] == 'bot')
+    assert stats['total_messages'] == len(historial)
+
+
+# ============================================
+# PROPIEDADES
+# ============================================
+
+@pytest.mark.parametrize("seed", range(60))
+def test_agregados_coinciden_con_referencia(seed):
+    memoria, mensajes = conversacion_aleatoria(seed)
+    r = random.Random(-seed)
+    for i, (sender, text, emotion, ts) in enumerate(mensajes):
+        memoria.add_message(sender, text, emotion, ts)
+        if r.random() < 0.2 or i == len(mensajes) - 1:
+            comprobar(memoria)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_to_dict_from_dict_conserva_agregados(seed):
+    memoria, mensajes = conversacion_aleatoria(seed)
+    for mensaje in mensajes:
+        memoria.add_message(*mensaje)
+
+    restaurada = ConversationMemory.from_dict(memoria.to_dict())
+    assert cerca(restaurada.get_emotional_trajectory(), memoria.get_emotional_trajectory())
+    assert cerca(restaurada.get_behavioral_patterns(), memoria.get_behavioral_patterns())
+
+    # La memoria restaurada sigue actualizándose igual que la original
+    extra = datetime(2030, 1, 1)
+    for i in range(12):
+        for m in (memoria, restaurada):
+            m.add_message("user", "sigo aquí ?", {"emocion": "miedo", "intensidad": 7 + i % 3},
+                          extra + timedelta(seconds=10 * i))
+    comprobar(restaurada)
+    assert cerca(restaurada.get_emotional_trajectory(), memoria.get_emotional_trajectory())
+
+
+def test_tendencia_en_el_limite_usa_aritmetica_exacta():
+    # Las medias difieren exactamente en 1.0 ('estable'); sumando en float, la
+    # implementación anterior obtenía 1.0000000000000009 y devolvía 'empeorando'
+    intensidades = [5.1, 9.1, 1.9, 2.8, 9.7, 6.6]
+    assert trend_referencia(intensidades) == 'empeorando'
+
+    memoria = ConversationMemory()
+    ts = datetime(2024, 1, 1)
+    for i, intensidad in enumerate(intensidades):
+        memoria.add_message("user", "hola", {"emocion": "neutral", "intensidad": intensidad},
+                            ts + timedelta(seconds=i))
+    assert memoria.get_emotional_trajectory()['trend'] == 'estable'
+
+
+def test_memoria_vacia():
+    memoria = ConversationMemory()
+    assert memoria.get_emotional_trajectory() == trajectory_referencia([])
+    assert memoria.get_behavioral_patterns() == patterns_referencia([])